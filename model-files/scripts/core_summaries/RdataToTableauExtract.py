@@ -40,6 +40,20 @@ import os
 import sys
 from datetime import datetime
 
+# the shared, vectorized dbf reader, dbfTable.py, is in utilities\PBA40\metrics in the repository and in
+# CTRAMP\scripts\metrics in the model run directory; without it, read_dbf() falls back to simpledbf
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+for metrics_dir in [os.path.join(SCRIPT_DIR, "..", "..", "..", "utilities", "PBA40", "metrics"),
+                    os.path.join(SCRIPT_DIR, "..", "metrics")]:
+    metrics_dir = os.path.abspath(metrics_dir)
+    if os.path.isfile(os.path.join(metrics_dir, "dbfTable.py")):
+        if metrics_dir not in sys.path: sys.path.append(metrics_dir)
+        break
+try:
+    import dbfTable
+except ImportError:
+    dbfTable = None
+
 # create a dict for the field maps
 # Define type maps
 # Caveat: I am not including all of the possibilities here
@@ -111,12 +125,8 @@ def read_dbf(dbf_fullpath):
     """
     Returns the pandas DataFrame
     """
-    # import pysal
-    # dbfin = pysal.open(dbf_fullpath)
-    # vars = dbfin.header
-    # data = dict([(var, dbfin.by_col(var)) for var in vars])
+    if dbfTable: return dbfTable.read_dbf(dbf_fullpath)
 
-    # table_df = pandas.DataFrame(data)
     import simpledbf
     dbf = simpledbf.Dbf5(dbf_fullpath)
     table_df = dbf.to_dataframe()
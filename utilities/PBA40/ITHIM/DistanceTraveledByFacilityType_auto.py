@@ -2,94 +2,107 @@ USAGE = """
 
   Calculates auto and truck personal and vehicle distances traveled by facility type.
 
-  * Reads hwy\iter%ITER%\avgload5period_vehclasses.csv
+  * Reads hwy\\iter%ITER%\\avgload5period_vehclasses.csv
   * Summarizes VMT by mode (auto_VMT, sm_med_truck_VMT, heavy_truck_VMT)
   * Summarizes PMT by mode (auto (driver) PMT, auto (passenger) PMT, truck_driver_PMT)
   * Summarizes PHT by mode (auto (driver) PMT, auto (passenger) PMT, truck_driver_PMT)
-  * Outputs metrics\ITHIM\DistanceTraveledByFacilityType_auto+truck.csv
+  * Outputs metrics\\ITHIM\\DistanceTraveledByFacilityType_auto+truck.csv
+    with the proportion of vehicle miles by mode (car, truck) and facility type
+  * Outputs metrics\\ITHIM\\DistanceTraveledByFacilityType_auto+truck_detail.csv
+    with the VMT, PMT and PHT above by facility type
 
 """
 import os, sys
 import numpy, pandas
 
+# shared network readers live with the metrics scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "metrics"))
+from LoadedNetwork import LoadedNetwork
+
+# transform FT to ITHIM FT
+# From M:\Application\ITHIM\2014.06.24_ITHIM_IntegrationManual_MTC.pdf
+FT_MAPPING = {
+    1: "freeway",   # Freeway-to-freeway connector
+    2: "freeway",   # Freeway
+    3: "freeway",   # Expressway
+    4: "arterial",  # Collector
+    5: "freeway",   # Freeway ramp
+    6: "local",     # Dummy link
+    7: "arterial",  # Major arterial
+    8: "freeway",   # Managed freeway
+    9: "unknown"    # Special facility
+}
+
+# persons per vehicle by auto vehicle class, as HwyAssign.job converts person trips to vehicle trips
+# (sr2 / 2, sr3 / 3.25); one of them is the driver
+OCCUPANCY  = {'da':1.0, 's2':2.0, 's3':3.25}
+PASSENGERS = dict([(vehclass, occupancy-1.0) for (vehclass, occupancy) in OCCUPANCY.items()])
+
+# mode => vehicle classes (without the toll suffix)
+VMT_MODES = [('auto',         ['da','s2','s3']),
+             ('sm_med_truck', ['sm']),
+             ('heavy_truck',  ['hv'])]
+
 if __name__ == '__main__':
     pandas.set_option('display.width', 500)
     iteration       = int(os.environ['ITER'])
-    TIMEPERIODS     = ['EA','AM','MD','PM','EV']
-    VEHCLASSES      = ['da','s2','s3','sm','hv']
 
     # read the network with volumes
-    loaded_net_df = pandas.read_table(os.path.join("hwy", "iter%d" % iteration, "avgload5period_vehclasses.csv"), sep=",")
-
-    # we only need a subset of columns
-    cols_to_keep = ['a','b','distance','ft']
-    for timeperiod in TIMEPERIODS:
-        cols_to_keep.append("ctim%s" % timeperiod)
-        for vehclass in VEHCLASSES:
-            cols_to_keep.append("vol%s_%s"  % (timeperiod, vehclass))
-            cols_to_keep.append("vol%s_%st" % (timeperiod, vehclass)) # toll
-    loaded_net_df = loaded_net_df[cols_to_keep]
+    network = LoadedNetwork.read(os.path.join("hwy", "iter%d" % iteration, "avgload5period_vehclasses.csv"),
+                                 link_attributes=['distance','ft'])
 
+    # vehicle miles and hours by [link, timeperiod, vehclass] summed by ft => [ft, vehclass]
     # filter out FT=10 since those are toll plazas and not real links
-    loaded_net_df = loaded_net_df.loc[loaded_net_df.ft != 10,]
-
-    # transform FT to ITHIM FT
-    # From M:\Application\ITHIM\2014.06.24_ITHIM_IntegrationManual_MTC.pdf
-    ft_mapping = {
-        1: "freeway",   # Freeway-to-freeway connector
-        2: "freeway",   # Freeway
-        3: "freeway",   # Expressway
-        4: "arterial",  # Collector
-        5: "freeway",   # Freeway ramp
-        6: "local",     # Dummy link
-        7: "arterial",  # Major arterial
-        8: "freeway",   # Managed freeway
-        9: "unknown"    # Special facility
-    }
-    loaded_net_df["ITHIM_ft"] = loaded_net_df["ft"]
-    loaded_net_df.replace({"ITHIM_ft":ft_mapping}, inplace=True)
-    loaded_net_df.drop("ft", axis=1, inplace=True)
-
-    # stack -- index=a,b,distance,ft, and then we have var -> value
-    loaded_net_df = pandas.DataFrame(loaded_net_df.set_index(['a','b','distance','ITHIM_ft']).stack()).reset_index()
-    vol_net_df    = loaded_net_df.loc[loaded_net_df.level_4.str[:3] == 'vol'].copy()
-    tim_net_df    = loaded_net_df.loc[loaded_net_df.level_4.str[:4] == 'ctim'].copy()
-    assert(len(vol_net_df) + len(tim_net_df) == len(loaded_net_df))  # we have everything
-
-    # Link Times
-    tim_net_df['timeperiod'] = tim_net_df['level_4'].str[-2:]
-    tim_net_df.rename(columns={0:'time'}, inplace=True)
-    tim_net_df.drop('level_4', axis=1, inplace=True)
-
-    # Person and Vehicle Miles
-    vol_net_df['timeperiod'] = vol_net_df['level_4'].str[3:5]
-    vol_net_df['vehclass']   = vol_net_df['level_4'].str.split('_',n=1).str.get(1)
-    vol_net_df.rename(columns={0:'volume'}, inplace=True)
-
-    # remove the now extraneous 'level_4'
-    vol_net_df.drop('level_4', axis=1, inplace=True)
-
-    # Put the times/volumes together
-    vol_net_df = pandas.merge(left=vol_net_df, right=tim_net_df, how='left')
-
-    # Vehicle miles traveled
-    vol_net_df['auto_VMT']   = 0
-    vol_net_df.loc[(vol_net_df.vehclass=='da')|(vol_net_df.vehclass=='dat'), 'auto_VMT'] = vol_net_df['distance']*vol_net_df['volume']
-    vol_net_df.loc[(vol_net_df.vehclass=='s2')|(vol_net_df.vehclass=='s2t'), 'auto_VMT'] = vol_net_df['distance']*vol_net_df['volume']
-    vol_net_df.loc[(vol_net_df.vehclass=='s3')|(vol_net_df.vehclass=='s2t'), 'auto_VMT'] = vol_net_df['distance']*vol_net_df['volume']
-    vol_net_df['truck_VMT'] = 0
-    vol_net_df.loc[(vol_net_df.vehclass=='sm')|(vol_net_df.vehclass=='smt'), 'truck_VMT'] = vol_net_df['distance']*vol_net_df['volume']
-    vol_net_df.loc[(vol_net_df.vehclass=='hv')|(vol_net_df.vehclass=='hvt'), 'truck_VMT']  = vol_net_df['distance']*vol_net_df['volume']
-
-    # groupby facility type for VMT only
-    loaded_ft_df = vol_net_df[['ITHIM_ft','auto_VMT','truck_VMT']].groupby(['ITHIM_ft']).agg(numpy.sum)
-
-    # reformat
-    loaded_ft_df = loaded_ft_df.unstack().to_frame().reset_index()
-    loaded_ft_df.rename(columns={"level_0":"item_name", 0:"wt_n", "ITHIM_ft":"strata"}, inplace=True)
-    loaded_ft_df["mode"]      = loaded_ft_df["item_name"].str[:-4]
-    loaded_ft_df["item_name"] = loaded_ft_df["item_name"].str[-3:]
-    loaded_ft_df.loc[loaded_ft_df["mode"]=="auto", "mode"] = "car"   # we prefer "car" here rather than "auto"
+    real_link = (network.ft != 10)
+    (ft_vmt, (fts,)) = network.group_aggregate(network.vmt().sum(axis=1), 'ft', link_mask=real_link)
+    (ft_vht, (fts,)) = network.group_aggregate(network.vht().sum(axis=1), 'ft', link_mask=real_link)
+
+    # then by ITHIM ft => [strata, vehclass]; the ft 10 sums are zero (masked out above)
+    # unmapped fts keep their ft number as their strata, as the ft_mapping replace did; numbers sort before names
+    ft_strata       = [FT_MAPPING.get(ft, ft) for ft in fts]
+    strata          = sorted(set([ft_strata[f_idx] for f_idx in range(len(fts)) if fts[f_idx] != 10]),
+                             key=lambda stratum: (isinstance(stratum, str), stratum))
+    strata_index    = numpy.array([strata.index(ft_strata[f_idx]) if fts[f_idx] != 10 else 0 for f_idx in range(len(fts))])
+    strata_vmt      = numpy.zeros((len(strata), len(LoadedNetwork.VEHCLASSES)))
+    strata_vht      = numpy.zeros((len(strata), len(LoadedNetwork.VEHCLASSES)))
+    numpy.add.at(strata_vmt, strata_index, ft_vmt)
+    numpy.add.at(strata_vht, strata_index, ft_vht)
+
+    def vehclass_sum(strata_values, vehclasses, factor=None):
+        """
+        Sums strata_values [strata, vehclass] across the given vehicle classes and their toll versions, => [strata]
+        Multiplies each vehicle class by factor[vehclass] if passed.
+        """
+        total = numpy.zeros(len(strata))
+        for vehclass in vehclasses:
+            for toll_vehclass in [vehclass, vehclass + "t"]:
+                total += strata_values[:,LoadedNetwork.VEHCLASSES.index(toll_vehclass)]*(factor[vehclass] if factor else 1.0)
+        return total
+
+    # detail: VMT, PMT and PHT by mode and strata
+    detail_list = []
+    for (mode, vehclasses) in VMT_MODES:
+        detail_list.append(("VMT", mode, vehclass_sum(strata_vmt, vehclasses)))
+    for (item, strata_values) in [("PMT", strata_vmt), ("PHT", strata_vht)]:
+        # each vehicle has one driver
+        detail_list.append((item, "auto_driver",    vehclass_sum(strata_values, ['da','s2','s3'])))
+        detail_list.append((item, "auto_passenger", vehclass_sum(strata_values, ['da','s2','s3'], PASSENGERS)))
+        detail_list.append((item, "truck_driver",   vehclass_sum(strata_values, ['sm','hv'])))
+    detail_df = pandas.DataFrame([{"item_name":item, "mode":mode, "strata":strata[s_idx], "value":values[s_idx]}
+                                  for (item, mode, values) in detail_list for s_idx in range(len(strata))],
+                                 columns=["item_name","mode","strata","value"])
+    outfile = os.path.join("metrics","ITHIM","DistanceTraveledByFacilityType_auto+truck_detail.csv")
+    detail_df.to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    # proportion of vehicle miles by mode and facility type
+    car_vmt   = vehclass_sum(strata_vmt, ['da','s2','s3'])
+    truck_vmt = vehclass_sum(strata_vmt, ['sm','hv'])
+    loaded_ft_df = pandas.DataFrame({"item_name":["VMT"]*(2*len(strata)),
+                                     "strata"   :strata + strata,
+                                     "wt_n"     :numpy.concatenate([car_vmt, truck_vmt]),
+                                     "mode"     :["car"]*len(strata) + ["truck"]*len(strata)},
+                                    columns=["item_name","strata","wt_n","mode"])
 
     # add 10% to local car because of intra-zonal trips
     loaded_ft_df.loc[(loaded_ft_df["mode"]=="car")&(loaded_ft_df["strata"]=="local"),"wt_n"] *= 1.1
@@ -104,5 +117,4 @@ if __name__ == '__main__':
 
     outfile = os.path.join("metrics","ITHIM","DistanceTraveledByFacilityType_auto+truck.csv")
     loaded_ft_df.to_csv(outfile, index=False)
-    print "Wrote %s" % outfile
-
+    print("Wrote %s" % outfile)
@@ -14,32 +14,20 @@ USAGE = """
 import os, sys
 import numpy, pandas
 
-def read_dbf(dbf_fullpath):
-    """
-    Returns the pandas DataFrame
-    """
-    import pysal
-    dbfin = pysal.open(dbf_fullpath)
-    vars = dbfin.header
-    data = dict([(var, dbfin.by_col(var)) for var in vars])
-
-    table_df = pandas.DataFrame(data)
-
-    print "  Read %d lines from %s" % (len(table_df), dbf_fullpath)
-
-    return table_df
+# shared network readers live with the metrics scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "metrics"))
+import columnStore
+import transitAssignment
+from LoadedNetwork import LinkIndex
 
 if __name__ == '__main__':
     pandas.set_option('display.width', 500)
     iteration            = int(os.environ['ITER'])
-    TIMEPERIODS          = ['ea','am','md','pm','ev']
-    SUBMODES             = ['com','hvy','exp','lrf','loc']
     TIMEPERIOD_DURATIONS = {'ea':3, 'am':4, 'md':5, 'pm':4, 'ev':8}
 
     # read the road network for facility types
     roadway_file  = os.path.join("hwy", "iter%d" % iteration, "avgload5period_vehclasses.csv")
-    loaded_net_df = pandas.read_table(roadway_file, sep=",")
-    loaded_net_df = loaded_net_df[['a','b','distance','ft']] # we only need a subset of columns
+    loaded_net_df = columnStore.read_csv_columns(roadway_file, ['a','b','distance','ft']) # we only need a subset of columns
     print "  Read %s lines from %s" % (len(loaded_net_df), roadway_file)
 
     # filter out FT=10 since those are toll plazas and not real links
@@ -65,31 +53,12 @@ if __name__ == '__main__':
     loaded_net_df.drop("ft", axis=1, inplace=True)
     # print loaded_net_df.head()
 
-    # Read the transit assignment files
-    first = True
-    trnlines_df = None
-    for timeperiod in TIMEPERIODS:
-        for access in ['wlk','drv']:
-            for submode in SUBMODES:
-                for egress in ['wlk','drv']:
-
-                    if access == 'drv' and egress == 'drv': continue
-                    filename = os.path.join("trn","trnlink%s_%s_%s_%s.dbf" % (timeperiod, access, submode, egress))
-                    trnline_df = read_dbf(filename)
-                    trnline_df['access'            ] = access
-                    trnline_df['egress'            ] = egress
-                    trnline_df['submode'           ] = submode
-                    trnline_df['TimePeriod'        ] = timeperiod
-                    trnline_df['TimePeriodDuration'] = TIMEPERIOD_DURATIONS[timeperiod]
-                    if first:
-                        trnlines_df = trnline_df
-                        first = False
-                    else:
-                        trnlines_df = pandas.concat([trnlines_df, trnline_df], axis=0)
-
-    # we only need some columns
-    trnlines_df = trnlines_df[['A','B','AB_VOL','DIST','FREQ','MODE','NAME','SEQ','TIME',
-                               'access','egress','submode','TimePeriod','TimePeriodDuration']]
+    # Read the transit assignment, already aggregated across access/egress/submodes
+    trnlines_df = transitAssignment.read_transit_cube("trn", columns=['MODE','NAME','SEQ','A','B','timeperiod',
+                                                                      'TIME','DIST','FREQ','AB_VOL'])
+    trnlines_df.rename(columns={'timeperiod':'TimePeriod'}, inplace=True)
+    trnlines_df['TimePeriod'        ] = trnlines_df['TimePeriod'].astype(str)
+    trnlines_df['TimePeriodDuration'] = trnlines_df['TimePeriod'].map(TIMEPERIOD_DURATIONS)
 
     # Recode Line-haul modes to ITHIM modes
     # Line-haul modes http://analytics.mtc.ca.gov/foswiki/Main/TransitNetworkCoding
@@ -106,27 +75,22 @@ if __name__ == '__main__':
 
     # print trnlines_df.head()
     # print trnlines_df['mode'].value_counts()
-
-    # aggregate across access/egress/submodes
-    trnlines_df['count'] = 1 # to check we're aggregating correctly
-    trnlines_grouped_df = trnlines_df.groupby(['mode','MODE','NAME','SEQ','A','B',
-                                              'TimePeriod','TimePeriodDuration','TIME','DIST','FREQ']).agg({'AB_VOL':numpy.sum,
-                                                                                                            'count':numpy.sum}).reset_index()
-    # print "Counts: "
-    # print trnlines_grouped_df['count'].value_counts()
+    trnlines_grouped_df = trnlines_df.reset_index(drop=True)
 
     # (minutes/timeperiod) x (1 run/freq mins) = runs/timeperiod
     trnlines_grouped_df['Vehicle Runs'            ] = 60.0 * trnlines_grouped_df['TimePeriodDuration'] / trnlines_grouped_df['FREQ']
     trnlines_grouped_df['Vehicle Miles Traveled'  ] = trnlines_grouped_df['Vehicle Runs'] * trnlines_grouped_df['DIST'] / 100.0
 
     # join bus to roadway for facility type
-    trnlines_grouped_df = pandas.merge(left=trnlines_grouped_df, right=loaded_net_df, how='left', on=['A','B'])
+    roadway_join = LinkIndex(loaded_net_df['A'].values, loaded_net_df['B'].values).join(trnlines_grouped_df['A'].values,
+                                                                                        trnlines_grouped_df['B'].values)
+    trnlines_grouped_df['strata'] = roadway_join.gather(loaded_net_df['strata'].values, missing=None)
     trnlines_grouped_df.loc[trnlines_grouped_df['mode']=='rail', 'strata'] = "" # throw out strata for rail
     # print trnlines_grouped_df.sort("AB_VOL", ascending=False).head()
     # print trnlines_grouped_df.strata.value_counts()
 
-    bus_count = len(trnlines_grouped_df.loc[(trnlines_grouped_df['mode']=='bus'),])
-    ft_found  = len(trnlines_grouped_df.loc[(trnlines_grouped_df['mode']=='bus')&(pandas.notnull(trnlines_grouped_df['strata'])),])
+    (ft_failed, bus_count) = roadway_join.failures(trnlines_grouped_df['mode'].values=='bus')
+    ft_found  = bus_count - ft_failed
     print "Out of %d bus links, %d have a facilty type found (or %.2f%%)" % (bus_count, ft_found, 100.0*ft_found/bus_count)
     # assign those to local since they're probably under-represented
     trnlines_grouped_df.loc[(trnlines_grouped_df['mode']=='bus')&(pandas.isnull(trnlines_grouped_df['strata'])),'strata'] = "local"
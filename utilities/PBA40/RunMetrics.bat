@@ -161,10 +161,19 @@ if not exist trn\quickboards.xls (
 
 :transit
 if not exist metrics\transit_boards_miles.csv (
-  rem Summarize quickboards output to pull daily boardings and passenger miles
-  rem Input: trn\quickboards.xls
-  rem Output: metrics\transit_board_miles.csv
-  call python "%CODE_DIR%\transit.py" trn\quickboards.xls
+  rem Summarize the transit assignment to daily boardings and passenger miles by mode and by line
+  rem Input: trn\trnlink[timperiod]_[acc]_[trnmode]_[egr].dbf
+  rem Output: metrics\transit_boards_miles.csv, metrics\transit_line_ridership.csv
+  call python "%CODE_DIR%\transit.py" --processes %NUMBER_OF_PROCESSORS% trn
+)
+
+if not exist metrics\transit_crowding.csv (
+  rem Summarize transit vehicle loads and load factors
+  rem Input: trn\trnlink[timperiod]_[acc]_[trnmode]_[egr].dbf (via trn\trnlink_cube.cols), CTRAMP\scripts\core_summaries\reference-transit-modes.csv,
+  rem        INPUT\metrics\transitCapacityLookup.csv (optional)
+  rem Output: metrics\transit_crowding.csv, metrics\transit_crowding_peak_load_points.csv
+  call python "%CODE_DIR%\TransitCrowding.py"
+  IF ERRORLEVEL 2 goto error
 )
 
 if not exist "%ALL_PROJECT_METRICS_DIR%" (mkdir "%ALL_PROJECT_METRICS_DIR%")
@@ -0,0 +1,80 @@
+import numpy
+from LoadedNetwork import LoadedNetwork
+from MetricsLookups import MetricsLookups
+
+USAGE = """
+
+  Not run directly.  Computes vehicle hours traveled and delay for every link, timeperiod and vehicle class
+  of a LoadedNetwork, for summarizing by any link grouping (see LoadedNetwork.group_aggregate()).
+
+  e.g.
+    network     = LoadedNetwork.read(network_file)
+    link_delay  = LinkDelay(network)
+    truck_vhd, (freight, counties) = link_delay.aggregate('delay', ['freight','county'],
+                                                          vehclasses=LoadedNetwork.TRUCK_VEHCLASSES)
+
+"""
+
+class LinkDelay(object):
+    """
+    Vehicle hours and delay for a loaded network, as arrays of [link, timeperiod, vehclass]
+    in the order of LoadedNetwork.TIMEPERIODS and LoadedNetwork.VEHCLASSES.
+
+    * vht          : vehicle hours traveled, at congested time
+    * freeflow_vht : vehicle hours traveled if all vehicles traveled at freeflow time
+    * delay        : vehicle hours of delay, vht - freeflow_vht
+    * nrc_delay    : vehicle hours of non-recurring freeway delay (only if lookups are passed)
+    """
+    MEASURES = ['vht','freeflow_vht','delay','nrc_delay']
+
+    def __init__(self, network, lookups=None):
+        """
+        Parameters
+        ----------
+        network : LoadedNetwork
+            The loaded network, read with fft (and ft, lanes for nrc_delay).
+        lookups : MetricsLookups
+            Optional; if passed, nrc_delay is calculated using the nonRecurringDelayLookup.
+        """
+        self.network      = network
+        self.vht          = network.vht()
+        self.freeflow_vht = network.volumes*network.fft[:,numpy.newaxis,numpy.newaxis]/60.0
+        self.delay        = self.vht - self.freeflow_vht
+        self.nrc_delay    = None
+        if lookups is not None:
+            self.nrc_delay = LinkDelay.nrc_link_delay(network, lookups)
+
+    @staticmethod
+    def nrc_link_delay(network, lookups):
+        """
+        Returns the non-recurring freeway delay for each link as [link, timeperiod, vehclass].
+        This is only for ft=1 or ft=2 or ft==8 (freeway-to-freeway connectors, freeways, managed freeways);
+        other links have none.  See http://analytics.mtc.ca.gov/foswiki/Main/MasterNetworkLookupTables
+        """
+        (vcratio_bin, nrc_lanes) = MetricsLookups.nrc_keys(network.vc, network.lanes)
+        freeway    = (network.ft == 1)|(network.ft == 2)|(network.ft == 8)
+        # units: Hours delay per VMT
+        nrc_rate   = lookups.nrc_rates[vcratio_bin, nrc_lanes[:,numpy.newaxis]]       # [link, timeperiod]
+        nrc_rate   = numpy.where(freeway[:,numpy.newaxis], nrc_rate, 0.0)
+        assert(not numpy.isnan(nrc_rate).any())
+        return network.vmt()*nrc_rate[:,:,numpy.newaxis]
+
+    def measure(self, measure, vehclasses=None):
+        """
+        Returns the given measure (one of MEASURES) as [link, timeperiod, vehclass], or as [link, timeperiod]
+        summed across the given vehicle classes.
+        """
+        if measure not in LinkDelay.MEASURES:
+            raise KeyError("Unknown measure %s; expected one of %s" % (measure, str(LinkDelay.MEASURES)))
+        values = getattr(self, measure)
+        if values is None:
+            raise ValueError("%s requires the MetricsLookups" % measure)
+        if vehclasses is None: return values
+        return values[:,:,LoadedNetwork.vehclass_index(vehclasses)].sum(axis=2)
+
+    def aggregate(self, measure, group_keys, vehclasses=None, link_mask=None):
+        """
+        Sums the given measure by the given link group keys; see LoadedNetwork.group_aggregate().
+        Returns (sums, labels) where sums is [group_key1, ..., timeperiod(, vehclass)]
+        """
+        return self.network.group_aggregate(self.measure(measure, vehclasses), group_keys, link_mask=link_mask)
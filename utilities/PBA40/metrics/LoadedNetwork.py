@@ -0,0 +1,384 @@
+import collections, os
+import numpy, pandas
+import columnStore
+
+USAGE = """
+
+  Not run directly.  Used by the metrics scripts to read the loaded roadway network,
+  hwy\\iter%ITER%\\avgload5period_vehclasses.csv (written by net2csv_avgload5period.job)
+  into a set of arrays.
+
+  e.g.
+    from LoadedNetwork import LoadedNetwork
+    network = LoadedNetwork.read(os.path.join("hwy","iter3","avgload5period_vehclasses.csv"))
+    truck_vmt = network.vmt(LoadedNetwork.TRUCK_VEHCLASSES).sum()
+
+  Other link tables (e.g. transit links) can be joined to roadway links on (a,b) with a LinkIndex:
+
+    link_join = network.link_index.join(trnlink_df['A'].values, trnlink_df['B'].values)
+    trn_ft    = link_join.gather(network.ft, missing=-1)
+
+"""
+
+class LoadedNetwork(object):
+    """
+    This represents the loaded roadway network for a single model run, stored as contiguous arrays
+    rather than a DataFrame with a column per time period and vehicle class.
+
+    * volumes[link, timeperiod, vehclass] : link volumes, in the order of TIMEPERIODS and VEHCLASSES
+    * ctim[link, timeperiod]              : congested time (minutes)
+    * cspd[link, timeperiod]              : congested speed (mph)
+    * vc[link, timeperiod]                : volume to capacity ratio
+    * link_attrs                          : dict of link attribute name -> array indexed by link,
+                                            for each of LINK_ATTRIBUTES in the network
+
+    The most commonly used link attributes (a, b, distance, ft, at, lanes, fft) are also
+    available directly as members; these are the same arrays as in link_attrs.
+
+    Per-link values can be summed by geography and link type (see GROUP_KEYS) with group_aggregate().
+    """
+    TIMEPERIODS = ['EA','AM','MD','PM','EV']
+    VEHCLASSES  = ['da','s2','s3','sm','hv','dat','s2t','s3t','smt','hvt']
+
+    # vehicle class groupings
+    AUTO_VEHCLASSES        = ['da','s2','s3','dat','s2t','s3t']
+    SMALL_TRUCK_VEHCLASSES = ['sm','smt']
+    LARGE_TRUCK_VEHCLASSES = ['hv','hvt']
+    TRUCK_VEHCLASSES       = SMALL_TRUCK_VEHCLASSES + LARGE_TRUCK_VEHCLASSES
+
+    # Per-link columns from net2csv_avgload5period.job.  Only a,b are required.
+    LINK_ATTRIBUTES = [
+        'a','b',
+        'distance','lanes','gl','ft','at','state',
+        'cityid','cityname',
+        'regfreight',
+        'cap','ffs','fft',
+        'autoopc','autoopc_pave',
+        'smtropc','smtropc_pave',
+        'lrtropc','lrtropc_pave',
+        'busopc', 'busopc_pave',
+        'tollclass'
+        ]
+    INTEGER_ATTRIBUTES = ['a','b','lanes','gl','ft','at','state','cityid','regfreight','tollclass']
+    STRING_ATTRIBUTES  = ['cityname']
+
+    # Link group keys for group_aggregate() => the link attribute each is based on
+    GROUP_KEYS = collections.OrderedDict([
+        ('county',       'gl'),
+        ('city',         'cityid'),
+        ('ft',           'ft'),
+        ('at',           'at'),
+        ('freight',      'regfreight'),
+        ('express_lane', 'tollclass')
+        ])
+    # value tolls (express lanes) have a tollclass of at least this; lower tollclasses are bridge tolls.  See hwyParam.block
+    FIRST_VALUE_TOLLCLASS = 11
+
+    # link key = a x LINK_KEY_FACTOR + b; node numbers are less than this
+    LINK_KEY_FACTOR = 1 << 32
+
+    @staticmethod
+    def volume_columns():
+        """
+        Returns the network columns for volumes, in the order of the volumes array (period-major).
+        """
+        return ['vol%s_%s' % (timeperiod, vehclass) for timeperiod in LoadedNetwork.TIMEPERIODS
+                                                     for vehclass in LoadedNetwork.VEHCLASSES]
+
+    @staticmethod
+    def timeperiod_columns(prefix):
+        """
+        Returns the network columns for the given per-timeperiod variable, e.g. ctimEA, ctimAM, etc
+        """
+        return ['%s%s' % (prefix, timeperiod) for timeperiod in LoadedNetwork.TIMEPERIODS]
+
+    @staticmethod
+    def read(network_file, link_attributes=None, use_cache=True):
+        """
+        Reads the given loaded network csv and returns a LoadedNetwork.
+        Only the required columns are read, via the column store cache (see columnStore.py).
+
+        Parameters
+        ----------
+        network_file : string
+            The path to avgload5period_vehclasses.csv
+        link_attributes : list of strings
+            The link attributes to read, in addition to a, b.  Defaults to all of
+            LINK_ATTRIBUTES that are present in the file.
+        use_cache : bool
+            Pass False to read the csv directly rather than via the column store.
+        """
+        header = columnStore.csv_columns(network_file, use_cache=use_cache)
+        if link_attributes is None:
+            link_attributes = LoadedNetwork.LINK_ATTRIBUTES
+        columns = ['a','b'] + [attr for attr in link_attributes if attr in header and attr not in ['a','b']]
+        columns += LoadedNetwork.timeperiod_columns('ctim') + \
+                   LoadedNetwork.timeperiod_columns('cspd') + \
+                   LoadedNetwork.timeperiod_columns('vc')   + \
+                   LoadedNetwork.volume_columns()
+
+        links_df = columnStore.read_csv_columns(network_file, columns, use_cache=use_cache)
+        print("Read %d links from %s" % (len(links_df), network_file))
+        return LoadedNetwork(links_df, network_file)
+
+    @staticmethod
+    def find_network_file(rundir, iteration=None):
+        """
+        Returns the path to avgload5period_vehclasses.csv for the given run metrics directory, looking in
+        1) the parent dir (e.g. OUTPUT on M), 2) the parent extractor dir, or 3) parent hwy\\iter[iteration].
+        Returns None if it isn't found.
+        """
+        candidates = [os.path.join(rundir, "..", "avgload5period_vehclasses.csv"),
+                      os.path.join(rundir, "..", "extractor", "avgload5period_vehclasses.csv")]
+        if iteration is not None:
+            candidates.append(os.path.join(rundir, "..", "hwy", "iter%s" % str(iteration), "avgload5period_vehclasses.csv"))
+        for candidate in candidates:
+            candidate = os.path.abspath(candidate)
+            if os.path.exists(candidate): return candidate
+        return None
+
+    def __init__(self, links_df, network_file=None):
+        """
+        Parameters
+        ----------
+        links_df : pandas.DataFrame
+            The loaded network, with one row per link and the columns output by net2csv_avgload5period.job
+        network_file : string
+            The file the network was read from, for reference.
+        """
+        self.network_file = network_file
+        self.num_links    = len(links_df)
+
+        self.link_attrs   = {}
+        for attr in LoadedNetwork.LINK_ATTRIBUTES:
+            if attr not in links_df.columns: continue
+            if attr in LoadedNetwork.INTEGER_ATTRIBUTES:
+                self.link_attrs[attr] = numpy.ascontiguousarray(links_df[attr].values, dtype=numpy.int64)
+            elif attr in LoadedNetwork.STRING_ATTRIBUTES:
+                self.link_attrs[attr] = numpy.asarray(links_df[attr].values).astype(str)
+            else:
+                self.link_attrs[attr] = numpy.ascontiguousarray(links_df[attr].values, dtype=numpy.float64)
+
+        for attr in ['a','b','distance','ft','at','lanes','fft']:
+            setattr(self, attr, self.link_attrs.get(attr))
+
+        num_periods  = len(LoadedNetwork.TIMEPERIODS)
+        num_classes  = len(LoadedNetwork.VEHCLASSES)
+        # one block copy each; the column order is period-major so reshape gives [link, period, vehclass]
+        self.volumes = numpy.ascontiguousarray(links_df[LoadedNetwork.volume_columns()].values,
+                                               dtype=numpy.float64).reshape(self.num_links, num_periods, num_classes)
+        self.ctim    = numpy.ascontiguousarray(links_df[LoadedNetwork.timeperiod_columns('ctim')].values, dtype=numpy.float64)
+        self.cspd    = numpy.ascontiguousarray(links_df[LoadedNetwork.timeperiod_columns('cspd')].values, dtype=numpy.float64)
+        self.vc      = numpy.ascontiguousarray(links_df[LoadedNetwork.timeperiod_columns('vc'  )].values, dtype=numpy.float64)
+
+        # (a,b) -> row index, as sorted link keys
+        self.link_index       = LinkIndex(self.a, self.b)
+        self.link_keys        = self.link_index.keys
+
+        # group key -> (codes[link], labels), built by group_codes() on first use
+        self.group_code_cache = {}
+
+    @staticmethod
+    def link_key(a, b):
+        """
+        Returns the integer key(s) for the given link(s), a x LINK_KEY_FACTOR + b
+        """
+        return numpy.asarray(a, dtype=numpy.int64)*LoadedNetwork.LINK_KEY_FACTOR + numpy.asarray(b, dtype=numpy.int64)
+
+    def row_index(self, a, b):
+        """
+        Returns the row index (or indices) for the given link(s) (a,b), or -1 for links not in this network.
+        """
+        return self.link_index.row_index(a, b)
+
+    @staticmethod
+    def vehclass_index(vehclasses):
+        """
+        Returns the indices into the vehclass axis of volumes for the given vehicle classes.
+        """
+        return [LoadedNetwork.VEHCLASSES.index(vehclass.lower()) for vehclass in vehclasses]
+
+    @staticmethod
+    def timeperiod_index(timeperiods):
+        """
+        Returns the indices into the timeperiod axis of volumes, ctim, etc for the given time periods.
+        """
+        return [LoadedNetwork.TIMEPERIODS.index(timeperiod.upper()) for timeperiod in timeperiods]
+
+    def vehclass_volume(self, vehclasses):
+        """
+        Returns volume summed across the given vehicle classes, as [link, timeperiod]
+        """
+        return self.volumes[:,:,LoadedNetwork.vehclass_index(vehclasses)].sum(axis=2)
+
+    def vmt(self, vehclasses=None):
+        """
+        Returns vehicle miles traveled as [link, timeperiod, vehclass], or as [link, timeperiod]
+        summed across the given vehicle classes.
+        """
+        if vehclasses is None:
+            return self.volumes*self.distance[:,numpy.newaxis,numpy.newaxis]
+        return self.vehclass_volume(vehclasses)*self.distance[:,numpy.newaxis]
+
+    def vht(self, vehclasses=None):
+        """
+        Returns vehicle hours traveled as [link, timeperiod, vehclass], or as [link, timeperiod]
+        summed across the given vehicle classes.
+        """
+        if vehclasses is None:
+            return self.volumes*self.ctim[:,:,numpy.newaxis]/60.0
+        return self.vehclass_volume(vehclasses)*self.ctim/60.0
+
+    def to_dataframe(self, link_attributes=('a','b')):
+        """
+        Returns a pandas.DataFrame of the given link attributes, one row per link.
+        """
+        return pandas.DataFrame(dict([(attr, self.link_attrs[attr]) for attr in link_attributes]),
+                                columns=list(link_attributes))
+
+    def group_codes(self, group_key):
+        """
+        Returns (codes, labels) for the given group key (one of GROUP_KEYS), where codes[link] is an integer
+        from 0 to len(labels)-1 and labels are the distinct values of the group key, sorted.
+
+        * county, ft, at, freight: labels are the values of gl, ft, at, regfreight
+        * city: labels are the cityname (or cityid, if cityname wasn't read)
+        * express_lane: labels are [0,1] where 1 is a value toll link (tollclass >= FIRST_VALUE_TOLLCLASS).
+          For networks without tollclass, managed freeways (ft 8) are used instead.
+        """
+        if group_key in self.group_code_cache: return self.group_code_cache[group_key]
+        if group_key not in LoadedNetwork.GROUP_KEYS:
+            raise KeyError("Unknown group key %s; expected one of %s" % (group_key, str(list(LoadedNetwork.GROUP_KEYS.keys()))))
+
+        attr = LoadedNetwork.GROUP_KEYS[group_key]
+        if group_key == 'express_lane':
+            if 'tollclass' in self.link_attrs:
+                values = (self.link_attrs['tollclass'] >= LoadedNetwork.FIRST_VALUE_TOLLCLASS).astype(numpy.int64)
+            else:
+                values = (self.ft == 8).astype(numpy.int64)
+            (labels, codes) = (numpy.array([0,1]), values)
+        elif attr not in self.link_attrs:
+            raise KeyError("Group key %s requires link attribute %s, which wasn't read from %s" %
+                           (group_key, attr, self.network_file))
+        else:
+            (labels, codes) = numpy.unique(self.link_attrs[attr], return_inverse=True)
+
+        if group_key == 'city' and 'cityname' in self.link_attrs:
+            # label each cityid with its name
+            first_link = numpy.zeros(len(labels), dtype=numpy.int64)
+            first_link[codes[::-1]] = numpy.arange(self.num_links)[::-1]
+            labels = self.link_attrs['cityname'][first_link]
+
+        self.group_code_cache[group_key] = (codes.reshape(-1), labels)
+        return self.group_code_cache[group_key]
+
+    def group_aggregate(self, values, group_keys, link_mask=None):
+        """
+        Sums values by the given group keys in one pass, using numpy.bincount.
+
+        e.g. vmt_by_county_ft, (counties, fts) = network.group_aggregate(network.vmt(), ['county','ft'])
+             => vmt_by_county_ft[county, ft, timeperiod, vehclass]
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Per-link values to sum, [link] or [link, ...] (e.g. [link, timeperiod]).
+        group_keys : string or list of strings
+            One or more of GROUP_KEYS.
+        link_mask : numpy.ndarray of bool
+            Optional; only links where this is True are included.
+
+        Returns (sums, labels) where sums is [group_key1, group_key2, ..., (trailing dimensions of values)]
+        and labels is the list of labels for each group key, as returned by group_codes().
+        """
+        if not isinstance(group_keys, (list, tuple)): group_keys = [group_keys]
+        values      = numpy.asarray(values, dtype=numpy.float64)
+        if values.shape[0] != self.num_links:
+            raise ValueError("values must be indexed by link first; got shape %s for %d links" % (str(values.shape), self.num_links))
+        trailing    = values.shape[1:]
+        num_values  = int(numpy.prod(trailing)) if len(trailing) > 0 else 1
+
+        codes_list  = [self.group_codes(group_key) for group_key in group_keys]
+        group_shape = tuple([len(labels) for (codes, labels) in codes_list])
+        group_code  = numpy.ravel_multi_index([codes for (codes, labels) in codes_list], group_shape) if len(group_shape) > 0 else \
+                      numpy.zeros(self.num_links, dtype=numpy.int64)
+        num_groups  = int(numpy.prod(group_shape)) if len(group_shape) > 0 else 1
+
+        values      = values.reshape(self.num_links, num_values)
+        if link_mask is not None:
+            values     = values[link_mask]
+            group_code = group_code[link_mask]
+        key         = group_code[:,numpy.newaxis]*num_values + numpy.arange(num_values)[numpy.newaxis,:]
+        sums        = numpy.bincount(key.ravel(), weights=values.ravel(), minlength=num_groups*num_values)
+        return (sums.reshape(group_shape + trailing), [labels for (codes, labels) in codes_list])
+
+class LinkIndex(object):
+    """
+    Maps link (a,b) node pairs to the rows of a link table, via sorted integer link keys
+    (see LoadedNetwork.link_key()) and numpy.searchsorted.  Build it once per table and reuse it
+    for every table joined to it.
+    """
+
+    def __init__(self, a, b):
+        """
+        Parameters
+        ----------
+        a, b : numpy.ndarray
+            The a and b node of each row of the link table.
+        """
+        self.keys         = LoadedNetwork.link_key(a, b)
+        self.num_links    = len(self.keys)
+        self.sorted_order = numpy.argsort(self.keys, kind='mergesort')
+        self.sorted_keys  = self.keys[self.sorted_order]
+
+    def row_index(self, a, b):
+        """
+        Returns the row index (or indices) for the given link(s) (a,b), or -1 for links not in the table.
+        """
+        keys  = LoadedNetwork.link_key(a, b)
+        if self.num_links == 0: return numpy.full(keys.shape, -1, dtype=numpy.int64)
+        pos   = numpy.minimum(numpy.searchsorted(self.sorted_keys, keys), self.num_links-1)
+        return numpy.where(self.sorted_keys[pos] == keys, self.sorted_order[pos], -1)
+
+    def join(self, a, b):
+        """
+        Returns the LinkJoin of the given links (a,b) to the table.
+        """
+        return LinkJoin(self.row_index(a, b))
+
+class LinkJoin(object):
+    """
+    The rows of a link table for another set of links, from LinkIndex.join().
+
+    * rows[link]  : row in the link table, or -1 if the link isn't in it
+    * found[link] : True if the link is in the link table
+    """
+
+    def __init__(self, rows):
+        self.rows       = rows
+        self.found      = (rows >= 0)
+        self.num_failed = int((~self.found).sum())
+
+    def gather(self, values, missing=numpy.nan):
+        """
+        Returns the given link table column (numpy.ndarray indexed by row) for each joined link,
+        with missing for the links that aren't in the link table.
+        """
+        values   = numpy.asarray(values)
+        if len(values) == 0: values = numpy.zeros(1, dtype=values.dtype)
+        gathered = values[numpy.maximum(self.rows, 0)]
+        if self.num_failed == 0: return gathered
+        if gathered.dtype.kind in 'SUO':
+            gathered = gathered.astype(object)
+            gathered[~self.found] = missing
+            return gathered
+        return numpy.where(self.found, gathered, missing)
+
+    def failures(self, weights=None):
+        """
+        Returns (failed, total): the number of links that failed to join and the number of links,
+        or if weights (e.g. bus miles) are given, the weight of each.
+        """
+        if weights is None: return (self.num_failed, len(self.rows))
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        return (weights[~self.found].sum(), weights.sum())
@@ -0,0 +1,199 @@
+import os
+import numpy, pandas
+from LoadedNetwork import LoadedNetwork
+
+USAGE = """
+
+  Not run directly.  Used by the metrics scripts to read the lookup tables in INPUT\\metrics
+  into arrays indexed by the lookup keys:
+
+  * nonRecurringDelayLookup.csv => nrc_rates[vcratio x 100, lanes]
+                                   (Hours delay per VMT)
+  * collisionLookup.csv         => collision_rates[at, ft, lanes, collision type]
+                                   (Collisions per 1,000,000 VMT)
+  * emissionsLookup.csv         => emission_rates[timeperiod, vclassgroup, speed, pollutant]
+                                   (Grams per mile, equivalent to metric tons per 1,000,000 VMT)
+
+  e.g.
+    from MetricsLookups import MetricsLookups
+    lookups = MetricsLookups(os.path.join("INPUT","metrics"))
+    rates   = lookups.collision_rates[4,1,2,:]  # at=4, ft=1, lanes=2
+
+"""
+
+class MetricsLookups(object):
+    """
+    The INPUT\\metrics lookup tables, parsed once into float arrays.
+
+    Integer keys (vcratio bin, lanes, at, ft, speed) index the arrays directly by their value,
+    so e.g. collision_rates[at,ft,lanes] is the row for that (at,ft,lanes).  Keys that aren't in
+    a lookup table are NaN.  Timeperiods are in the order of LoadedNetwork.TIMEPERIODS and
+    vehicle class groups in the order of EMISSIONS_VCLASSGROUPS.
+    """
+    NRC_FILE        = "nonRecurringDelayLookup.csv"
+    COLLISION_FILE  = "collisionLookup.csv"
+    EMISSIONS_FILE  = "emissionsLookup.csv"
+
+    # emissions are by vehicle class group
+    EMISSIONS_VCLASSGROUPS = ['auto','SM','HV']
+    EMISSIONS_VCLASSGROUP  = {'da':'auto',  'dat':'auto',
+                              's2':'auto',  's2t':'auto',
+                              's3':'auto',  's3t':'auto',
+                              'sm':'SM',    'smt':'SM',
+                              'hv':'HV',    'hvt':'HV'}
+
+    # nonRecurringDelayLookup is for lanes 2-4 (fewer is called 2, more is called 4) and vcratio up to 1.0
+    NRC_MIN_LANES     = 2
+    NRC_MAX_LANES     = 4
+    NRC_MAX_VCRATIO   = 1.0
+
+    # collisionLookup is for at 4 (non-rural) or 5 (rural), ft 1-4 and lanes 1-4
+    COLLISION_MIN_AT    = 4
+    COLLISION_MAX_FT    = 4
+    COLLISION_MAX_LANES = 4
+
+    # emissionsLookup is for speeds up to 65 mph
+    EMISSIONS_MAX_SPEED = 65
+    # how link speeds are mapped to emissionsLookup speeds; see emission_speed_bins()
+    EMISSIONS_SPEED_MODES = ['truncate','interpolate']
+
+    def __init__(self, lookupdir):
+        """
+        Parameters
+        ----------
+        lookupdir : string
+            The directory containing the lookup csvs, e.g. INPUT\\metrics
+        """
+        self.lookupdir = lookupdir
+        self.read_nrc_lookup()
+        self.read_collision_lookup()
+        self.read_emissions_lookup()
+
+    def read_nrc_lookup(self):
+        """
+        Reads nonRecurringDelayLookup.csv into nrc_rates[vcratio x 100, lanes].
+        """
+        nrc_df        = pandas.read_csv(os.path.join(self.lookupdir, MetricsLookups.NRC_FILE), sep=",")
+        lane_columns  = [col for col in nrc_df.columns if col.endswith("lanes")]
+        self.nrc_lanes = [int(col[:-len("lanes")]) for col in lane_columns]
+
+        vcratio_bin   = MetricsLookups.hundredths_bin(nrc_df['vcratio'].values.astype(numpy.float64))
+        self.nrc_rates = numpy.full((vcratio_bin.max()+1, max(self.nrc_lanes)+1), numpy.nan)
+        for lane_col, lanes in zip(lane_columns, self.nrc_lanes):
+            self.nrc_rates[vcratio_bin, lanes] = nrc_df[lane_col].values
+
+    def read_collision_lookup(self):
+        """
+        Reads collisionLookup.csv into collision_rates[at, ft, lanes, collision type].
+        """
+        col_df         = pandas.read_csv(os.path.join(self.lookupdir, MetricsLookups.COLLISION_FILE), sep=",")
+        self.collision_types = col_df.columns.tolist()[3:]
+
+        col_at    = col_df['at'].values.astype(numpy.int64)
+        col_ft    = col_df['ft'].values.astype(numpy.int64)
+        col_lanes = col_df['lanes'].values.astype(numpy.int64)
+        self.collision_rates = numpy.full((col_at.max()+1, col_ft.max()+1, col_lanes.max()+1,
+                                           len(self.collision_types)), numpy.nan)
+        self.collision_rates[col_at, col_ft, col_lanes, :] = col_df[self.collision_types].values
+
+    def read_emissions_lookup(self):
+        """
+        Reads emissionsLookup.csv into emission_rates[timeperiod, vclassgroup, speed, pollutant].
+        """
+        em_df          = pandas.read_csv(os.path.join(self.lookupdir, MetricsLookups.EMISSIONS_FILE), sep=",")
+        self.emission_types = em_df.columns.tolist()[3:]
+
+        em_period = numpy.array(LoadedNetwork.timeperiod_index(em_df['period'].tolist()), dtype=numpy.int64)
+        em_group  = numpy.array([MetricsLookups.EMISSIONS_VCLASSGROUPS.index(group) for group in em_df['vclassgroup']],
+                                dtype=numpy.int64)
+        em_speed  = em_df['speed'].values.astype(numpy.int64)
+        self.emission_rates = numpy.full((len(LoadedNetwork.TIMEPERIODS), len(MetricsLookups.EMISSIONS_VCLASSGROUPS),
+                                          em_speed.max()+1, len(self.emission_types)), numpy.nan)
+        self.emission_rates[em_period, em_group, em_speed, :] = em_df[self.emission_types].values
+
+    def vclass_emission_rates(self, vehclasses=None):
+        """
+        Returns emission_rates by vehicle class rather than group, as [timeperiod, vehclass, speed, pollutant].
+        Defaults to LoadedNetwork.VEHCLASSES.
+        """
+        if vehclasses is None: vehclasses = LoadedNetwork.VEHCLASSES
+        group_index = [MetricsLookups.EMISSIONS_VCLASSGROUPS.index(MetricsLookups.EMISSIONS_VCLASSGROUP[vehclass.lower()])
+                       for vehclass in vehclasses]
+        return self.emission_rates[:,group_index,:,:]
+
+    @staticmethod
+    def hundredths_bin(values):
+        """
+        Rounds values to hundredths and returns them as integers (e.g. 0.37 => 37), rounding exactly
+        as "%.2f" % value does.  numpy.rint(values*100) alone gets some ties wrong (e.g. 0.005) since
+        values*100 is itself rounded, so the rounding error of the product is recovered (Dekker's
+        split) and used to break ties.
+        """
+        product = values*100.0
+        split   = 134217729.0*values
+        high    = split - (split - values)
+        low     = values - high
+        error   = (high*100.0 - product) + low*100.0 # values*100 == product + error, exactly
+        rounded = numpy.rint(product)
+        is_tie  = (product - numpy.floor(product) == 0.5)
+        rounded = numpy.where(is_tie & (error > 0), numpy.ceil(product),  rounded)
+        rounded = numpy.where(is_tie & (error < 0), numpy.floor(product), rounded)
+        return rounded.astype(numpy.int64)
+
+    @staticmethod
+    def nrc_keys(vc, lanes):
+        """
+        Returns the nonRecurringDelayLookup keys for links, (vcratio bin [link, timeperiod], lanes [link]),
+        with vcratio capped at 1.0 and lanes limited to 2-4.
+        """
+        vcratio_bin = MetricsLookups.hundredths_bin(numpy.minimum(vc, MetricsLookups.NRC_MAX_VCRATIO))
+        nrc_lanes   = numpy.clip(lanes, MetricsLookups.NRC_MIN_LANES, MetricsLookups.NRC_MAX_LANES)
+        return (vcratio_bin, nrc_lanes)
+
+    @staticmethod
+    def collision_keys(at, ft, lanes):
+        """
+        Returns the collisionLookup keys for links, (at, ft, lanes, link_mask).
+        Managed freeways (ft 8) are like freeways (ft 2), ft 5+ is called 4, at is at least 4
+        and lanes 5+ is called 4.  Dummy links (ft 6) are excluded by link_mask.
+        """
+        col_ft    = numpy.where(ft == 8, 2, numpy.minimum(ft, MetricsLookups.COLLISION_MAX_FT))
+        col_at    = numpy.maximum(at, MetricsLookups.COLLISION_MIN_AT)
+        col_lanes = numpy.minimum(lanes, MetricsLookups.COLLISION_MAX_LANES)
+        link_mask = (ft != 6)
+        return (col_at, col_ft, col_lanes, link_mask)
+
+    @staticmethod
+    def emission_speed_keys(cspd):
+        """
+        Returns the emissionsLookup speed keys for the given congested speeds: the integer speed, capped at 65.
+        """
+        return numpy.minimum(cspd.astype(numpy.int64), MetricsLookups.EMISSIONS_MAX_SPEED)
+
+    @staticmethod
+    def emission_speed_bins(cspd, mode='truncate'):
+        """
+        Returns the emissionsLookup speeds to use for the given congested speeds as (lower, upper, upper_weight),
+        so that the emission rate for a link is (1-upper_weight) x rate[lower] + upper_weight x rate[upper].
+
+        Parameters
+        ----------
+        cspd : numpy.ndarray
+            Congested speeds (mph)
+        mode : string
+            One of EMISSIONS_SPEED_MODES.
+            'truncate' uses the integer speed, capped at 65 (so upper_weight is 0), as the emissionsLookup was built for.
+            'interpolate' interpolates linearly between the integer speeds either side of the speed, capped at 65.
+        """
+        if mode == 'truncate':
+            lower = MetricsLookups.emission_speed_keys(cspd)
+            return (lower, lower, numpy.zeros(lower.shape))
+        if mode != 'interpolate':
+            raise ValueError("Unknown emissions speed mode %s; expected one of %s" %
+                             (mode, str(MetricsLookups.EMISSIONS_SPEED_MODES)))
+
+        speed        = numpy.clip(cspd, 0.0, MetricsLookups.EMISSIONS_MAX_SPEED)
+        lower        = numpy.floor(speed).astype(numpy.int64)
+        upper        = numpy.minimum(lower + 1, MetricsLookups.EMISSIONS_MAX_SPEED)
+        upper_weight = speed - lower
+        return (lower, upper, upper_weight)
@@ -0,0 +1,250 @@
+import argparse, os, sys
+import numpy, pandas
+from LoadedNetwork import LoadedNetwork
+import columnStore
+
+USAGE = """
+
+  python NetworkComparison.py [--iter 3] [--summary_file network_comparison_summary.csv]
+                              [--link_output network_comparison_links.cols] [--use_cache]
+                              baseline scenario1 [scenario2 ...]
+
+  Compares the loaded roadway networks (avgload5period_vehclasses.csv) for a baseline and any number of
+  scenarios.  Each of baseline, scenario1, etc can be a network csv or a model run directory, in which case
+  the network is read from [run_dir]\\hwy\\iter[iter]\\avgload5period_vehclasses.csv.
+
+  Networks are aligned on (a,b), so links added or removed by a scenario are handled: their baseline
+  (or scenario) volume and VMT are zero and their speed is missing.  The networks are read directly from
+  the csvs; with --use_cache, via column stores written next to them (see columnStore.py).
+
+  * Writes the summary_file with baseline and scenario VMT, VHT and average speed, and the number of links
+    added and removed, by scenario, timeperiod and facility type (ft) or county (gl).
+  * With --link_output, writes a column store (see columnStore.py) with a, b, ft, gl, and for each
+    scenario and timeperiod, [scenario]_[volume|speed|vmt]_diff_[timeperiod] (scenario minus baseline).
+
+  Alternatively, use from another script:
+
+    from NetworkComparison import NetworkComparison
+    comparison = NetworkComparison.read(baseline_file, [scenario_file1, scenario_file2])
+    vmt_diff   = comparison.diff(scenario_file1, 'vmt')   # [link, timeperiod]
+
+"""
+
+class NetworkComparison(object):
+    """
+    A baseline loaded roadway network and a set of scenario networks aligned on a shared link index,
+    the union of the (a,b) link keys in all of the networks, sorted by link key.
+
+    For each network name (the baseline and each scenario):
+    * present[name][link]                  : True if the link is in that network
+    * volume, speed, vmt, vht[name][link, timeperiod] : total across vehicle classes, or the speed.
+      volume, vmt and vht are zero for links not in that network; speed is NaN.
+
+    Link attributes for the shared index (a, b, ft, gl, distance) come from the baseline,
+    or from the first scenario with the link if it isn't in the baseline.
+
+    The shared index is built once, up front, so each network is aligned to it with a single LinkIndex join.
+    Memory is linear in the number of networks; only these per-link aggregates are kept for each.
+    """
+    MEASURES        = ['volume','speed','vmt','vht']
+    LINK_ATTRIBUTES = ['distance','ft','gl']
+    SUMMARY_GROUPS  = ['ft','gl']
+
+    @staticmethod
+    def read(baseline_file, scenario_files, names=None, use_cache=False):
+        """
+        Reads the given baseline and scenario loaded network csvs and returns a NetworkComparison.
+
+        Parameters
+        ----------
+        baseline_file : string
+            The baseline avgload5period_vehclasses.csv
+        scenario_files : list of strings
+            The scenario avgload5period_vehclasses.csv files
+        names : list of strings
+            Names for the baseline and scenarios, in that order.  Defaults to the filenames.
+        use_cache : bool
+            Pass True to read the networks via their column stores (see columnStore.py), which are written
+            next to them if they're missing.  Off by default since the networks are usually other runs'.
+        """
+        files = [baseline_file] + list(scenario_files)
+        if names is None: names = files
+        # the links of every network, for the shared index
+        link_keys  = [LoadedNetwork.link_key(links_df['a'].values, links_df['b'].values)
+                      for links_df in [columnStore.read_csv_columns(network_file, ['a','b'], use_cache=use_cache)
+                                       for network_file in files]]
+        comparison = NetworkComparison(link_keys)
+        for (name, network_file) in zip(names, files):
+            comparison.add_network(name, LoadedNetwork.read(network_file, link_attributes=NetworkComparison.LINK_ATTRIBUTES,
+                                                            use_cache=use_cache))
+        return comparison
+
+    def __init__(self, link_keys):
+        """
+        Parameters
+        ----------
+        link_keys : list of numpy.ndarray
+            The link keys (see LoadedNetwork.link_key()) of each network to be compared.
+        """
+        self.names          = []   # baseline first
+        self.link_keys      = numpy.unique(numpy.concatenate(link_keys)) if len(link_keys) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        self.num_links      = len(self.link_keys)
+        self.link_attrs     = dict([(attr, numpy.full(self.num_links, numpy.nan)) for attr in NetworkComparison.LINK_ATTRIBUTES])
+        self.link_attrs['a'] = self.link_keys // LoadedNetwork.LINK_KEY_FACTOR
+        self.link_attrs['b'] = self.link_keys %  LoadedNetwork.LINK_KEY_FACTOR
+        self.present        = {}
+        for measure in NetworkComparison.MEASURES:
+            setattr(self, measure, {})
+
+    def baseline_name(self):
+        return self.names[0]
+
+    def scenario_names(self):
+        return self.names[1:]
+
+    def add_network(self, name, network):
+        """
+        Adds the given LoadedNetwork, aligned to the shared link index.  The first network added is the baseline.
+        Raises ValueError if the network has links that aren't in the shared index.
+        """
+        if name in self.names:
+            raise ValueError("Network %s has already been added" % name)
+
+        link_join = network.link_index.join(self.link_attrs['a'], self.link_attrs['b'])
+        present   = link_join.found
+        if int(present.sum()) != network.num_links:
+            raise ValueError("Network %s has %d links that aren't in the comparison" % (name, network.num_links - int(present.sum())))
+
+        # link attributes come from the first network with the link
+        for attr in NetworkComparison.LINK_ATTRIBUTES:
+            values = network.link_attrs.get(attr)
+            if values is None: continue
+            missing = numpy.isnan(self.link_attrs[attr]) & present
+            self.link_attrs[attr][missing] = link_join.gather(values.astype(numpy.float64))[missing]
+
+        row         = numpy.maximum(link_join.rows, 0)
+        volume      = network.volumes.sum(axis=2)
+        self.present[name] = present
+        self.volume[name]  = numpy.where(present[:,numpy.newaxis], volume[row], 0.0)
+        self.speed[name]   = numpy.where(present[:,numpy.newaxis], network.cspd[row], numpy.nan)
+        self.vmt[name]     = numpy.where(present[:,numpy.newaxis], volume[row]*network.distance[row,numpy.newaxis], 0.0)
+        self.vht[name]     = numpy.where(present[:,numpy.newaxis], volume[row]*network.ctim[row]/60.0, 0.0)
+        self.names.append(name)
+        print("Added network %s: %d links, %d not in the baseline" % (name, network.num_links,
+                                                                      int((self.link_status(name) == 1).sum())))
+
+    def diff(self, name, measure):
+        """
+        Returns the given measure for the named scenario minus the baseline, as [link, timeperiod].
+        """
+        values = getattr(self, measure)
+        return values[name] - values[self.baseline_name()]
+
+    def link_status(self, name):
+        """
+        Returns an array of link status for the named scenario relative to the baseline:
+        1 for links added by the scenario, -1 for links removed, 0 otherwise.
+        """
+        base_present = self.present[self.baseline_name()]
+        return self.present[name].astype(numpy.int64) - base_present.astype(numpy.int64)
+
+    def summarize(self, group_by='ft'):
+        """
+        Returns a pandas.DataFrame summarizing each scenario against the baseline by timeperiod and
+        the given link attribute (one of SUMMARY_GROUPS), with columns scenario, timeperiod, [group_by],
+        base VMT, scen VMT, VMT diff, base VHT, scen VHT, VHT diff, base speed, scen speed,
+        links added, links removed.
+        """
+        group_values = self.link_attrs[group_by]
+        has_group    = ~numpy.isnan(group_values)
+        groups, group_code = numpy.unique(group_values[has_group].astype(numpy.int64), return_inverse=True)
+        num_groups   = len(groups)
+
+        def group_sum(values):
+            # values[link] => sum by group
+            return numpy.bincount(group_code, weights=values[has_group], minlength=num_groups)
+
+        base        = self.baseline_name()
+        summary_list = []
+        for name in self.scenario_names():
+            status  = self.link_status(name)
+            added   = group_sum((status == 1).astype(numpy.float64))
+            removed = group_sum((status == -1).astype(numpy.float64))
+            for p_idx in range(len(LoadedNetwork.TIMEPERIODS)):
+                base_vmt = group_sum(self.vmt[base][:,p_idx])
+                scen_vmt = group_sum(self.vmt[name][:,p_idx])
+                base_vht = group_sum(self.vht[base][:,p_idx])
+                scen_vht = group_sum(self.vht[name][:,p_idx])
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    base_speed = numpy.where(base_vht > 0, base_vmt/base_vht, numpy.nan)
+                    scen_speed = numpy.where(scen_vht > 0, scen_vmt/scen_vht, numpy.nan)
+                summary_list.append(pandas.DataFrame({
+                    'scenario'     : name,
+                    'timeperiod'   : LoadedNetwork.TIMEPERIODS[p_idx],
+                    group_by       : groups,
+                    'base VMT'     : base_vmt,
+                    'scen VMT'     : scen_vmt,
+                    'VMT diff'     : scen_vmt - base_vmt,
+                    'base VHT'     : base_vht,
+                    'scen VHT'     : scen_vht,
+                    'VHT diff'     : scen_vht - base_vht,
+                    'base speed'   : base_speed,
+                    'scen speed'   : scen_speed,
+                    'links added'  : added,
+                    'links removed': removed},
+                    columns=['scenario','timeperiod',group_by,'base VMT','scen VMT','VMT diff',
+                             'base VHT','scen VHT','VHT diff','base speed','scen speed','links added','links removed']))
+        return pandas.concat(summary_list, ignore_index=True)
+
+    def link_diff_columns(self):
+        """
+        Generates the link diff columns, one at a time, for columnStore.write_columns().
+        """
+        yield ('a', self.link_attrs['a'])
+        yield ('b', self.link_attrs['b'])
+        for attr in ['ft','gl']:
+            yield (attr, self.link_attrs[attr])
+        for name in self.scenario_names():
+            for measure in ['volume','speed','vmt']:
+                diff = self.diff(name, measure)
+                for p_idx in range(len(LoadedNetwork.TIMEPERIODS)):
+                    yield ("%s_%s_diff_%s" % (name, measure, LoadedNetwork.TIMEPERIODS[p_idx]), diff[:,p_idx])
+
+def network_file_for(path, iteration):
+    """
+    Returns the loaded network csv for the given path, which is either the csv or a model run directory.
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, "hwy", "iter%d" % iteration, "avgload5period_vehclasses.csv")
+    return path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline',  type=str, help="Baseline network csv or model run directory")
+    parser.add_argument('scenarios', type=str, nargs='+', help="Scenario network csvs or model run directories")
+    parser.add_argument('--iter', type=int, default=3, help="Iteration, for model run directories")
+    parser.add_argument('--summary_file', type=str, default="network_comparison_summary.csv")
+    parser.add_argument('--link_output',  type=str, default=None, help="Column store for link diffs")
+    parser.add_argument('--use_cache',    action='store_true',
+                        help="Read the networks via column stores, written next to them if missing")
+    my_args = parser.parse_args()
+
+    # name run directories by the directory name
+    paths      = [my_args.baseline] + my_args.scenarios
+    names      = [os.path.basename(os.path.normpath(path)) if os.path.isdir(path) else os.path.normpath(path)
+                  for path in paths]
+    if len(set(names)) != len(names):
+        print("Baseline and scenarios must be distinct: %s" % str(names))
+        sys.exit(2)
+
+    network_files = [network_file_for(path, my_args.iter) for path in paths]
+    comparison    = NetworkComparison.read(network_files[0], network_files[1:], names, use_cache=my_args.use_cache)
+
+    summary_df = pandas.concat([comparison.summarize(group_by) for group_by in NetworkComparison.SUMMARY_GROUPS],
+                               ignore_index=True)
+    summary_df.to_csv(my_args.summary_file, index=False)
+    print("Wrote %s" % my_args.summary_file)
+
+    if my_args.link_output:
+        columnStore.write_columns(my_args.link_output, comparison.link_diff_columns())
+        print("Wrote %s" % my_args.link_output)
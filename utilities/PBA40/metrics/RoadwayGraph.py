@@ -0,0 +1,225 @@
+import argparse, heapq, multiprocessing, os, sys, time
+import numpy, pandas
+from LoadedNetwork import LoadedNetwork
+
+USAGE = """
+
+  python RoadwayGraph.py [--timeperiods EA,AM,MD,PM,EV] [--processes 4] [--output_dir network_skims]
+                         [--zones 1475] [--internal_zones 1454] network_csv
+
+  Skims the loaded roadway network (avgload5period_vehclasses.csv) with shortest paths by congested time,
+  without running HwySkims.job, for sanity-checking skims and for screening network edits.
+
+  For each timeperiod, writes [output_dir]\\TimeSkimsDatabase[timeperiod].csv and DistanceSkimsDatabase[timeperiod].csv
+  in the format written by SkimsDatabase.job (orig, dest, then a column per path type, internal zones only),
+  so they can be compared directly to database\\TimeSkimsDatabase[timeperiod].csv etc.  The path types are:
+  * da     : the shortest path by congested time avoiding value toll links (tollclass >= 11)
+  * daToll : the shortest path by congested time using any link
+
+  As in HwySkims.job, paths don't pass through zones, and the intrazonal value is half of the value to the
+  nearest zone.  As in SkimsDatabase.job, the time includes the destination TERMINAL time from landuse\\tazData.csv
+  (if it has that column).  Unlike HwySkims.job, paths minimize congested time rather than generalized cost
+  (the network csv doesn't have tolls), and HOV-only links (USE) can't be excluded.
+  Origin-destination pairs without a path are written as -999.0.
+
+  Shortest paths are computed one origin at a time, with the origins split across processes.
+
+"""
+
+# path type => whether value toll links are excluded
+PATH_TYPES       = [('da', True), ('daToll', False)]
+UNREACHABLE      = -999.0
+
+class RoadwayGraph(object):
+    """
+    The loaded roadway network as a directed graph in compressed sparse row form, where the out-links
+    of node index n are edges indptr[n] through indptr[n+1]-1.
+
+    * nodes[node index]  : node number, sorted
+    * indptr[node index] : first edge for the node
+    * heads[edge]        : node index of the edge's b node
+    * edge_link[edge]    : the link (row) in the LoadedNetwork
+    * zone_index[zone-1] : node index for each zone (1 through num_zones), or -1 if the zone isn't in the network
+    """
+
+    def __init__(self, network, num_zones):
+        """
+        Parameters
+        ----------
+        network : LoadedNetwork
+            The loaded network, read with distance (and tollclass, to exclude value toll links).
+        num_zones : int
+            Nodes 1 through num_zones are zones, which paths can start or end at but not pass through.
+        """
+        self.network     = network
+        self.num_zones   = num_zones
+        (self.nodes, node_idx) = numpy.unique(numpy.concatenate([network.a, network.b]), return_inverse=True)
+        self.num_nodes   = len(self.nodes)
+        tails            = node_idx[:network.num_links]
+
+        order            = numpy.argsort(tails, kind='mergesort')
+        self.edge_link   = order
+        self.heads       = node_idx[network.num_links:][order]
+        self.indptr      = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(tails, minlength=self.num_nodes))])
+
+        zones            = numpy.arange(1, num_zones+1)
+        pos              = numpy.minimum(numpy.searchsorted(self.nodes, zones), self.num_nodes-1)
+        self.zone_index  = numpy.where(self.nodes[pos] == zones, pos, -1)
+        # paths may not pass through zones
+        self.through     = (self.nodes > num_zones)
+
+    def edge_values(self, link_values):
+        """
+        Returns the given per-link values (e.g. network.distance) in edge order.
+        """
+        return link_values[self.edge_link]
+
+    def value_toll_edges(self):
+        """
+        Returns True for edges on value toll links (tollclass >= FIRST_VALUE_TOLLCLASS).
+        """
+        if 'tollclass' not in self.network.link_attrs:
+            return numpy.zeros(len(self.edge_link), dtype=bool)
+        return self.edge_values(self.network.link_attrs['tollclass']) >= LoadedNetwork.FIRST_VALUE_TOLLCLASS
+
+    def skim(self, timeperiod, exclude_value_toll=False, processes=1):
+        """
+        Returns (time, distance) skims as [orig zone-1, dest zone-1] for the shortest paths by congested time
+        in the given timeperiod.  Pairs without a path are NaN.  Intrazonal values are half the nearest zone's.
+        """
+        cost     = self.edge_values(self.network.ctim[:, LoadedNetwork.timeperiod_index([timeperiod])[0]])
+        distance = self.edge_values(self.network.distance)
+        if exclude_value_toll:
+            cost = numpy.where(self.value_toll_edges(), numpy.inf, cost)
+        graph    = (self.indptr, self.heads, cost, distance, self.through, self.zone_index)
+
+        origins  = [zone_idx for zone_idx in range(self.num_zones) if self.zone_index[zone_idx] >= 0]
+        batches  = [origins[start::max(processes,1)*4] for start in range(max(processes,1)*4)]
+        batches  = [batch for batch in batches if len(batch) > 0]
+        if processes > 1:
+            pool    = multiprocessing.Pool(processes, initializer=init_worker, initargs=(graph,))
+            results = pool.map(skim_origins, batches)
+            pool.close()
+            pool.join()
+        else:
+            init_worker(graph)
+            results = [skim_origins(batch) for batch in batches]
+
+        time_skim = numpy.full((self.num_zones, self.num_zones), numpy.nan)
+        dist_skim = numpy.full((self.num_zones, self.num_zones), numpy.nan)
+        for (batch, (batch_time, batch_dist)) in zip(batches, results):
+            time_skim[batch,:] = batch_time
+            dist_skim[batch,:] = batch_dist
+
+        # intrazonal: half the nearest zone (by time)
+        zone_range = numpy.arange(self.num_zones)
+        time_skim[zone_range, zone_range] = numpy.inf
+        nearest    = numpy.argmin(numpy.where(numpy.isnan(time_skim), numpy.inf, time_skim), axis=1)
+        has_nearest = numpy.isfinite(time_skim[zone_range, nearest])
+        time_skim[zone_range, zone_range] = numpy.where(has_nearest, 0.5*time_skim[zone_range, nearest], numpy.nan)
+        dist_skim[zone_range, zone_range] = numpy.where(has_nearest, 0.5*dist_skim[zone_range, nearest], numpy.nan)
+        return (time_skim, dist_skim)
+
+# the graph for the worker processes, set by init_worker()
+worker_graph = None
+
+def init_worker(graph):
+    """
+    Sets the graph used by skim_origins(), as Python lists for fast scalar access.
+    """
+    global worker_graph
+    (indptr, heads, cost, distance, through, zone_index) = graph
+    worker_graph = (indptr.tolist(), heads.tolist(), cost.tolist(), distance.tolist(), through.tolist(), zone_index)
+
+def shortest_paths(origin, indptr, heads, cost, distance, through):
+    """
+    Dijkstra's algorithm from node index origin.  Returns (path cost, path distance) lists by node index,
+    with None for nodes that can't be reached.  Nodes where through is False are not passed through.
+    """
+    num_nodes = len(indptr) - 1
+    best      = [None]*num_nodes
+    best_dist = [None]*num_nodes
+    done      = [False]*num_nodes
+    best[origin]      = 0.0
+    best_dist[origin] = 0.0
+    heap      = [(0.0, origin)]
+    while heap:
+        (node_cost, node) = heapq.heappop(heap)
+        if done[node]: continue
+        done[node] = True
+        if node != origin and not through[node]: continue
+        node_dist = best_dist[node]
+        for edge in range(indptr[node], indptr[node+1]):
+            head      = heads[edge]
+            head_cost = node_cost + cost[edge]
+            if done[head] or head_cost == float('inf'): continue
+            if best[head] is None or head_cost < best[head]:
+                best[head]      = head_cost
+                best_dist[head] = node_dist + distance[edge]
+                heapq.heappush(heap, (head_cost, head))
+    return (best, best_dist)
+
+def skim_origins(origins):
+    """
+    Skims the given origin zones (zone-1) using worker_graph.  Returns (time, distance) as [origin, dest zone-1].
+    """
+    (indptr, heads, cost, distance, through, zone_index) = worker_graph
+    dest_nodes = numpy.where(zone_index >= 0, zone_index, 0)
+    time_skim  = numpy.full((len(origins), len(zone_index)), numpy.nan)
+    dist_skim  = numpy.full((len(origins), len(zone_index)), numpy.nan)
+    for o_idx in range(len(origins)):
+        (best, best_dist) = shortest_paths(int(zone_index[origins[o_idx]]), indptr, heads, cost, distance, through)
+        best      = numpy.array([numpy.nan if value is None else value for value in best])
+        best_dist = numpy.array([numpy.nan if value is None else value for value in best_dist])
+        time_skim[o_idx] = numpy.where(zone_index >= 0, best[dest_nodes], numpy.nan)
+        dist_skim[o_idx] = numpy.where(zone_index >= 0, best_dist[dest_nodes], numpy.nan)
+    return (time_skim, dist_skim)
+
+def write_skims_database(outfile, skims, num_zones):
+    """
+    Writes the given skims, a list of (column name, skim [orig zone-1, dest zone-1]), for zones 1 through num_zones
+    in the format of SkimsDatabase.job.
+    """
+    orig, dest = numpy.indices((num_zones, num_zones))
+    skims_df   = pandas.DataFrame({'orig':orig.ravel()+1, 'dest':dest.ravel()+1}, columns=['orig','dest'])
+    for (column, skim) in skims:
+        skims_df[column] = numpy.where(numpy.isnan(skim[:num_zones,:num_zones]), UNREACHABLE, skim[:num_zones,:num_zones]).ravel()
+    skims_df.to_csv(outfile, index=False, float_format='%.2f')
+    print("Wrote %s" % outfile)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('network_csv', type=str, help="Loaded network with congested times")
+    parser.add_argument('--timeperiods', type=str, default=",".join(LoadedNetwork.TIMEPERIODS))
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--output_dir', type=str, default="network_skims")
+    parser.add_argument('--zones', type=int, default=1475, help="Number of zones, including external zones")
+    parser.add_argument('--internal_zones', type=int, default=1454, help="Number of internal zones, which are written")
+    parser.add_argument('--tazdata', type=str, default=os.path.join("landuse","tazData.csv"))
+    my_args = parser.parse_args()
+
+    network = LoadedNetwork.read(my_args.network_csv, link_attributes=['distance','tollclass'])
+    graph   = RoadwayGraph(network, my_args.zones)
+    print("Built graph with %d nodes and %d links; %d of %d zones are in the network" %
+          (graph.num_nodes, network.num_links, (graph.zone_index >= 0).sum(), my_args.zones))
+
+    terminal = numpy.zeros(my_args.zones)
+    if os.path.exists(my_args.tazdata):
+        tazdata_df = pandas.read_csv(my_args.tazdata)
+        if 'TERMINAL' in tazdata_df.columns:
+            tazdata_df = tazdata_df.loc[tazdata_df['ZONE'] <= my_args.zones]
+            terminal[tazdata_df['ZONE'].values - 1] = tazdata_df['TERMINAL'].values
+    if not terminal.any(): print("No TERMINAL times in %s; skim times won't include them" % my_args.tazdata)
+
+    if not os.path.exists(my_args.output_dir): os.makedirs(my_args.output_dir)
+    for timeperiod in my_args.timeperiods.split(","):
+        time_skims = []
+        dist_skims = []
+        for (path_type, exclude_value_toll) in PATH_TYPES:
+            start_time = time.time()
+            (time_skim, dist_skim) = graph.skim(timeperiod, exclude_value_toll, my_args.processes)
+            print("Skimmed %s %s in %.1f seconds" % (timeperiod, path_type, time.time() - start_time))
+            time_skims.append((path_type, time_skim + terminal[numpy.newaxis,:]))
+            dist_skims.append((path_type, dist_skim))
+        write_skims_database(os.path.join(my_args.output_dir, "TimeSkimsDatabase%s.csv" % timeperiod), time_skims, my_args.internal_zones)
+        write_skims_database(os.path.join(my_args.output_dir, "DistanceSkimsDatabase%s.csv" % timeperiod), dist_skims, my_args.internal_zones)
@@ -1,5 +1,6 @@
 import argparse
 import collections
+import copy
 import operator
 import os
 import re
@@ -8,6 +9,7 @@ import sys
 
 import pandas as pd     # yay for DataFrames and Series!
 import numpy
+from LoadedNetwork import LoadedNetwork
 import xlsxwriter       # for writing workbooks -- formatting is better than openpyxl
 from xlsxwriter.utility import xl_range, xl_rowcol_to_cell
 pd.set_option('display.precision',10)
@@ -55,6 +57,9 @@ class RunResults:
       'Net Annual Costs'              :'millions of $2017',
     }
 
+    # Link attributes needed from the roadway network (avgload5period_vehclasses.csv) for truck costs
+    ROADWAY_LINK_ATTRIBUTES     = ['distance','smtropc','lrtropc']
+
     # Do these ever change?  Should they go into BC_config.csv?
     YEARLY_AUTO_TRIPS_PER_AUTO  = 1583
 
@@ -285,46 +290,20 @@ class RunResults:
         # print self.unique_active_travelers
 
         # read roadway network for truck costs
-        roadway_read    = False
-
-        # on M
-        roadway_netfile = os.path.abspath(os.path.join(self.rundir, "..", "avgload5period_vehclasses.csv"))
-        if os.path.exists(roadway_netfile):
-            self.roadways_df = pd.read_table(roadway_netfile, sep=",")
-            print "Read roadways from %s" % roadway_netfile
-            roadway_read = True
-
-        # on model machine for reading baseline
-        if not roadway_read:
-            roadway_netfile = os.path.abspath(os.path.join(self.rundir, "..", "extractor", "avgload5period_vehclasses.csv"))
-            if os.path.exists(roadway_netfile):
-                self.roadways_df = pd.read_table(roadway_netfile, sep=",")
-                print "Read roadways from %s" % roadway_netfile
-                roadway_read = True
-
-        # on model machine for reading non-baseline
-        if not roadway_read:
+        # on M, or on model machine for reading baseline (extractor) or non-baseline (hwy/iterX)
+        roadway_netfile = LoadedNetwork.find_network_file(self.rundir, os.environ.get('ITER'))
+        if not roadway_netfile:
+            print "Could not find roadway network avgload5period_vehclasses.csv for %s" % self.rundir
             if 'ITER' not in os.environ:
-                print "Could not find roadway network in %s" % roadway_netfile
-                print "So looking in hwy/iterX but ITER isn't in the environment."
-                sys.exit(2)
-
-            roadway_netfile = os.path.abspath(os.path.join(self.rundir, "..", "hwy", "iter%s" % os.environ['ITER'], "avgload5period_vehclasses.csv"))
-            self.roadways_df = pd.read_table(roadway_netfile, sep=",")
-            print "Read roadways from %s" % roadway_netfile
-            roadway_read = True
-
-        # aggregate truck volumes
-        self.roadways_df['small truck volume'] = self.roadways_df.volEA_sm + self.roadways_df.volEA_smt + \
-                                                 self.roadways_df.volAM_sm + self.roadways_df.volAM_smt + \
-                                                 self.roadways_df.volMD_sm + self.roadways_df.volMD_smt + \
-                                                 self.roadways_df.volPM_sm + self.roadways_df.volPM_smt + \
-                                                 self.roadways_df.volEV_sm + self.roadways_df.volEV_smt
-        self.roadways_df['large truck volume'] = self.roadways_df.volEA_hv + self.roadways_df.volEA_hvt + \
-                                                 self.roadways_df.volAM_hv + self.roadways_df.volAM_hvt + \
-                                                 self.roadways_df.volMD_hv + self.roadways_df.volMD_hvt + \
-                                                 self.roadways_df.volPM_hv + self.roadways_df.volPM_hvt + \
-                                                 self.roadways_df.volEV_hv + self.roadways_df.volEV_hvt
+                print "Also looked in hwy/iterX but ITER isn't in the environment."
+            sys.exit(2)
+
+        self.roadway_network = LoadedNetwork.read(roadway_netfile, link_attributes=RunResults.ROADWAY_LINK_ATTRIBUTES)
+        print "Read roadways from %s" % roadway_netfile
+
+        # aggregate truck volumes, by link
+        self.small_truck_volume = self.roadway_network.vehclass_volume(LoadedNetwork.SMALL_TRUCK_VEHCLASSES).sum(axis=1)
+        self.large_truck_volume = self.roadway_network.vehclass_volume(LoadedNetwork.LARGE_TRUCK_VEHCLASSES).sum(axis=1)
 
         for filename in ['mandatoryAccessibilities', 'nonMandatoryAccessibilities']:
             accessibilities = \
@@ -363,9 +342,15 @@ class RunResults:
                                          inplace=True)
 
 
-    def createBaseRunResults(self):
+    def createBaseRunResults(self, base_results_cache=None):
         """
         Create instance of RunResults representing the base, if applicable.
+
+        Parameters
+        ----------
+        base_results_cache : dict
+            Optional cache of base RunResults by normalized base_dir, shared by projects run in one process
+            (see runCobraForRunSet.py) so that each base is read once.
         """
         try:
             self.base_dir     = self.config.loc['base_dir']
@@ -385,8 +370,34 @@ class RunResults:
 
             print self.base_dir
             print base_overwrite_config
-            self.base_results = RunResults(rundir = self.base_dir,
-                                           overwrite_config=base_overwrite_config)
+            if base_results_cache is None:
+                self.base_results = RunResults(rundir = self.base_dir,
+                                               overwrite_config=base_overwrite_config)
+                return
+
+            # so the same base written with different case or separators is read once
+            base_key = os.path.normcase(os.path.abspath(self.base_dir))
+            if base_key not in base_results_cache:
+                base_results_cache[base_key] = RunResults(rundir = self.base_dir,
+                                                          overwrite_config=base_overwrite_config)
+            else:
+                print "Using base results already read from %s" % self.base_dir
+            self.base_results = base_results_cache[base_key].copyForProject(base_overwrite_config)
+
+    def copyForProject(self, overwrite_config):
+        """
+        Returns a copy of this base RunResults for use as the base of another project, with the
+        given config overwritten.  The copy shares the input data read by __init__(), which
+        the metric calculations don't modify; only the config and the calculated metrics are its own.
+        """
+        base_results = copy.copy(self)
+        base_results.config = self.config.copy()
+        for key in overwrite_config.keys(): base_results.config[key] = overwrite_config[key]
+
+        # these are set by the project and by calculateDailyMetrics()
+        for attr in ['ovtt_adjustment', 'daily_results', 'daily_category_results', 'lil_cats', 'quick_summary']:
+            if attr in base_results.__dict__: delattr(base_results, attr)
+        return base_results
 
     def updateDailyMetrics(self):
         """
@@ -437,22 +448,30 @@ class RunResults:
         cat1            = 'Travel Cost'
         cat2            = 'Operating Costs'
         # override the truck vmt with base truck vmt, with pct change auto vmt applied
-        self.roadways_df = pd.merge(left=self.roadways_df,
-                                    right=self.base_results.roadways_df[['a','b','small truck volume','large truck volume']],
-                                    how='left', on=['a','b'], suffixes=(' scenario',' baseline'))
-        self.roadways_df['small truck volume'] = self.roadways_df['small truck volume baseline']*(1.0+pct_change_vmt)
-        self.roadways_df['large truck volume'] = self.roadways_df['large truck volume baseline']*(1.0+pct_change_vmt)
+        # links not in the baseline network have no truck volume (nan)
+        base_rows = self.base_results.roadway_network.row_index(self.roadway_network.a, self.roadway_network.b)
+        self.small_truck_volume = numpy.where(base_rows >= 0, self.base_results.small_truck_volume[base_rows], numpy.nan)*(1.0+pct_change_vmt)
+        self.large_truck_volume = numpy.where(base_rows >= 0, self.base_results.large_truck_volume[base_rows], numpy.nan)*(1.0+pct_change_vmt)
         # calculate the new truck cost with these assumed truck VMTs
-        self.roadways_df['total truck cost']   = (self.roadways_df['small truck volume']*self.roadways_df['smtropc']*self.roadways_df['distance']*0.01) + \
-                                                 (self.roadways_df['large truck volume']*self.roadways_df['lrtropc']*self.roadways_df['distance']*0.01)
+        total_truck_cost = self.totalTruckCost()
 
-        self.daily_results[                cat1,           cat2,       'Truck ($2000) - Computed'] = self.roadways_df['total truck cost'].sum()
-        self.daily_results['Travel Time & Cost','Non-Household','Cost - Truck ($2000) - Computed'] = self.roadways_df['total truck cost'].sum()
+        self.daily_results[                cat1,           cat2,       'Truck ($2000) - Computed'] = total_truck_cost
+        self.daily_results['Travel Time & Cost','Non-Household','Cost - Truck ($2000) - Computed'] = total_truck_cost
 
         cat1            = 'Collisions, Active Transport & Noise'
         cat2            = 'Noise'
         self.daily_results[cat1,cat2,'Truck VMT - Computed'] = (1.0+pct_change_vmt)*base_truck_vmt
 
+    def totalTruckCost(self):
+        """
+        Returns the total daily truck operating cost ($2000) on the roadway network, from the
+        link truck volumes (small_truck_volume, large_truck_volume) and the link opcosts.
+        smtropc,lrtropc are total opcosts for trucks, in 2000 cents per mile.
+        """
+        distance = self.roadway_network.distance
+        return numpy.nansum((self.small_truck_volume*self.roadway_network.link_attrs['smtropc']*distance*0.01) + \
+                            (self.large_truck_volume*self.roadway_network.link_attrs['lrtropc']*distance*0.01))
+
     def parseNumList(self, numlist_str):
         """
         Parses a number list of the format 1,4,6,10-14,23 into a list of numbers.
@@ -636,10 +655,8 @@ class RunResults:
         daily_results[(cat1,cat2,'Cost - Auto ($2000) - AirPax' )] = \
             0.01*auto_byclass.loc[['da_air','datoll_air','sr2_air','sr2toll_air','sr3_air','sr3toll_air'],'Total Cost'].sum()
         # get this from the roadway network.
-        # smtropc,lrtropc are total opcosts for trucks, in 2000 cents per mile
-        self.roadways_df['total truck cost'] = (self.roadways_df['small truck volume']*self.roadways_df['smtropc']*self.roadways_df['distance']*0.01) + \
-                                               (self.roadways_df['large truck volume']*self.roadways_df['lrtropc']*self.roadways_df['distance']*0.01)
-        daily_results[(cat1,cat2,'Cost - Truck ($2000) - Computed')] = self.roadways_df['total truck cost'].sum()
+        total_truck_cost = self.totalTruckCost()
+        daily_results[(cat1,cat2,'Cost - Truck ($2000) - Computed')] = total_truck_cost
 
         daily_results[(cat1,cat2,'Time - Auto (PHT) - IX/EX' )] = \
             auto_byclass.loc[['da_ix','datoll_ix','sr2_ix','sr2toll_ix','sr3_ix','sr3toll_ix'],'Person Minutes'].sum()/60.0
@@ -765,8 +782,8 @@ class RunResults:
             0.01*auto_byclass.loc[['da_air','datoll_air','sr2_air','sr2toll_air','sr3_air','sr3toll_air'],'Total Cost'].sum()
 
         # computed will get overwritten if base results
-        daily_results[(cat1,cat2,'Truck ($2000) - Computed')] = self.roadways_df['total truck cost'].sum()
-        daily_results[(cat1,cat2,'Truck ($2000) - Modeled')]  = self.roadways_df['total truck cost'].sum()
+        daily_results[(cat1,cat2,'Truck ($2000) - Computed')] = total_truck_cost
+        daily_results[(cat1,cat2,'Truck ($2000) - Modeled')]  = total_truck_cost
 
         # Parking
         cat2            = 'Trips (Reference)'
@@ -1377,24 +1394,23 @@ class RunResults:
                                {'x_scale':0.1, 'y_scale':0.1})
         return bc_metrics
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(usage=USAGE)
-    parser.add_argument('project_dir',
-                        help="The directory with the run results csvs.")
-    parser.add_argument('all_projects_dir',
-                        help="The directory in which to write the Benefit/Cost summary Series")
-    parser.add_argument('--bcconfig',
-                        help="The configuration filename in project_dir",
-                        required=False, default='BC_config.csv')
-    args = parser.parse_args(sys.argv[1:])
+def runProject(project_dir, all_projects_dir, bcconfig='BC_config.csv', base_results_cache=None):
+    """
+    Processes the run results in project_dir against its base, if any, and writes the
+    benefit/cost workbook, csv and quick summary.  Returns the RunResults.
 
-    rr = RunResults(args.project_dir, args.bcconfig)
-    rr.createBaseRunResults()
+    Parameters
+    ----------
+    base_results_cache : dict
+        Optional cache of base RunResults by base_dir, so projects sharing a base read it once.
+    """
+    rr = RunResults(project_dir, bcconfig)
+    rr.createBaseRunResults(base_results_cache)
 
     rr.calculateDailyMetrics()
 
     # save the quick summary
-    quicksummary_csv = os.path.join(args.all_projects_dir, "quicksummary_%s.csv"  % rr.config.loc['Project ID'])
+    quicksummary_csv = os.path.join(all_projects_dir, "quicksummary_%s.csv"  % rr.config.loc['Project ID'])
     rr.quick_summary.to_csv(quicksummary_csv, float_format='%.5f')
     print rr.quick_summary
 
@@ -1402,4 +1418,18 @@ if __name__ == '__main__':
         rr.base_results.calculateDailyMetrics()
         rr.updateDailyMetrics()
 
-    rr.calculateBenefitCosts(args.project_dir, args.all_projects_dir)
+    rr.calculateBenefitCosts(project_dir, all_projects_dir)
+    return rr
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(usage=USAGE)
+    parser.add_argument('project_dir',
+                        help="The directory with the run results csvs.")
+    parser.add_argument('all_projects_dir',
+                        help="The directory in which to write the Benefit/Cost summary Series")
+    parser.add_argument('--bcconfig',
+                        help="The configuration filename in project_dir",
+                        required=False, default='BC_config.csv')
+    args = parser.parse_args(sys.argv[1:])
+
+    runProject(args.project_dir, args.all_projects_dir, args.bcconfig)
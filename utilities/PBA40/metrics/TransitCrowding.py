@@ -0,0 +1,165 @@
+import argparse, os
+import numpy, pandas
+from TransitRidership import TransitRidership
+
+USAGE = """
+
+  python TransitCrowding.py [--trn_dir trn] [--modes_file reference-transit-modes.csv]
+                            [--standing_factor 1.5] [--capacity_file INPUT\\metrics\\transitCapacityLookup.csv]
+                            [--output_dir metrics] [--segments]
+
+  Summarizes transit crowding from the transit assignment (the transit link cube, see transitAssignment.py).
+  For every line segment and timeperiod, the vehicle load is the passenger volume (AB_VOL) divided by the
+  vehicle runs in the timeperiod (from FREQ), and the load factors are the vehicle load over the vehicle's
+  seated and total (seated plus standing) capacity.
+
+  Vehicle capacities are by line-haul mode number.  The seated capacity is the Seats column of the modes_file,
+  model-files\\scripts\\core_summaries\\reference-transit-modes.csv, and the total capacity is the seated
+  capacity times the standing_factor.  Both can be overridden for any mode by the capacity_file, if it exists,
+  with columns MODE, seated_capacity, total_capacity.  Modes without Seats have no load factors.
+
+  Writes to output_dir:
+  * transit_crowding.csv                   : by mode type and timeperiod, passenger miles, passenger miles over
+                                             seated and over total capacity, and the highest load factor
+  * transit_crowding_peak_load_points.csv  : for each line and timeperiod, the segment with the highest vehicle load
+  * transit_crowding_segments.csv          : with --segments, the vehicle load and load factors for every segment
+
+"""
+
+class TransitCrowding(object):
+    """
+    Vehicle loads and load factors for every transit line segment and timeperiod of a TransitRidership.
+
+    * vehicle_load[segment]       : passengers per vehicle, AB_VOL / runs
+    * seated_capacity[segment]    : seats per vehicle
+    * total_capacity[segment]     : seated plus standing capacity per vehicle
+    * seated_load_factor[segment] : vehicle_load / seated_capacity
+    * load_factor[segment]        : vehicle_load / total_capacity
+    """
+    CAPACITY_FILE = "transitCapacityLookup.csv"
+
+    # total (seated plus standing) capacity per seat, for every mode.  The modes_file has seats only; 1.5 is
+    # a common planning standard for the most passengers per seat before a vehicle is crowded.
+    STANDING_FACTOR = 1.5
+
+    def __init__(self, ridership, modes_file=TransitRidership.MODES_FILE, standing_factor=STANDING_FACTOR,
+                 capacity_file=None):
+        """
+        Parameters
+        ----------
+        ridership : TransitRidership
+            The transit line segments with their vehicle runs.
+        modes_file : string
+            The mode reference csv with columns mode, Seats.
+        standing_factor : float
+            The total capacity per seat.
+        capacity_file : string
+            Optional csv with columns MODE, seated_capacity, total_capacity overriding the modes_file capacities.
+        """
+        self.ridership = ridership
+        (seated_by_mode, total_by_mode) = TransitCrowding.read_capacity(modes_file, standing_factor, capacity_file)
+
+        modes                   = ridership.segments_df['MODE'].values
+        self.seated_capacity    = seated_by_mode[modes]
+        self.total_capacity     = total_by_mode[modes]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            self.vehicle_load   = numpy.where(ridership.runs > 0, ridership.segments_df['AB_VOL'].values/ridership.runs, 0.0)
+        self.seated_load_factor = self.vehicle_load/self.seated_capacity
+        self.load_factor        = self.vehicle_load/self.total_capacity
+
+    @staticmethod
+    def read_capacity(modes_file=TransitRidership.MODES_FILE, standing_factor=STANDING_FACTOR, capacity_file=None):
+        """
+        Returns (seated_capacity[mode], total_capacity[mode]) for modes 0 through TransitRidership.MAX_MODE, from the
+        Seats in the modes_file and the standing_factor, overridden by the capacity_file, if given and it exists.
+        Modes without a capacity are NaN.
+        """
+        seated = numpy.full(TransitRidership.MAX_MODE+1, numpy.nan)
+        modes_df = pandas.read_csv(modes_file, sep=",")
+        modes_df = modes_df.loc[pandas.notnull(modes_df['Seats'])]
+        seated[modes_df['mode'].values.astype(numpy.int64)] = modes_df['Seats'].values
+        total  = seated*standing_factor
+        print("Read %d mode seated capacities from %s" % (len(modes_df), modes_file))
+
+        if capacity_file and os.path.exists(capacity_file):
+            capacity_df = pandas.read_csv(capacity_file, sep=",")
+            modes       = capacity_df['MODE'].values.astype(numpy.int64)
+            seated[modes] = capacity_df['seated_capacity'].values
+            total [modes] = capacity_df['total_capacity'].values
+            print("Read %d mode capacities from %s" % (len(capacity_df), capacity_file))
+        return (seated, total)
+
+    def segment_summary(self):
+        """
+        Returns a pandas.DataFrame with a row per line segment and timeperiod, with the vehicle runs, load and load factors.
+        """
+        segments_df = self.ridership.segments_df[['MODE','NAME','SEQ','A','B','timeperiod','AB_VOL']].copy()
+        segments_df['runs'              ] = self.ridership.runs
+        segments_df['vehicle_load'      ] = self.vehicle_load
+        segments_df['seated_capacity'   ] = self.seated_capacity
+        segments_df['total_capacity'    ] = self.total_capacity
+        segments_df['seated_load_factor'] = self.seated_load_factor
+        segments_df['load_factor'       ] = self.load_factor
+        return segments_df
+
+    def peak_load_points(self):
+        """
+        Returns the segment_summary() row with the highest vehicle load for each line and timeperiod.
+        """
+        segments_df = self.segment_summary()
+        segments_df['timeperiod_code'] = segments_df['timeperiod'].cat.codes
+        line_period = segments_df.groupby(['MODE','NAME','timeperiod_code']).ngroup().values
+        # sort by line/timeperiod then load; the last of each line/timeperiod is its peak
+        order       = numpy.lexsort((self.vehicle_load, line_period))
+        last        = numpy.ones(len(order), dtype=bool)
+        last[:-1]   = line_period[order][1:] != line_period[order][:-1]
+        peak_df     = segments_df.iloc[order[last]].sort_values(['MODE','NAME','timeperiod_code'])
+        return peak_df.drop('timeperiod_code', axis=1).reset_index(drop=True)
+
+    def mode_summary(self):
+        """
+        Returns a pandas.DataFrame with a row per mode type (see TransitRidership.MODE_TYPES) and timeperiod with
+        the passenger miles traveled, those over seated and total capacity, and the highest load factors.
+        """
+        pmt         = self.ridership.pmt
+        summary_df  = pandas.DataFrame({'Transit mode'                       :TransitRidership.mode_type(self.ridership.segments_df['MODE'].values),
+                                        'timeperiod'                         :self.ridership.segments_df['timeperiod'].astype(str).values,
+                                        'Passenger Miles Traveled'           :pmt,
+                                        'Passenger Miles Over Seated Capacity':numpy.where(self.seated_load_factor > 1.0, pmt, 0.0),
+                                        'Passenger Miles Over Total Capacity' :numpy.where(self.load_factor > 1.0, pmt, 0.0),
+                                        'Max Seated Load Factor'             :self.seated_load_factor,
+                                        'Max Load Factor'                    :self.load_factor})
+        summary_df  = summary_df.groupby(['Transit mode','timeperiod']).agg({'Passenger Miles Traveled'            :'sum',
+                                                                             'Passenger Miles Over Seated Capacity':'sum',
+                                                                             'Passenger Miles Over Total Capacity' :'sum',
+                                                                             'Max Seated Load Factor'              :'max',
+                                                                             'Max Load Factor'                     :'max'})
+        return summary_df[['Passenger Miles Traveled','Passenger Miles Over Seated Capacity','Passenger Miles Over Total Capacity',
+                           'Max Seated Load Factor','Max Load Factor']].reset_index()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trn_dir', type=str, default="trn")
+    parser.add_argument('--modes_file', type=str, default=TransitRidership.MODES_FILE)
+    parser.add_argument('--standing_factor', type=float, default=TransitCrowding.STANDING_FACTOR,
+                        help="Total capacity per seat")
+    parser.add_argument('--capacity_file', type=str, default=os.path.join("INPUT","metrics",TransitCrowding.CAPACITY_FILE))
+    parser.add_argument('--output_dir', type=str, default="metrics")
+    parser.add_argument('--segments', action='store_true', help="Also write the load factors for every segment")
+    my_args = parser.parse_args()
+
+    crowding = TransitCrowding(TransitRidership.read(my_args.trn_dir), my_args.modes_file, my_args.standing_factor,
+                               my_args.capacity_file)
+
+    outfile = os.path.join(my_args.output_dir, "transit_crowding.csv")
+    crowding.mode_summary().to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    outfile = os.path.join(my_args.output_dir, "transit_crowding_peak_load_points.csv")
+    crowding.peak_load_points().to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    if my_args.segments:
+        outfile = os.path.join(my_args.output_dir, "transit_crowding_segments.csv")
+        crowding.segment_summary().to_csv(outfile, index=False)
+        print("Wrote %s" % outfile)
@@ -0,0 +1,122 @@
+import os
+import numpy, pandas
+import transitAssignment
+
+USAGE = """
+
+  Not run directly.  Computes daily transit ridership by line and by mode type from the transit assignment
+  (the transit link cube, see transitAssignment.read_transit_cube()), the way quickboards summarizes lines.
+
+  e.g.
+    ridership = TransitRidership.read("trn")
+    lines_df  = ridership.line_summary()
+    modes_df  = ridership.mode_summary()
+
+"""
+
+class TransitRidership(object):
+    """
+    Transit line segments for every timeperiod, with the passenger and vehicle measures for each segment:
+
+    * boardings : AB_BRDA, passengers boarding at the segment's A node
+    * pmt       : passenger miles traveled, AB_VOL x DIST (DIST is in hundredths of miles)
+    * pht       : passenger hours traveled, AB_VOL x TIME (TIME is in hundredths of minutes)
+    * runs      : vehicle runs in the timeperiod, 60 x timeperiod hours / FREQ
+    * vmt       : vehicle miles traveled, runs x DIST
+    """
+    # Line-haul modes http://analytics.mtc.ca.gov/foswiki/Main/TransitNetworkCoding
+    # modes below FIRST_LINE_MODE are support links (walk, drive, transfer)
+    FIRST_LINE_MODE  = 10
+    # mode types, split at the MODE_TYPE_BOUNDS: modes below 80 are loc, 80-99 are exp, etc
+    MODE_TYPES       = ['loc','exp','lrf','hvy','com']
+    MODE_TYPE_BOUNDS = [80, 100, 120, 130]
+    # arrays by mode number are for modes 0 through MAX_MODE
+    MAX_MODE         = 200
+    # mode reference with columns Name, mode, Aggregate Mode and Seats, relative to the model run directory;
+    # model-files\\scripts\\core_summaries\\reference-transit-modes.csv
+    MODES_FILE       = os.path.join("CTRAMP","scripts","core_summaries","reference-transit-modes.csv")
+
+    LINE_COLUMNS     = ['Daily Boardings','Daily Passenger Miles Traveled','Daily Passenger Hours Traveled',
+                        'Daily Vehicle Runs','Daily Vehicle Miles Traveled','Peak Load','Peak Load per Run']
+
+    def __init__(self, cube_df):
+        """
+        Parameters
+        ----------
+        cube_df : pandas.DataFrame
+            The transit link cube, with MODE, NAME, SEQ, A, B, timeperiod, DIST, TIME, FREQ, AB_VOL and AB_BRDA.
+        """
+        segments_df = cube_df.loc[cube_df['MODE'] >= TransitRidership.FIRST_LINE_MODE].reset_index(drop=True)
+        self.segments_df = segments_df
+
+        hours     = segments_df['timeperiod'].astype(str).map(transitAssignment.TIMEPERIOD_HOURS).values
+        freq      = segments_df['FREQ'].values
+        volume    = segments_df['AB_VOL'].values
+        with numpy.errstate(divide='ignore'):
+            self.runs = numpy.where(freq > 0, 60.0*hours/freq, 0.0)
+        self.boardings = segments_df['AB_BRDA'].values
+        self.pmt       = volume*segments_df['DIST'].values/100.0
+        self.pht       = volume*segments_df['TIME'].values/100.0/60.0
+        self.vmt       = self.runs*segments_df['DIST'].values/100.0
+
+    @staticmethod
+    def read(trn_dir, use_cache=True, processes=1):
+        """
+        Returns the TransitRidership for the transit assignment in trn_dir, via the transit link cube.
+        """
+        return TransitRidership(transitAssignment.read_transit_cube(trn_dir,
+                                columns=['MODE','NAME','SEQ','A','B','timeperiod','DIST','TIME','FREQ','AB_VOL','AB_BRDA'],
+                                use_cache=use_cache, processes=processes))
+
+    @staticmethod
+    def mode_type(modes):
+        """
+        Returns the mode type (one of MODE_TYPES) for each of the given line-haul mode numbers.
+        """
+        return numpy.array(TransitRidership.MODE_TYPES)[numpy.searchsorted(TransitRidership.MODE_TYPE_BOUNDS, modes, side='right')]
+
+    def line_summary(self):
+        """
+        Returns a pandas.DataFrame with a row per line (MODE, NAME) and the LINE_COLUMNS, summed across segments and
+        timeperiods.  Peak Load is the most passengers on any segment in any timeperiod, and Peak Load per Run is the
+        most passengers per vehicle run on any segment in any timeperiod.
+        """
+        segments_df = pandas.DataFrame({'MODE'      :self.segments_df['MODE'].values,
+                                        'NAME'      :self.segments_df['NAME'].values,
+                                        'timeperiod':self.segments_df['timeperiod'].cat.codes.values,
+                                        'boardings' :self.boardings,
+                                        'pmt'       :self.pmt,
+                                        'pht'       :self.pht,
+                                        'runs'      :self.runs,
+                                        'vmt'       :self.vmt,
+                                        'load'      :self.segments_df['AB_VOL'].values})
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            segments_df['load_per_run'] = numpy.where(self.runs > 0, segments_df['load']/self.runs, 0.0)
+
+        # every segment of a line has the line's runs for the timeperiod
+        runs_df  = segments_df.groupby(['MODE','NAME','timeperiod'])['runs'].first().groupby(level=['MODE','NAME']).sum()
+        lines_df = segments_df.groupby(['MODE','NAME']).agg({'boardings':'sum', 'pmt':'sum', 'pht':'sum', 'vmt':'sum',
+                                                             'load':'max', 'load_per_run':'max'})
+        lines_df['runs'] = runs_df
+        lines_df.rename(columns={'boardings'   :'Daily Boardings',
+                                 'pmt'         :'Daily Passenger Miles Traveled',
+                                 'pht'         :'Daily Passenger Hours Traveled',
+                                 'runs'        :'Daily Vehicle Runs',
+                                 'vmt'         :'Daily Vehicle Miles Traveled',
+                                 'load'        :'Peak Load',
+                                 'load_per_run':'Peak Load per Run'}, inplace=True)
+        lines_df = lines_df[TransitRidership.LINE_COLUMNS].reset_index()
+        lines_df.insert(2, 'Transit mode', TransitRidership.mode_type(lines_df['MODE'].values))
+        return lines_df
+
+    def mode_summary(self, line_summary_df=None):
+        """
+        Returns a pandas.DataFrame with a row per mode type (MODE_TYPES, as 'Transit mode') and the LINE_COLUMNS,
+        summed across lines, except the peak loads, which are the most of any line of that mode type.
+        """
+        if line_summary_df is None: line_summary_df = self.line_summary()
+        aggregations = dict([(column, 'max' if column.startswith('Peak') else 'sum') for column in TransitRidership.LINE_COLUMNS])
+        modes_df     = line_summary_df.groupby('Transit mode').agg(aggregations)
+        modes_df     = modes_df.reindex(TransitRidership.MODE_TYPES).fillna(0.0)
+        modes_df.index.name = 'Transit mode'
+        return modes_df[TransitRidership.LINE_COLUMNS].reset_index()
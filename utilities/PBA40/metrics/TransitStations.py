@@ -0,0 +1,138 @@
+import argparse, os
+import numpy, pandas
+from LoadedNetwork import LinkIndex
+from TransitRidership import TransitRidership
+import transitAssignment
+
+USAGE = """
+
+  python TransitStations.py [--trn_dir trn] [--output_dir metrics] [--mode_types hvy,com]
+                            [--screenlines screenlines.csv] station_nodes.csv
+
+  Summarizes the transit assignment (the transit link cube, see transitAssignment.py) at a set of stations
+  and screenlines, for all timeperiods at once.
+
+  * station_nodes.csv has columns Station, Node, e.g.
+    utilities\\bespoke-requests\\bart-boardings-by-access-mode\\bart-station-nodes.csv
+  * screenlines.csv has columns screenline, A, B: the transit links crossing each screenline, e.g. the
+    links through the Transbay Tube.  Links are directional, so include both directions for two-way totals.
+    Each link may be in one screenline.
+
+  Writes to output_dir:
+  * transit_station_boardings.csv : by station and timeperiod, for lines of the given mode types (default: all)
+    - boardings and alightings, and boardings by trip access mode (wlk, drv) and alightings by trip egress mode
+    - the volume on the support links into the station by support link MODE, e.g. walk, drive and transfer
+      links to the platform (as in the bart-boardings-by-access-mode request)
+  * transit_screenlines.csv : with --screenlines, passengers and vehicle runs across each screenline,
+    by timeperiod and mode type
+
+"""
+
+class TransitStations(object):
+    """
+    Station and screenline summaries of the transit link cube.
+    """
+    # support links (walk, drive, transfer) have modes below this; see TransitRidership.FIRST_LINE_MODE
+    FIRST_LINE_MODE = TransitRidership.FIRST_LINE_MODE
+
+    def __init__(self, cube_df):
+        """
+        Parameters
+        ----------
+        cube_df : pandas.DataFrame
+            The transit link cube from transitAssignment.read_transit_cube().
+        """
+        self.cube_df    = cube_df
+        self.modes      = cube_df['MODE'].values
+        self.line       = (self.modes >= TransitStations.FIRST_LINE_MODE)
+        self.mode_types = numpy.where(self.line, TransitRidership.mode_type(self.modes), "")
+        self.timeperiod = cube_df['timeperiod'].cat.codes.values
+
+    @staticmethod
+    def node_codes(nodes, station_nodes):
+        """
+        Returns the index into station_nodes for each of nodes, or -1 for nodes that aren't stations.
+        """
+        order  = numpy.argsort(station_nodes, kind='mergesort')
+        sorted_nodes = station_nodes[order]
+        pos    = numpy.minimum(numpy.searchsorted(sorted_nodes, nodes), len(sorted_nodes)-1)
+        return numpy.where(sorted_nodes[pos] == nodes, order[pos], -1)
+
+    def station_boardings(self, stations_df, mode_types=None):
+        """
+        Returns a pandas.DataFrame with a row per station (stations_df has columns Station, Node) and timeperiod with
+        boardings and alightings on lines of the given mode types (default: all), and the support link volume into the
+        station by support link MODE.
+        """
+        station_nodes = stations_df['Node'].values.astype(numpy.int64)
+        num_stations  = len(station_nodes)
+        num_periods   = len(transitAssignment.TIMEPERIODS)
+
+        lines = self.line
+        if mode_types is not None: lines = lines & numpy.isin(self.mode_types, mode_types)
+
+        # boardings at the A node and alightings at the B node of line segments; support links into the B node
+        a_station = TransitStations.node_codes(self.cube_df['A'].values, station_nodes)
+        b_station = TransitStations.node_codes(self.cube_df['B'].values, station_nodes)
+        columns   = [('boardings',          lines & (a_station >= 0), a_station, 'AB_BRDA'),
+                     ('alightings',         lines & (b_station >= 0), b_station, 'AB_XITB')] + \
+                    [('boardings_%s' % access, lines & (a_station >= 0), a_station, 'AB_BRDA_%s' % access)
+                      for access in transitAssignment.ACCESS] + \
+                    [('alightings_%s' % egress, lines & (b_station >= 0), b_station, 'AB_XITB_%s' % egress)
+                      for egress in transitAssignment.EGRESS]
+        support_modes = numpy.unique(self.modes[(~self.line) & (b_station >= 0)])
+        columns  += [('access_link_mode%d' % mode, (self.modes == mode) & (b_station >= 0), b_station, 'AB_VOL')
+                     for mode in support_modes]
+
+        boardings_df = pandas.DataFrame({'Station'   :numpy.repeat(stations_df['Station'].values, num_periods),
+                                         'Node'      :numpy.repeat(station_nodes, num_periods),
+                                         'timeperiod':numpy.tile(transitAssignment.TIMEPERIODS, num_stations)},
+                                        columns=['Station','Node','timeperiod'])
+        for (column, mask, station, volume) in columns:
+            key = station[mask]*num_periods + self.timeperiod[mask]
+            boardings_df[column] = numpy.bincount(key, weights=self.cube_df[volume].values[mask],
+                                                  minlength=num_stations*num_periods)
+        return boardings_df
+
+    def screenline_crossings(self, screenlines_df):
+        """
+        Returns a pandas.DataFrame with a row per screenline (screenlines_df has columns screenline, A, B),
+        timeperiod and mode type with the passengers and vehicle runs on the screenline links.
+        """
+        screenline_join = LinkIndex(screenlines_df['A'].values, screenlines_df['B'].values).join(self.cube_df['A'].values,
+                                                                                                self.cube_df['B'].values)
+        crossing = self.line & screenline_join.found
+        hours    = numpy.array([transitAssignment.TIMEPERIOD_HOURS[timeperiod] for timeperiod in transitAssignment.TIMEPERIODS])
+        freq     = self.cube_df['FREQ'].values[crossing]
+        with numpy.errstate(divide='ignore'):
+            runs = numpy.where(freq > 0, 60.0*hours[self.timeperiod[crossing]]/freq, 0.0)
+
+        crossings_df = pandas.DataFrame({'screenline'  :screenline_join.gather(screenlines_df['screenline'].values)[crossing],
+                                         'timeperiod'  :numpy.array(transitAssignment.TIMEPERIODS)[self.timeperiod[crossing]],
+                                         'Transit mode':self.mode_types[crossing],
+                                         'passengers'  :self.cube_df['AB_VOL'].values[crossing],
+                                         'vehicle runs':runs})
+        return crossings_df.groupby(['screenline','timeperiod','Transit mode'], as_index=False).agg({'passengers':'sum',
+                                                                                                    'vehicle runs':'sum'})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('station_nodes', type=str, help="csv with columns Station, Node")
+    parser.add_argument('--trn_dir', type=str, default="trn")
+    parser.add_argument('--output_dir', type=str, default="metrics")
+    parser.add_argument('--mode_types', type=str, default=None, help="Comma-delimited mode types (loc,exp,lrf,hvy,com) for station boardings")
+    parser.add_argument('--screenlines', type=str, default=None, help="csv with columns screenline, A, B")
+    my_args = parser.parse_args()
+
+    stations = TransitStations(transitAssignment.read_transit_cube(my_args.trn_dir))
+
+    stations_df = pandas.read_csv(my_args.station_nodes, sep=",")
+    mode_types  = my_args.mode_types.split(",") if my_args.mode_types else None
+    outfile     = os.path.join(my_args.output_dir, "transit_station_boardings.csv")
+    stations.station_boardings(stations_df, mode_types).to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    if my_args.screenlines:
+        outfile = os.path.join(my_args.output_dir, "transit_screenlines.csv")
+        stations.screenline_crossings(pandas.read_csv(my_args.screenlines, sep=",")).to_csv(outfile, index=False)
+        print("Wrote %s" % outfile)
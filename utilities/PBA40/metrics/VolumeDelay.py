@@ -0,0 +1,184 @@
+import argparse, os, re, sys, time
+import numpy
+from LoadedNetwork import LoadedNetwork
+
+USAGE = """
+
+  python VolumeDelay.py [--block_dir CTRAMP\\scripts\\block] [--capacity_factor 1.0] [--volume_factor 1.0]
+                        [--ft 1,2,8] network_csv
+
+  Evaluates the highway assignment volume-delay functions for every link and timeperiod of a loaded network,
+  for quick what-if screening of capacity, lane and volume changes without running the assignment.
+
+  The functions are those of the highway assignment (HwyAssign.job and CalculateSpeeds.job):
+  * capacity is the hourly lane capacity from SpeedCapacity_1hour.block by capacity class (10 x at + ft),
+    times lanes, times the number of hours in the timeperiod (capfac)
+  * volume is in passenger car equivalents, with TRKPCE (hwyParam.block) for large trucks
+  * ft 1, 2, 8, 9 use the BPR variation in SpeedFlowCurve.block
+  * other ft use the Akcelik curve in SpeedFlowCurve.block, with the critical speeds in FreeFlowSpeed.block
+  * ft 6 (dummy links) have a fixed time; the loaded network's congested time is kept
+
+  The script re-evaluates the loaded network as is, then with the capacity of the links with the given
+  facility types (default: all) scaled by capacity_factor and all volumes scaled by volume_factor, and prints
+  VHT by timeperiod for both.
+
+  Alternatively, use from another script:
+
+    from VolumeDelay import VolumeDelay
+    vdf  = VolumeDelay(block_dir)
+    ctim = vdf.congested_time(network, lanes=network.lanes + 1)   # [link, timeperiod]
+
+"""
+
+class VolumeDelay(object):
+    """
+    The volume-delay functions of the highway assignment, evaluated with numpy over the link arrays of a
+    LoadedNetwork.  The speed/capacity and critical speed tables are read from the Cube block files so
+    they stay in sync with the assignment.
+    """
+    SPEED_CAPACITY_FILE = "SpeedCapacity_1hour.block"
+    FREE_FLOW_SPEED_FILE = "FreeFlowSpeed.block"
+    HWY_PARAM_FILE      = "hwyParam.block"
+
+    # number of hours in each timeperiod; capacity factor in HwyAssign.job
+    CAPFAC       = {'EA':3.0, 'AM':4.0, 'MD':5.0, 'PM':4.0, 'EV':8.0}
+    # facility types using the BPR variation; ft 6 has fixed times and the rest use the Akcelik curve
+    BPR_FTS      = [1,2,8,9]
+    FIXED_FTS    = [6]
+    DEFAULT_TRUCK_PCE = 2.0
+    MAX_CAPCLASS = 60
+
+    def __init__(self, block_dir):
+        """
+        Parameters
+        ----------
+        block_dir : string
+            The directory with SpeedCapacity_1hour.block, FreeFlowSpeed.block and hwyParam.block,
+            e.g. CTRAMP\\scripts\\block in the model run directory.
+        """
+        # lane_capacity[capclass], critical_speed[capclass]; NaN for classes not in the tables
+        self.lane_capacity  = numpy.full(VolumeDelay.MAX_CAPCLASS+1, numpy.nan)
+        self.critical_speed = numpy.full(VolumeDelay.MAX_CAPCLASS+1, numpy.nan)
+
+        # e.g. SPDCAP CAPACITY[01] = 1850, 2050, 1450, ... sets capacity classes 1 through 10
+        with open(os.path.join(block_dir, VolumeDelay.SPEED_CAPACITY_FILE), "r") as block_fh:
+            for line in block_fh:
+                match = re.match(r"\s*SPDCAP\s+CAPACITY\[(\d+)\]\s*=\s*([\d.,\s]+)", line, re.IGNORECASE)
+                if not match: continue
+                values = [float(value) for value in match.group(2).split(",") if value.strip()]
+                first  = int(match.group(1))
+                self.lane_capacity[first:first+len(values)] = values
+
+        # e.g. IF (LI.CAPCLASS = 01) CritSpd = 18.835
+        with open(os.path.join(block_dir, VolumeDelay.FREE_FLOW_SPEED_FILE), "r") as block_fh:
+            for line in block_fh:
+                match = re.match(r"\s*IF\s*\(LI\.CAPCLASS\s*=\s*(\d+)\)\s*CritSpd\s*=\s*([\d.]+)", line, re.IGNORECASE)
+                if match: self.critical_speed[int(match.group(1))] = float(match.group(2))
+
+        self.truck_pce = VolumeDelay.DEFAULT_TRUCK_PCE
+        param_file = os.path.join(block_dir, VolumeDelay.HWY_PARAM_FILE)
+        if os.path.exists(param_file):
+            with open(param_file, "r") as block_fh:
+                for line in block_fh:
+                    match = re.match(r"\s*TRKPCE\s*=\s*([\d.]+)", line, re.IGNORECASE)
+                    if match: self.truck_pce = float(match.group(1))
+
+    @staticmethod
+    def capacity_class(network):
+        """
+        Returns the capacity class for each link, 10 x at + ft.
+        """
+        return 10*network.at + network.ft
+
+    def capacity(self, network, lanes=None, lane_capacity=None):
+        """
+        Returns the link capacity for each timeperiod as [link, timeperiod]: hourly lane capacity x lanes x capfac.
+
+        Parameters
+        ----------
+        network : LoadedNetwork
+            The loaded network, read with lanes, ft, at.
+        lanes : numpy.ndarray
+            Optional lanes per link, to use instead of the network's.
+        lane_capacity : numpy.ndarray
+            Optional hourly lane capacity per link, to use instead of the speed/capacity table.
+        """
+        if lanes is None: lanes = network.lanes
+        if lane_capacity is None:
+            lane_capacity = self.lane_capacity[VolumeDelay.capacity_class(network)]
+        capfac = numpy.array([VolumeDelay.CAPFAC[timeperiod] for timeperiod in LoadedNetwork.TIMEPERIODS])
+        return (lane_capacity*lanes)[:,numpy.newaxis]*capfac[numpy.newaxis,:]
+
+    def pce_volume(self, volumes):
+        """
+        Returns the passenger car equivalent volume as [link, timeperiod], given volumes [link, timeperiod, vehclass].
+        """
+        pce = numpy.ones(len(LoadedNetwork.VEHCLASSES))
+        pce[LoadedNetwork.vehclass_index(LoadedNetwork.LARGE_TRUCK_VEHCLASSES)] = self.truck_pce
+        return numpy.dot(volumes, pce)
+
+    def congested_time(self, network, volumes=None, lanes=None, lane_capacity=None):
+        """
+        Returns the congested time (minutes) as [link, timeperiod] from the volume-delay functions.
+        volumes [link, timeperiod, vehclass], lanes [link] and lane_capacity [link] default to the network's.
+        """
+        if volumes is None: volumes = network.volumes
+        capacity = self.capacity(network, lanes, lane_capacity)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            vc   = self.pce_volume(volumes)/capacity
+
+            # BPR variation: T0 * (1 + 0.20 * ( (V/C)/0.75 )^6), where T0 is the free-flow time
+            fft  = network.fft[:,numpy.newaxis]
+            bpr  = fft*(1.0 + 0.20*(vc/0.75)**6)
+
+            # Akcelik: 60 * ( (DISTANCE/FFS) + 0.25*( (V/C - 1) + ( (V/C - 1)^2 + 16 * Ja * V/C * DISTANCE^2 )^0.5 ) )
+            # where Ja = (1/CritSpd - 1/FFS)^2
+            ja   = ((1.0/self.critical_speed[VolumeDelay.capacity_class(network)] - 1.0/network.link_attrs['ffs'])**2)[:,numpy.newaxis]
+            dist = network.distance[:,numpy.newaxis]
+            akcelik = 60.0*(dist/network.link_attrs['ffs'][:,numpy.newaxis] +
+                            0.25*((vc - 1.0) + numpy.sqrt((vc - 1.0)**2 + 16.0*ja*vc*dist**2)))
+
+        ctim = numpy.where(numpy.isin(network.ft, VolumeDelay.BPR_FTS)[:,numpy.newaxis], bpr, akcelik)
+        ctim = numpy.where(numpy.isin(network.ft, VolumeDelay.FIXED_FTS)[:,numpy.newaxis], network.ctim, ctim)
+        return ctim
+
+    def evaluate(self, network, volumes=None, lanes=None, lane_capacity=None):
+        """
+        Returns (ctim, vht) where ctim [link, timeperiod] is from congested_time() and vht [link, timeperiod, vehclass]
+        are the vehicle hours traveled at that time.
+        """
+        if volumes is None: volumes = network.volumes
+        ctim = self.congested_time(network, volumes, lanes, lane_capacity)
+        return (ctim, volumes*ctim[:,:,numpy.newaxis]/60.0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('network_csv', type=str, help="Loaded network with volumes")
+    parser.add_argument('--block_dir', type=str, default=os.path.join("CTRAMP","scripts","block"))
+    parser.add_argument('--capacity_factor', type=float, default=1.0, help="Scales the capacity of the selected links")
+    parser.add_argument('--volume_factor',   type=float, default=1.0, help="Scales all volumes")
+    parser.add_argument('--ft', type=str, default=None, help="Comma-delimited facility types to scale capacity for (default: all)")
+    my_args = parser.parse_args()
+
+    network = LoadedNetwork.read(my_args.network_csv, link_attributes=['distance','lanes','ft','at','ffs','fft'])
+    vdf     = VolumeDelay(my_args.block_dir)
+
+    selected = numpy.ones(network.num_links, dtype=bool)
+    if my_args.ft: selected = numpy.isin(network.ft, [int(ft) for ft in my_args.ft.split(",")])
+    lane_capacity = vdf.lane_capacity[VolumeDelay.capacity_class(network)]*numpy.where(selected, my_args.capacity_factor, 1.0)
+
+    start_time = time.time()
+    (base_ctim, base_vht) = vdf.evaluate(network)
+    (scen_ctim, scen_vht) = vdf.evaluate(network, volumes=network.volumes*my_args.volume_factor, lane_capacity=lane_capacity)
+    print("Evaluated %d links x %d timeperiods twice in %.3f seconds" %
+          (network.num_links, len(LoadedNetwork.TIMEPERIODS), time.time() - start_time))
+
+    print("%-6s %14s %14s %14s %8s" % ("period", "loaded VHT", "base VHT", "scenario VHT", "change"))
+    loaded_vht = network.vht().sum(axis=(0,2))
+    base_vht   = base_vht.sum(axis=(0,2))
+    scen_vht   = scen_vht.sum(axis=(0,2))
+    for p_idx in range(len(LoadedNetwork.TIMEPERIODS)):
+        print("%-6s %14.1f %14.1f %14.1f %7.2f%%" % (LoadedNetwork.TIMEPERIODS[p_idx], loaded_vht[p_idx], base_vht[p_idx],
+              scen_vht[p_idx], 100.0*(scen_vht[p_idx]-base_vht[p_idx])/base_vht[p_idx]))
+    print("%-6s %14.1f %14.1f %14.1f %7.2f%%" % ("Total", loaded_vht.sum(), base_vht.sum(), scen_vht.sum(),
+          100.0*(scen_vht.sum()-base_vht.sum())/base_vht.sum()))
@@ -24,10 +24,21 @@ DESCRIPTION = """
   At the end, write out combined outputfile to all_metrics/bus_opcost.txt
   (distilled to just run dir).  Bus Operating Costs are in 2000 dollars.
 
+  Steps 1-3 are run for one run at a time.  Steps 4-6 can be run for several runs at once
+  with --processes.  With --cache_dir, each run's result is cached there, keyed by a hash of
+  its transit assignment and roadway network files, and step 4 is only run for the runs whose
+  files have changed (or that are new), e.g.
+
+    python bus_opcost.py --processes 8 --cache_dir bus_opcost_cache
+
+  Without --cache_dir, runs with an OUTPUT/bus_opcost.csv on the M: drive are not recalculated.
+
 """
-import logging,os,shutil,subprocess,sys
-import pysal
+import argparse,hashlib,logging,multiprocessing,os,shutil,subprocess,sys
 import numpy, pandas
+import columnStore
+import dbfTable
+from LoadedNetwork import LinkIndex
 
 CODE_DIR = r"C:\Users\lzorn\Documents\travel-model-one-v05\utilities\PBA40\metrics"
 
@@ -62,21 +73,6 @@ ROAD_SGR_RUNS = [
     ("2040_05_503_1503",   "model2-b", "1503_HighwaySGR_idealIRI"       ),
 ]
 
-def read_dbf(dbf_fullpath):
-    """
-    Returns the pandas DataFrame
-    """
-    import pysal
-    dbfin = pysal.open(dbf_fullpath)
-    vars = dbfin.header
-    data = dict([(var, dbfin.by_col(var)) for var in vars])
-
-    table_df = pandas.DataFrame(data)
-
-    print "  Read %d lines from %s" % (len(table_df), dbf_fullpath)
-
-    return table_df
-
 def runCubeScript(workingdir, script_filename):
     """
     Run the cube script specified in the tempdir specified.
@@ -97,130 +93,190 @@ def runCubeScript(workingdir, script_filename):
     print "  Received %d from 'runtpp %s'" % (retcode, script_filename)
 
 
+def run_dir(run_dir_tuple):
+    """
+    Returns the model run directory on the model machine for the given ROAD_SGR_RUNS entry.
+    """
+    return os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[run_dir_tuple[1]], "Projects", run_dir_tuple[0])
+
+def roadnet_filename(run_dir_tuple, iteration):
+    """
+    Returns the loaded roadway network file for the given ROAD_SGR_RUNS entry and model iteration.
+    """
+    return os.path.join(run_dir(run_dir_tuple), "hwy","iter%d" % iteration, "avgload5period_vehclasses.csv")
+
+def trnlink_filenames(run_dir_tuple):
+    """
+    Returns the transit assignment files for the given ROAD_SGR_RUNS entry, in TIMEPERIODS order.
+    """
+    return [os.path.join(run_dir(run_dir_tuple), "trn", "trnlink%s_wlk_exp_wlk.dbf" % timeperiod) for (timeperiod, duration) in TIMEPERIODS]
+
+def input_hash(filenames):
+    """
+    Returns the md5 hex digest of the contents of the given files, in order.
+    """
+    md5 = hashlib.md5()
+    for filename in filenames:
+        with open(filename, "rb") as input_fh:
+            for chunk in iter(lambda: input_fh.read(1024*1024), b""):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+def update_roadnet(run_dir_tuple, iteration):
+    """
+    Steps 1-3: if the roadway network doesn't have bus opcosts, reruns net2csv_avgload5period.job
+    and copies the updated network to extractor/ and the M: drive.
+    """
+    (model_machine_dir, model_machine, m_dir) = run_dir_tuple
+    roadnet_file    = roadnet_filename(run_dir_tuple, iteration)
+    # just the header; no column store in the run's directory
+    roadnet_columns = columnStore.csv_columns(roadnet_file, use_cache=False)
+    print "  Read %s" % roadnet_file
+
+    if 'busopc' in roadnet_columns: return
+
+    # 1) if out of date, rerun net2csv_avgload5period.job
+    runCubeScript(workingdir=run_dir(run_dir_tuple),
+                  script_filename=os.path.join(CODE_DIR, "net2csv_avgload5period.JOB"))
+    roadnet_columns = columnStore.csv_columns(roadnet_file, use_cache=False)
+    assert('busopc' in roadnet_columns)
+
+    # 2) copy to extractor
+    extractor_file = os.path.join(run_dir(run_dir_tuple),"extractor","avgload5period_vehclasses.csv")
+    print "  Copying to %s" % extractor_file
+    shutil.copy2(roadnet_file, extractor_file)
+
+    # 3) copy to M
+    m_file = os.path.join(m_dir, "OUTPUT", "avgload5period_vehclasses.csv")
+    print "  Copying to %s" % m_file
+    shutil.copy2(roadnet_file, m_file)
+
+def calculate_bus_opcost(run_dir_tuple, iteration):
+    """
+    Step 4: calculates bus operating cost by mode and timeperiod by reading the transit assignment files
+    and joining them with the roadway network.  Returns a pandas.DataFrame.
+    """
+    (model_machine_dir, model_machine, m_dir) = run_dir_tuple
+    roadnet_df = columnStore.read_csv_columns(roadnet_filename(run_dir_tuple, iteration), ['a','b','busopc','busopc_pave'],
+                                              use_cache=False)
+    # to join transit links to the roadway network
+    roadnet_index = LinkIndex(roadnet_df['a'].values, roadnet_df['b'].values)
+
+    trn_by_mode_dfs = []
+    for (timeperiod_tuple, trnlink_file) in zip(TIMEPERIODS, trnlink_filenames(run_dir_tuple)):
+
+        timeperiod          = timeperiod_tuple[0]
+        timeperiod_duration = timeperiod_tuple[1]
+
+        # 4) calculate bus operating cost by reading the transit assignment files
+        trn_asgn_df = dbfTable.read_dbf(trnlink_file, columns=['A','B','MODE','FREQ','DIST'])
+
+        # we only want bus lines
+        trn_asgn_df = trn_asgn_df.loc[(trn_asgn_df.MODE >= 10)&(trn_asgn_df.MODE<100)].copy()
+
+        # FREQ minutes/1 bus
+        # => of runs = time period minutes x (1 bus/freq minutes)
+        # e.g. 3 hours x (60 min/hour) x (1 bus/30 min) = 6
+        trn_asgn_df['bus runs'] = timeperiod_duration*60/trn_asgn_df['FREQ']
+        trn_asgn_df['bus miles'] = trn_asgn_df['bus runs'] * trn_asgn_df['DIST']*0.01
+
+        # join to the roadway network
+        roadnet_join = roadnet_index.join(trn_asgn_df['A'].values, trn_asgn_df['B'].values)
+        trn_asgn_df['busopc'     ] = roadnet_join.gather(roadnet_df['busopc'].values)
+        trn_asgn_df['busopc_pave'] = roadnet_join.gather(roadnet_df['busopc_pave'].values)
+        # busopc are in 2000 cents per mile. Convert these to 2000 dollars and multiply by bus runs to get daily,
+        # then by 300 to get annual, then by 1.49 to get 2017 dollars.
+        trn_asgn_df['total bus opcost'         ] = trn_asgn_df['bus runs'] * (0.01*trn_asgn_df['busopc']     ) * (trn_asgn_df['DIST']*0.01) * 300 * 1.49
+        trn_asgn_df['total bus pavement opcost'] = trn_asgn_df['bus runs'] * (0.01*trn_asgn_df['busopc_pave']) * (trn_asgn_df['DIST']*0.01) * 300 * 1.49
+
+        # check join failures
+        (join_fail_miles, total_miles) = roadnet_join.failures(trn_asgn_df['bus miles'].values)
+        print "  %s %s: %d bus miles failed to join out of %d => %.1f%%" % (model_machine_dir, timeperiod, join_fail_miles, total_miles, 100.0*join_fail_miles/total_miles)
+        # sum up Bus Miles Traveled, Bus Opcost, Bus Opcost from Pavement by mode
+
+        trn_by_mode = trn_asgn_df.groupby('MODE', as_index=False).agg({'total bus opcost':numpy.sum,
+                                                                       'total bus pavement opcost':numpy.sum,
+                                                                       'bus miles':numpy.sum})
+        trn_by_mode['timeperiod'] = timeperiod
+        trn_by_mode['m_dir']      = m_dir
+        trn_by_mode['model_dir']  = model_machine_dir
+        trn_by_mode_dfs.append(trn_by_mode)
+
+    return pandas.concat(trn_by_mode_dfs, axis=0)
+
+def run_bus_opcost(args):
+    """
+    Returns the bus operating costs for one ROAD_SGR_RUNS entry; args is (run_dir_tuple, iteration, cache_dir).
+
+    With a cache_dir, the result is cached there keyed by the hash of the run's trnlink and roadway files,
+    and is only calculated if those have changed.  Otherwise, it's read from the M: drive if it's there.
+    If calculated, it's written to metrics/ and copied to extractor/ and the M: drive (steps 5 and 6).
+    """
+    (run_dir_tuple, iteration, cache_dir) = args
+    (model_machine_dir, model_machine, m_dir) = run_dir_tuple
+    m_file = os.path.join(m_dir, "OUTPUT", "bus_opcost.csv")
+
+    cache_file = None
+    if cache_dir:
+        run_hash   = input_hash(trnlink_filenames(run_dir_tuple) + [roadnet_filename(run_dir_tuple, iteration)])
+        cache_file = os.path.join(cache_dir, "bus_opcost_%s_%s.csv" % (model_machine_dir, run_hash))
+        if os.path.exists(cache_file):
+            print "  Read cached %s" % cache_file
+            return pandas.read_csv(cache_file, sep=",")
+    # if the bus_opcost file exists, just read it
+    elif os.path.exists(m_file):
+        print "  Read %s" % m_file
+        return pandas.read_csv(m_file, sep=",")
+
+    trn_busopc_df = calculate_bus_opcost(run_dir_tuple, iteration)
+
+    run_busopc_file = os.path.join(run_dir(run_dir_tuple),"metrics","bus_opcost.csv")
+    print "  Writing file %s" % run_busopc_file
+    trn_busopc_df.to_csv(run_busopc_file,index=False)
+
+    # 5) Copies the output file metrics/bus_opcost.csv to extractor/
+    extractor_file = os.path.join(run_dir(run_dir_tuple),"extractor","bus_opcost.csv")
+    print "  Copying to %s" % extractor_file
+    shutil.copy2(run_busopc_file, extractor_file)
+
+    # 6) Copies the outputfile metrics/bus_opcost.csv to the M: drive
+    print "  Copying to %s" % m_file
+    shutil.copy2(run_busopc_file, m_file)
+
+    if cache_file:
+        shutil.copy2(run_busopc_file, cache_file)
+    return trn_busopc_df
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=1, help="Number of runs to calculate at once")
+    parser.add_argument('--cache_dir', type=str, default=None, help="Directory to cache each run's result in")
+    my_args = parser.parse_args()
 
     ITERATION = int(os.environ['ITER'])
     assert(ITERATION==3)
 
-    all_trn_busopc = 0
-    all_trn_busopc_init = False
-
+    # net2csv is run one at a time
     for run_dir_tuple in ROAD_SGR_RUNS:
-
-        model_machine_dir = run_dir_tuple[0]
-        model_machine     = run_dir_tuple[1]
-        m_dir             = run_dir_tuple[2]
-
-        print "Processing %s as %s on %s" % (m_dir, model_machine_dir, model_machine)
-
-        roadnet_file = os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                    "Projects", model_machine_dir,
-                                    "hwy","iter%d" % ITERATION, "avgload5period_vehclasses.csv")
-        roadnet_df = pandas.read_table(roadnet_file, sep=",")
-        print "  Read %s" % roadnet_file
-
-        if 'busopc' not in roadnet_df.columns.values:
-            # 1) if out of date, rerun net2csv_avgload5period.job
-            runCubeScript(workingdir=os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                                  "Projects", model_machine_dir),
-                          script_filename=os.path.join(CODE_DIR, "net2csv_avgload5period.JOB"))
-            roadnet_df = pandas.read_table(roadnet_file, sep=",")
-            assert('busopc' in roadnet_df.columns.values)
-
-            # 2) copy to extractor
-            extractor_file = os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                          "Projects", model_machine_dir,"extractor","avgload5period_vehclasses.csv")
-            print "  Copying to %s" % extractor_file
-            shutil.copy2(roadnet_file, extractor_file)
-
-            # 3) copy to M
-            m_file = os.path.join(m_dir, "OUTPUT", "avgload5period_vehclasses.csv")
-            print "  Copying to %s" % m_file
-            shutil.copy2(roadnet_file, m_file)
-
-        roadnet_df = roadnet_df[['a','b','state','cityid','cityname','busopc','busopc_pave']]
-
-        trn_busopc_df = 0
-
-        m_file = os.path.join(m_dir, "OUTPUT", "bus_opcost.csv")
-        # if the bus_opcost file exists, just read it
-        if os.path.exists(m_file):
-            trn_busopc_df = pandas.read_csv(m_file, sep=",")
-            print "  Read %s" % m_file
-
-        else:
-
-            trn_busopc_df_init = False
-            for timeperiod_tuple in TIMEPERIODS:
-    
-                timeperiod          = timeperiod_tuple[0]
-                timeperiod_duration = timeperiod_tuple[1]
-    
-                # 4) calculate bus operating cost by reading the transit assignment files
-                trn_asgn_df = read_dbf(os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                                    "Projects",model_machine_dir,"trn","trnlink%s_wlk_exp_wlk.dbf" % timeperiod))
-    
-                # we only want bus lines
-                trn_asgn_df = trn_asgn_df.loc[(trn_asgn_df.MODE >= 10)&(trn_asgn_df.MODE<100)]
-    
-                # FREQ minutes/1 bus
-                # => of runs = time period minutes x (1 bus/freq minutes)
-                # e.g. 3 hours x (60 min/hour) x (1 bus/30 min) = 6
-                trn_asgn_df['bus runs'] = timeperiod_duration*60/trn_asgn_df['FREQ']
-                trn_asgn_df['bus miles'] = trn_asgn_df['bus runs'] * trn_asgn_df['DIST']*0.01
-    
-                # join to the roadway network
-                trn_asgn_df = pandas.merge(left=trn_asgn_df, right=roadnet_df, how='left', left_on=['A','B'], right_on=['a','b'])
-                # busopc are in 2000 cents per mile. Convert these to 2000 dollars and multiply by bus runs to get daily,
-                # then by 300 to get annual, then by 1.49 to get 2017 dollars.
-                trn_asgn_df['total bus opcost'         ] = trn_asgn_df['bus runs'] * (0.01*trn_asgn_df['busopc']     ) * (trn_asgn_df['DIST']*0.01) * 300 * 1.49
-                trn_asgn_df['total bus pavement opcost'] = trn_asgn_df['bus runs'] * (0.01*trn_asgn_df['busopc_pave']) * (trn_asgn_df['DIST']*0.01) * 300 * 1.49
-    
-                # check join failures
-                join_fail_miles = trn_asgn_df.loc[pandas.isnull(trn_asgn_df.busopc), 'bus miles'].sum()
-                total_miles     = trn_asgn_df.loc[:,'bus miles'].sum()
-                print "  %s: %d bus miles failed to join out of %d => %.1f%%" % (timeperiod, join_fail_miles, total_miles, 100.0*join_fail_miles/total_miles)
-                # sum up Bus Miles Traveled, Bus Opcost, Bus Opcost from Pavement by mode
-    
-                trn_by_mode = trn_asgn_df.groupby('MODE', as_index=False).agg({'total bus opcost':numpy.sum,
-                                                                               'total bus pavement opcost':numpy.sum,
-                                                                               'bus miles':numpy.sum})
-                trn_by_mode['timeperiod'] = timeperiod
-                trn_by_mode['m_dir']      = m_dir
-                trn_by_mode['model_dir']  = model_machine_dir
-                # print trn_by_mode.head()
-    
-                if trn_busopc_df_init==False: # it doesn't like checking if a dataFrame is none
-                    trn_busopc_df = trn_by_mode
-                    trn_busopc_df_init = True
-                else:
-                    trn_busopc_df = trn_busopc_df.append(trn_by_mode)
-                # print "Full table has length %d" % len(trn_busopc_df)
-    
-            run_busopc_file = os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                           "Projects", model_machine_dir,"metrics","bus_opcost.csv")
-            print "  Writing file %s" % run_busopc_file
-            trn_busopc_df.to_csv(run_busopc_file,index=False)
-    
-            # 5) Copies the output file metrics/bus_opcost.csv to extractor/
-            extractor_file = os.path.join(MODEL_MACHINES_TO_MAPPED_DRIVES[model_machine],
-                                          "Projects", model_machine_dir,"extractor","bus_opcost.csv")
-            print "  Copying to %s" % extractor_file
-            shutil.copy2(run_busopc_file, extractor_file)
-    
-            # 6) Copies the outputfile metrics/bus_opcost.csv to the M: drive
-            print "  Copying to %s" % m_file
-            shutil.copy2(run_busopc_file, m_file)
-
-        # append to all run bus opc dataframe
-        if all_trn_busopc_init==False:
-            all_trn_busopc_df = trn_busopc_df
-            all_trn_busopc_init = True
-        else:
-            all_trn_busopc_df = all_trn_busopc_df.append(trn_busopc_df)
-
+        print "Processing %s as %s on %s" % (run_dir_tuple[2], run_dir_tuple[0], run_dir_tuple[1])
+        update_roadnet(run_dir_tuple, ITERATION)
+
+    if my_args.cache_dir and not os.path.exists(my_args.cache_dir): os.makedirs(my_args.cache_dir)
+    run_args = [(run_dir_tuple, ITERATION, my_args.cache_dir) for run_dir_tuple in ROAD_SGR_RUNS]
+    if my_args.processes > 1:
+        pool            = multiprocessing.Pool(my_args.processes)
+        try:
+            trn_busopc_dfs  = pool.map(run_bus_opcost, run_args)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        trn_busopc_dfs  = [run_bus_opcost(run_arg) for run_arg in run_args]
+
+    all_trn_busopc_df = pandas.concat(trn_busopc_dfs, axis=0)
     all_busopc_by_run = all_trn_busopc_df.groupby(['m_dir', 'model_dir'], as_index=False).agg({'total bus opcost':numpy.sum,
                                                                                                'total bus pavement opcost':numpy.sum,
                                                                                                'bus miles':numpy.sum})
     all_busopc_by_run.to_csv(os.path.join("all_metrics","bus_opcost.txt"), index=False)
-    print "Wrote all_metrics/bus_opcost.csv"
\ No newline at end of file
+    print "Wrote all_metrics/bus_opcost.csv"
@@ -0,0 +1,262 @@
+import json, os, shutil, tempfile, time
+import numpy, pandas
+
+USAGE = """
+
+  Not run directly.  Column-projected, cached reading of large csv files such as the loaded
+  roadway network, hwy\\iter%ITER%\\avgload5period_vehclasses.csv.
+
+  The first time a csv is read, it is converted to a column store: a directory next to the csv
+  (e.g. avgload5period_vehclasses.cols) with a data directory holding one .npy file per column,
+  and a manifest.json naming the data directory and its columns.
+  Subsequent reads load only the requested columns from the column store (memory mapped).
+  The manifest records the size and modification time of the source csv, so if the csv
+  changes, the column store is rebuilt.
+
+  A column store is rebuilt into a new data directory, and the manifest is written last and
+  renamed into place, so readers see either the old store or the new one.  Readers of other
+  model runs' directories (e.g. on M) should pass use_cache=False rather than write stores there.
+
+  e.g.
+    import columnStore
+    links_df = columnStore.read_csv_columns(os.path.join("hwy","iter3","avgload5period_vehclasses.csv"),
+                                            columns=['a','b','distance','ft'])
+
+"""
+
+MANIFEST_FILE    = "manifest.json"
+COLUMN_STORE_EXT = ".cols"
+# data directories are named DATA_PREFIX*; while written, they (and the new manifest) are TEMP_PREFIX*
+DATA_PREFIX      = "data"
+TEMP_PREFIX      = "tmp"
+# temporary files older than this (seconds) are from failed writers, and are removed
+STALE_TEMP_AGE   = 24*60*60
+
+def column_store_dir(csv_file):
+    """
+    Returns the column store directory for the given csv file.
+    """
+    return os.path.splitext(csv_file)[0] + COLUMN_STORE_EXT
+
+def source_stats(source_file):
+    """
+    Returns the stats for the given file (or list of files) used to tell if a column store is out of date.
+    """
+    if isinstance(source_file, list):
+        return [source_stats(one_file) for one_file in source_file]
+    stat = os.stat(source_file)
+    return {'size':stat.st_size, 'mtime':stat.st_mtime}
+
+def read_manifest(store_dir):
+    """
+    Returns the manifest dict for the given column store, or None if it doesn't exist.
+    """
+    manifest_file = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_file): return None
+    with open(manifest_file, "r") as manifest_fh:
+        return json.load(manifest_fh)
+
+def write_column_store(store_dir, table_df, source=None):
+    """
+    Writes the given pandas.DataFrame to a column store at store_dir, replacing any existing one.
+    Columns are written in their DataFrame order; object (string) columns are stored as fixed-width strings.
+
+    Parameters
+    ----------
+    store_dir : string
+        The column store directory to write.
+    table_df : pandas.DataFrame
+        The table to store.
+    source : string or list of string
+        Optional source file (or files) this is converted from; the stats are recorded in the manifest.
+    """
+    write_columns(store_dir, ((column, table_df[column].values) for column in table_df.columns), source=source)
+
+def write_columns(store_dir, columns, source=None):
+    """
+    Writes the given columns to a column store at store_dir, replacing any existing one.
+    Columns are written one at a time, so columns may be a generator that computes each column
+    as it's needed, and the whole table need never be in memory.
+
+    If another process replaces the store at the same time and the store is then current for
+    source, that's fine, since the other writer built the same store.
+
+    Parameters
+    ----------
+    store_dir : string
+        The column store directory to write.
+    columns : iterable of (string, numpy.ndarray)
+        The column names and values, in order.  All columns must be the same length.
+    source : string or list of string
+        Optional source file (or files) this is converted from; the stats are recorded in the manifest.
+    """
+    if not os.path.isdir(store_dir):
+        try:
+            os.makedirs(store_dir)
+        except OSError:
+            # another writer may have just made it
+            if not os.path.isdir(store_dir): raise
+    temp_dir = tempfile.mkdtemp(prefix=TEMP_PREFIX, dir=store_dir)
+
+    manifest = {'columns':[], 'files':[], 'num_rows':None, 'source':None, 'data_dir':None}
+    if source: manifest['source'] = source_stats(source)
+
+    try:
+        for (column, values) in columns:
+            values = numpy.asarray(values)
+            if values.dtype == object:
+                values = values.astype(str)
+            if manifest['num_rows'] is None:
+                manifest['num_rows'] = len(values)
+            elif len(values) != manifest['num_rows']:
+                raise ValueError("Column %s has %d rows; expected %d" % (str(column), len(values), manifest['num_rows']))
+            column_file = "col%04d.npy" % len(manifest['files'])
+            numpy.save(os.path.join(temp_dir, column_file), numpy.ascontiguousarray(values))
+            manifest['columns'].append(str(column))
+            manifest['files'].append(column_file)
+        if manifest['num_rows'] is None: manifest['num_rows'] = 0
+
+        # the data is complete; give it its final name, then point the manifest at it
+        manifest['data_dir'] = DATA_PREFIX + os.path.basename(temp_dir)[len(TEMP_PREFIX):]
+        os.rename(temp_dir, os.path.join(store_dir, manifest['data_dir']))
+        write_manifest(store_dir, manifest)
+    except (IOError, OSError):
+        remove_data(store_dir, [os.path.basename(temp_dir), manifest['data_dir']])
+        if source and column_store_is_current(source, store_dir): return
+        raise
+    except:
+        remove_data(store_dir, [os.path.basename(temp_dir), manifest['data_dir']])
+        raise
+
+    remove_stale_data(store_dir)
+
+def write_manifest(store_dir, manifest):
+    """
+    Writes the manifest for the column store at store_dir to a temporary file, then renames it into place,
+    so readers see the old manifest or the new one.  (With python 2 on Windows, where a rename can't replace a file,
+    the old manifest is removed first, so readers briefly find no store and read the csv.)
+    """
+    (manifest_fd, temp_file) = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=".json", dir=store_dir)
+    try:
+        with os.fdopen(manifest_fd, "w") as manifest_fh:
+            json.dump(manifest, manifest_fh, indent=1)
+        manifest_file = os.path.join(store_dir, MANIFEST_FILE)
+        if hasattr(os, 'replace'):
+            os.replace(temp_file, manifest_file)
+        else:
+            if os.name == 'nt' and os.path.exists(manifest_file): os.remove(manifest_file)
+            os.rename(temp_file, manifest_file)
+    except:
+        if os.path.exists(temp_file): os.remove(temp_file)
+        raise
+
+def remove_data(store_dir, names):
+    """
+    Removes the given data directories (or files) from store_dir, ignoring any that are missing or can't be removed
+    (e.g. memory mapped by a reader on Windows).
+    """
+    for name in names:
+        if not name: continue
+        path = os.path.join(store_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def remove_stale_data(store_dir):
+    """
+    Removes the data directories in store_dir that the manifest doesn't name, the column files of the
+    older format (in store_dir itself) and temporary files left by failed writers.
+    """
+    manifest = read_manifest(store_dir)
+    current  = manifest.get('data_dir') if manifest else None
+    stale    = []
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name.startswith(DATA_PREFIX) and name != current:
+            stale.append(name)
+        elif current and name.startswith("col") and name.endswith(".npy"):
+            stale.append(name)
+        elif name.startswith(TEMP_PREFIX) and time.time() - os.path.getmtime(path) > STALE_TEMP_AGE:
+            stale.append(name)
+    remove_data(store_dir, stale)
+
+def read_column_store(store_dir, columns=None, mmap=True):
+    """
+    Reads the given columns (default: all) from the column store at store_dir and returns a pandas.DataFrame.
+    Raises KeyError if a requested column isn't in the store.
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        raise IOError("No column store found at %s" % store_dir)
+
+    if columns is None: columns = manifest['columns']
+    missing = [column for column in columns if column not in manifest['columns']]
+    if len(missing) > 0:
+        raise KeyError("Columns %s not found in %s" % (str(missing), store_dir))
+
+    # stores written before data directories have their column files in store_dir
+    data_dir  = os.path.join(store_dir, manifest.get('data_dir') or "")
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for column in columns:
+        column_file  = manifest['files'][manifest['columns'].index(column)]
+        data[column] = numpy.load(os.path.join(data_dir, column_file), mmap_mode=mmap_mode, allow_pickle=False)
+    return pandas.DataFrame(data, columns=list(columns))
+
+def column_store_is_current(csv_file, store_dir=None):
+    """
+    Returns True if the column store for csv_file exists and was built from the current version of csv_file.
+    csv_file may also be the list of source files of a column store derived from several files.
+    """
+    if store_dir is None: store_dir = column_store_dir(csv_file)
+    manifest = read_manifest(store_dir)
+    if manifest is None: return False
+    if not os.path.isdir(os.path.join(store_dir, manifest.get('data_dir') or "")): return False
+    return manifest['source'] == source_stats(csv_file)
+
+def update_column_store(csv_file):
+    """
+    Converts csv_file to its column store, if the column store is missing or out of date.
+    Returns the column store directory, or None if it couldn't be written (e.g. read-only location).
+    """
+    store_dir = column_store_dir(csv_file)
+    if column_store_is_current(csv_file, store_dir): return store_dir
+
+    table_df = pandas.read_csv(csv_file, sep=",")
+    try:
+        write_column_store(store_dir, table_df, source=csv_file)
+        print("Wrote column store %s for %s" % (store_dir, csv_file))
+    except (IOError, OSError) as e:
+        print("Could not write column store %s: %s" % (store_dir, str(e)))
+        return None
+    return store_dir
+
+def csv_columns(csv_file, use_cache=True):
+    """
+    Returns the list of columns in csv_file.
+    """
+    if use_cache:
+        store_dir = update_column_store(csv_file)
+        manifest  = read_manifest(store_dir) if store_dir else None
+        if manifest: return manifest['columns']
+    return pandas.read_csv(csv_file, sep=",", nrows=0).columns.tolist()
+
+def read_csv_columns(csv_file, columns=None, use_cache=True):
+    """
+    Returns a pandas.DataFrame with the given columns (default: all) of csv_file.
+    With use_cache, reads via the column store next to csv_file, creating or refreshing it as needed.
+    """
+    if use_cache:
+        store_dir = update_column_store(csv_file)
+        if store_dir:
+            try:
+                return read_column_store(store_dir, columns)
+            except (IOError, OSError, ValueError) as e:
+                # e.g. the store was replaced by another process as we read it
+                print("Could not read column store %s: %s" % (store_dir, str(e)))
+
+    return pandas.read_csv(csv_file, sep=",", usecols=columns)
@@ -0,0 +1,121 @@
+import collections, os, struct
+import numpy, pandas
+
+USAGE = """
+
+  Not run directly.  Reads dBASE (.dbf) files such as the transit assignment link files,
+  trn\\trnlink[timeperiod]_[acc]_[mode]_[egr].dbf, into a pandas.DataFrame.
+
+  The records are memory mapped as a numpy structured array (one fixed-width field per dbf field),
+  and each field is decoded for all records at once, so there's no per-record Python work.
+
+  e.g.
+    import dbfTable
+    trnlink_df = dbfTable.read_dbf(os.path.join("trn","trnlinkam_wlk_loc_wlk.dbf"), columns=['A','B','MODE','AB_VOL'])
+
+"""
+
+HEADER_FORMAT     = "<BBBBIHH20x"   # version, year, month, day, num records, header length, record length
+HEADER_SIZE       = 32
+FIELD_FORMAT      = "<11sc4xBB14x"  # name, type, length, decimal count
+FIELD_SIZE        = 32
+HEADER_TERMINATOR = b"\x0d"
+DELETED_FLAG      = b"*"
+
+# dbf field type => how it's decoded
+NUMERIC_TYPES     = [b"N", b"F"]
+LOGICAL_TRUE      = [b"T", b"t", b"Y", b"y"]
+LOGICAL_FALSE     = [b"F", b"f", b"N", b"n"]
+
+DbfField = collections.namedtuple('DbfField', ['name', 'type', 'length', 'decimals'])
+
+def read_dbf_header(dbf_file):
+    """
+    Returns (num_records, header_length, record_length, fields) for the given dbf file,
+    where fields is a list of DbfField.
+    """
+    with open(dbf_file, "rb") as dbf_fh:
+        (version, year, month, day, num_records, header_length, record_length) = \
+            struct.unpack(HEADER_FORMAT, dbf_fh.read(HEADER_SIZE))
+        fields = []
+        while True:
+            descriptor = dbf_fh.read(FIELD_SIZE)
+            if len(descriptor) == 0 or descriptor[0:1] == HEADER_TERMINATOR: break
+            if len(descriptor) < FIELD_SIZE:
+                raise ValueError("Truncated field descriptor in %s" % dbf_file)
+            (name, field_type, length, decimals) = struct.unpack(FIELD_FORMAT, descriptor)
+            name = name.split(b"\x00")[0].strip().decode("ascii")
+            fields.append(DbfField(str(name), field_type, length, decimals))
+    return (num_records, header_length, record_length, fields)
+
+def record_dtype(fields, record_length):
+    """
+    Returns the numpy structured dtype for a record: the deletion flag, then a fixed-width bytes field per dbf field.
+    """
+    dtype_list = [('_deleted', 'S1')] + [(field.name, 'S%d' % field.length) for field in fields]
+    padding    = record_length - 1 - sum([field.length for field in fields])
+    if padding < 0:
+        raise ValueError("dbf fields (%d bytes) don't fit in the record length (%d)" % (record_length-1-padding, record_length))
+    if padding > 0: dtype_list.append(('_padding', 'S%d' % padding))
+    return numpy.dtype(dtype_list)
+
+def decode_numeric(values, decimals):
+    """
+    Decodes fixed-width numeric dbf values (bytes) to float64, or int64 if there are no decimals and no blanks.
+    Blank values and overflow values (all asterisks) are NaN.
+    """
+    try:
+        decoded = values.astype(numpy.float64)
+    except ValueError:
+        stripped = numpy.char.strip(values)
+        missing  = (stripped == b"") | (numpy.char.strip(stripped, b"*") == b"")
+        decoded  = numpy.where(missing, b"nan", stripped).astype(numpy.float64)
+    if decimals == 0 and not numpy.isnan(decoded).any() and (decoded == numpy.floor(decoded)).all():
+        return decoded.astype(numpy.int64)
+    return decoded
+
+def decode_field(values, field):
+    """
+    Decodes the given field for all records, returning a numpy array.
+    """
+    if field.type in NUMERIC_TYPES:
+        return decode_numeric(values, field.decimals)
+    if field.type == b"L":
+        first   = values.astype('S1')
+        decoded = numpy.full(len(values), None, dtype=object)
+        decoded[numpy.isin(first, LOGICAL_TRUE)]  = True
+        decoded[numpy.isin(first, LOGICAL_FALSE)] = False
+        return decoded
+    if field.type == b"D":
+        return pandas.to_datetime(numpy.char.strip(values).astype(str), format="%Y%m%d", errors="coerce").values
+    # character and anything else: strings
+    return numpy.char.strip(numpy.char.decode(values, "latin-1"))
+
+def read_dbf(dbf_file, columns=None):
+    """
+    Returns a pandas.DataFrame with the given columns (default: all) of dbf_file.  Deleted records are skipped.
+    """
+    (num_records, header_length, record_length, fields) = read_dbf_header(dbf_file)
+    if columns is not None:
+        missing = [column for column in columns if column not in [field.name for field in fields]]
+        if len(missing) > 0:
+            raise KeyError("Columns %s not found in %s" % (str(missing), dbf_file))
+
+    dtype   = record_dtype(fields, record_length)
+    # don't map past the end of the file, in case num_records overstates it
+    num_records = min(num_records, max(os.path.getsize(dbf_file) - header_length, 0) // record_length)
+    if num_records == 0:
+        records = numpy.zeros(0, dtype=dtype)
+    else:
+        records = numpy.memmap(dbf_file, dtype=dtype, mode='r', offset=header_length, shape=(num_records,))
+    keep    = (records['_deleted'] != DELETED_FLAG)
+
+    data    = collections.OrderedDict()
+    for field in fields:
+        if columns is not None and field.name not in columns: continue
+        data[field.name] = decode_field(numpy.asarray(records[field.name][keep]), field)
+    del records
+
+    table_df = pandas.DataFrame(data, columns=list(data.keys()))
+    print("  Read %d lines from %s" % (len(table_df), dbf_file))
+    return table_df
@@ -0,0 +1,169 @@
+import argparse, csv, os, sys
+import numpy
+from LoadedNetwork import LoadedNetwork
+
+USAGE = """
+
+  python emfacSpeedBins.py [--iter 3] [--bin_edges 0,5,10,...,65] run_dir [run_dir ...]
+
+  Tallies roadway network VMT by EMFAC speed bin, county, timeperiod and vehicle class from
+  [run_dir]\\hwy\\iter[iter]\\avgload5period_vehclasses.csv, in one pass over the network.
+  This is the network (between zones) part of the EMFAC process, replacing
+  model-files\\scripts\\emfac\\CreateSpeedBinsBetweenZones.job.
+
+  For each run_dir, writes into [run_dir]\\emfac:
+  * SpeedBinVMT.csv, with VMT by timeperiod, county, speed bin and vehicle class
+  * CreateSpeedBinsBetweenZones_sums.csv, in the format written by CreateSpeedBinsBetweenZones.job
+    (VMT by county, speed bin and hour, using the EMFAC diurnal factors) for SumSpeedBins1.awk.
+    The awk scripts expect the 13 CARB speed bins, so this is only written with the default bin_edges.
+
+  As in CreateSpeedBinsBetweenZones.job:
+  * the county is the link's gl
+  * dummy links (ft 6) are assigned a speed of 25 mph
+  * speed bins include their lower edge but not their upper edge, and VMT at speeds outside of
+    the bins (by default, 65 mph or more) isn't tallied
+
+  Differences from CreateSpeedBinsBetweenZones.job: the EV VMT includes volEV_smt (the job adds volEV_sm
+  twice instead), and counties with no VMT in an hour are written as zero.
+
+"""
+
+# 13 CARB speed cohorts of 5 mph each
+DEFAULT_BIN_EDGES = [0.0, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0, 35.0, 40.0, 45.0, 50.0, 55.0, 60.0, 65.0]
+DUMMY_LINK_SPEED  = 25.0
+
+# county (gl) => (county name, ARB county code), in the order of CreateSpeedBinsBetweenZones_sums.csv
+COUNTIES = [
+    (4,  'Alameda',        1),
+    (5,  'Contra Costa',   7),
+    (9,  'Marin',         21),
+    (7,  'Napa',          28),
+    (1,  'San Francisco', 38),
+    (2,  'San Mateo',     41),
+    (3,  'Santa Clara',   43),
+    (6,  'Solano',        48),
+    (8,  'Sonoma',        49),
+    (10, 'External Zones', 9999)
+]
+NUM_COUNTY_CODES = 11  # gl is 1-10
+
+# hour (1-24) => (timeperiod, share of timeperiod VMT in that hour), consistent with EMFAC
+DIURNAL_FACTORS = {
+     1:('EV',0.067),  2:('EV',0.025),  3:('EV',0.025),
+     4:('EA',0.157),  5:('EA',0.298),  6:('EA',0.545),
+     7:('AM',0.164),  8:('AM',0.336),  9:('AM',0.309), 10:('AM',0.191),
+    11:('MD',0.157), 12:('MD',0.198), 13:('MD',0.207), 14:('MD',0.203), 15:('MD',0.235),
+    16:('PM',0.251), 17:('PM',0.261), 18:('PM',0.288), 19:('PM',0.200),
+    20:('EV',0.248), 21:('EV',0.190), 22:('EV',0.192), 23:('EV',0.144), 24:('EV',0.109)
+}
+
+def speed_bin_vmt(network, bin_edges=DEFAULT_BIN_EDGES, dummy_link_speed=DUMMY_LINK_SPEED):
+    """
+    Returns network VMT as an array of [timeperiod, county (gl), speed bin, vehclass], where
+    speed bin i is bin_edges[i] <= congested speed < bin_edges[i+1].
+
+    Parameters
+    ----------
+    network : LoadedNetwork
+        The loaded network, read with the gl link attribute.
+    bin_edges : list of floats
+        The speed bin edges, increasing.
+    dummy_link_speed : float
+        Speed used for dummy links (ft 6), or None to use their congested speed.
+    """
+    bin_edges   = numpy.asarray(bin_edges, dtype=numpy.float64)
+    if numpy.any(numpy.diff(bin_edges) <= 0):
+        raise ValueError("Speed bin edges must be increasing: %s" % str(bin_edges))
+    num_bins    = len(bin_edges) - 1
+    num_periods = len(LoadedNetwork.TIMEPERIODS)
+    num_classes = len(LoadedNetwork.VEHCLASSES)
+
+    speed       = network.cspd
+    if dummy_link_speed is not None:
+        speed   = numpy.where((network.ft == 6)[:,numpy.newaxis], dummy_link_speed, speed)
+    speed_bin   = numpy.searchsorted(bin_edges, speed, side='right') - 1   # [link, period]
+    in_bin      = (speed_bin >= 0) & (speed_bin < num_bins)
+
+    county      = network.link_attrs['gl']
+    if county.min() < 0 or county.max() >= NUM_COUNTY_CODES:
+        raise ValueError("Unexpected county (gl) codes in %s" % network.network_file)
+
+    # key[link, period] = ((period x counties) + county) x bins + bin, then x vehclasses in the bincount
+    period      = numpy.arange(num_periods)[numpy.newaxis,:]
+    key         = ((period*NUM_COUNTY_CODES + county[:,numpy.newaxis])*num_bins + speed_bin)[in_bin]
+    vmt         = network.vmt()[in_bin]                                      # [link-period, vehclass]
+    key         = key[:,numpy.newaxis]*num_classes + numpy.arange(num_classes)[numpy.newaxis,:]
+    tally       = numpy.bincount(key.ravel(), weights=vmt.ravel(),
+                                 minlength=num_periods*NUM_COUNTY_CODES*num_bins*num_classes)
+    return tally.reshape(num_periods, NUM_COUNTY_CODES, num_bins, num_classes)
+
+def hourly_speed_bin_vmt(bin_vmt):
+    """
+    Given speed bin VMT as returned by speed_bin_vmt(), returns VMT summed across vehicle classes
+    and distributed to hours using DIURNAL_FACTORS, as [county (gl), speed bin, hour-1].
+    """
+    period_vmt = bin_vmt.sum(axis=3)  # [period, county, bin]
+    hourly     = numpy.zeros((period_vmt.shape[1], period_vmt.shape[2], 24))
+    for hour in range(1,25):
+        (timeperiod, factor) = DIURNAL_FACTORS[hour]
+        hourly[:,:,hour-1] = period_vmt[LoadedNetwork.TIMEPERIODS.index(timeperiod)]*factor
+    return hourly
+
+def write_speed_bin_vmt(bin_vmt, bin_edges, outfile):
+    """
+    Writes speed bin VMT as returned by speed_bin_vmt() to outfile, one row per timeperiod, county,
+    speed bin and vehicle class.
+    """
+    out_fh = open(outfile, 'w')
+    writer = csv.writer(out_fh, lineterminator='\n')
+    writer.writerow(['timeperiod','countyName','arbCounty','speedBin','speedLower','speedUpper','vehclass','VMT'])
+    for p_idx in range(len(LoadedNetwork.TIMEPERIODS)):
+        for (county, county_name, arb_county) in COUNTIES:
+            for bin_idx in range(len(bin_edges)-1):
+                for v_idx in range(len(LoadedNetwork.VEHCLASSES)):
+                    writer.writerow([LoadedNetwork.TIMEPERIODS[p_idx], county_name, arb_county, bin_idx+1,
+                                     bin_edges[bin_idx], bin_edges[bin_idx+1], LoadedNetwork.VEHCLASSES[v_idx],
+                                     float(bin_vmt[p_idx,county,bin_idx,v_idx])])
+    out_fh.close()
+    print("Wrote %s" % outfile)
+
+def write_between_zones_sums(bin_vmt, outfile):
+    """
+    Writes speed bin VMT as returned by speed_bin_vmt() to outfile in the format of CreateSpeedBinsBetweenZones_sums.csv.
+    Raises ValueError unless bin_vmt has the DEFAULT_BIN_EDGES speed bins, which the SumSpeedBins*.awk scripts expect.
+    """
+    if bin_vmt.shape[2] != len(DEFAULT_BIN_EDGES)-1:
+        raise ValueError("CreateSpeedBinsBetweenZones_sums.csv requires the %d default speed bins; got %d" %
+                         (len(DEFAULT_BIN_EDGES)-1, bin_vmt.shape[2]))
+    hourly = hourly_speed_bin_vmt(bin_vmt)
+    out_fh = open(outfile, 'w')
+    out_fh.write("countyName, arbCounty, speedBin, " + ", ".join(["hour%02d" % hour for hour in range(1,25)]) + "\n")
+    for (county, county_name, arb_county) in COUNTIES:
+        for bin_idx in range(hourly.shape[1]):
+            out_fh.write("%s,%d,%d," % (county_name, arb_county, bin_idx+1) +
+                         ",".join(["%.2f" % value for value in hourly[county,bin_idx]]) + "\n")
+    out_fh.close()
+    print("Wrote %s" % outfile)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('run_dirs', type=str, nargs='+', help="Model run directories")
+    parser.add_argument('--iter', type=int, default=3, help="Iteration of the loaded network")
+    parser.add_argument('--bin_edges', type=str, default=",".join(["%g" % edge for edge in DEFAULT_BIN_EDGES]),
+                        help="Comma-delimited speed bin edges (mph)")
+    my_args = parser.parse_args()
+
+    bin_edges = [float(edge) for edge in my_args.bin_edges.split(",")]
+
+    for run_dir in my_args.run_dirs:
+        network_file = os.path.join(run_dir, "hwy", "iter%d" % my_args.iter, "avgload5period_vehclasses.csv")
+        network      = LoadedNetwork.read(network_file, link_attributes=['distance','ft','gl'])
+        bin_vmt      = speed_bin_vmt(network, bin_edges)
+
+        outdir       = os.path.join(run_dir, "emfac")
+        if not os.path.exists(outdir): os.makedirs(outdir)
+        write_speed_bin_vmt(bin_vmt, bin_edges, os.path.join(outdir, "SpeedBinVMT.csv"))
+        if bin_edges == DEFAULT_BIN_EDGES:
+            write_between_zones_sums(bin_vmt, os.path.join(outdir, "CreateSpeedBinsBetweenZones_sums.csv"))
+        else:
+            print("Not writing CreateSpeedBinsBetweenZones_sums.csv since the speed bins aren't the default")
@@ -1,10 +1,26 @@
 import csv, optparse, os, sys
+import numpy
+from LoadedNetwork import LoadedNetwork
+from MetricsLookups import MetricsLookups
+from LinkDelay import LinkDelay
+import columnStore
 
 USAGE = """
- python hwynet.py hwynet.csv
+ python hwynet.py [--emissions_speed truncate|interpolate] [--emissions_compare] [--links] hwynet.csv
 
  Reads the csv file of links from hwynet.csv and reports a number of
  metrics into metrics/vmt_vht_metrics by timeperiod and vehicle class.
+
+ With --links, also writes the metrics for each link and timeperiod (summed
+ across vehicle classes) to the column store metrics/vmt_vht_metrics_links.cols
+ (see columnStore.py), with columns a, b, ft, gl and [metric]_[timeperiod],
+ e.g. VMT_AM, CO2_AM.  Read it with columnStore.read_column_store().
+
+ Emissions rates are looked up by link speed.  By default (--emissions_speed truncate)
+ the speed is truncated to an integer, capped at 65 mph.  With --emissions_speed interpolate,
+ rates are interpolated between the integer speeds either side of the link speed.
+ --emissions_compare writes emissions by both methods to metrics/emissions_speed_comparison.csv
+ and summarizes the difference in CO2 and PM2.5.
  
  These metrics consist of the following:
   * VMT: Vehicle Miles Traveled
@@ -38,145 +54,113 @@ USAGE = """
   * PM10_wear
   * PM2.5_wear
 """
-parser = optparse.OptionParser()
+parser = optparse.OptionParser(usage=USAGE)
+parser.add_option("--emissions_speed", dest="emissions_speed", default="truncate",
+                  choices=MetricsLookups.EMISSIONS_SPEED_MODES,
+                  help="How link speeds are mapped to emissionsLookup speeds: truncate (default) or interpolate")
+parser.add_option("--emissions_compare", action="store_true", dest="emissions_compare", default=False,
+                  help="Also write emissions by both speed modes to %s" % os.path.join("metrics", "emissions_speed_comparison.csv"))
+parser.add_option("--links", action="store_true", dest="links", default=False,
+                  help="Also write link-level metrics to %s" % os.path.join("metrics", "vmt_vht_metrics_links.cols"))
 (options,args) = parser.parse_args()
 
 datafile            = args[0]
 lookupdir           = os.path.join( "INPUT","metrics" )
 vmt_vht_outputfile  = os.path.join("metrics", "vmt_vht_metrics.csv")
+link_outputdir      = os.path.join("metrics", "vmt_vht_metrics_links.cols")
+em_compare_outputfile = os.path.join("metrics", "emissions_speed_comparison.csv")
 vclasses            = ['DA','S2','S3','SM','HV','DAT','S2T','S3T','SMT','HVT']
-vclassgroup         = {'DA':'auto',  'DAT':'auto', # use for emissions
-                       'S2':'auto',  'S2T':'auto',
-                       'S3':'auto',  'S3T':'auto',
-                       'SM':'SM',    'SMT':'SM',
-                       'HV':'HV',    'HVT':'HV'}
 periods             = ['EA','AM','MD','PM','EV']
 
-# Store the link data
-infile 			= open(datafile)
-data    		= {}
-reader 			= csv.reader(infile)
-header_list 	= reader.next()
-headers     	= {header_list[i]:i for i in range(len(header_list))}
-for row in reader:
-	data[( int(row[headers['a']]),
-		   int(row[headers['b']]) )] = row
-infile.close()
-# print headers
-
-# units: Hours delay per VMT
-# Map headers -> index for this lookup and read lookup data
-nrclookup       = {} # key = vcratio, as string, %.2f
-infile    		= open(os.path.join(lookupdir,"nonRecurringDelayLookup.csv"))
-reader    		= csv.reader(infile)
-nrc_header_list = reader.next()
-nrc_headers     = {nrc_header_list[i]:i for i in range(len(nrc_header_list))}
-for row in reader:
-	nrclookup[row[nrc_headers['vcratio']]] = row
-infile.close()
-# print nrclookup
-
-# Units are collisions per 1,000,000 VMT
-# Map headers -> index for this lokup and read lookup data
-collisionlookup = {} # key = (at,ft,lanes)
-infile        	= open(os.path.join(lookupdir,"collisionLookup.csv"))
-reader          = csv.reader(infile)
-col_header_list = reader.next()
-col_headers     = {col_header_list[i]:i for i in range(len(col_header_list))}
-for row in reader:
-	collisionlookup[( int(row[col_headers['at']]),
-		              int(row[col_headers['ft']]),
-		              int(row[col_headers['lanes']]) )] = row
-collision_types = col_header_list[3:]
-infile.close()
-# print collisionlookup
-
-# Units are grams per mile (equivalent to metric tons per 1,000,000 VMT)
-emissionslookup = {} # key = (period,vclassgroup,speed)
-infile        	= open(os.path.join(lookupdir,"emissionsLookup.csv"))
-reader          = csv.reader(infile)
-em_header_list  = reader.next()
-em_headers      = {em_header_list[i]:i for i in range(len(em_header_list))}
-for row in reader:
-	emissionslookup[( row[em_headers['period']],
-		              row[em_headers['vclassgroup']],
-		              int(row[em_headers['speed']]) )] = row
-emission_types = em_header_list[3:]
-infile.close()
+# Store the link data as arrays -- one row per link
+network 		= LoadedNetwork.read(datafile, link_attributes=['distance','fft','ft','at','lanes','gl'])
+distance 		= network.distance
+fft 			= network.fft
+ft 				= network.ft
+at 				= network.at
+lanes 			= network.lanes
+# volumes[link, period, vclass]; ctim, cspd, vc [link, period]
+# LoadedNetwork.VEHCLASSES and TIMEPERIODS are in the same order as vclasses, periods
+assert([vclass.lower() for vclass in vclasses] == LoadedNetwork.VEHCLASSES)
+assert(periods == LoadedNetwork.TIMEPERIODS)
+volumes 		= network.volumes
+ctim 			= network.ctim
+cspd 			= network.cspd
+vc 				= network.vc
+
+# Read the lookups into arrays indexed by the lookup keys
+# nrc_rates[vcratio x 100, lanes]               units: Hours delay per VMT
+# collision_rates[at, ft, lanes, type]          units: collisions per 1,000,000 VMT
+# emission_rates[period, vclass, speed, type]   units: grams per mile (equivalent to metric tons per 1,000,000 VMT)
+lookups 		= MetricsLookups(lookupdir)
+collision_types = lookups.collision_types
+emission_types 	= lookups.emission_types
+emission_rates 	= lookups.vclass_emission_rates(vclasses)
 
 print('Calculating vmt and vht by vehicle class and period...')
 # Sum up VMT, VHT and Hypothetical Free Flow Time by period and vehicle class
-vht 	= {} # Key = (period,vclass)  e.g. ('AM','DA')
-vmt 	= {} # Key = (period,vclass)  e.g. ('AM','DA')
-hypfft  = {} # Key = (period,vclass)  e.g. ('AM','DA')
-
-vmt_vcl = {} # Key = (period,vclass,vcratio str,lanes (2,3,4))
-             # Note: This is only for ft=1 or ft=2 (freeway-to-freeway connectors, freeways)
-
-vmt_collisions = {} # Key = (period,vclass,at,ft,lanes)
-                    # at is 4 (non-rural) or 5(rural)
-                    # ft is 1-4 (6 not included, 5+ called 4)
-                    # lanes is 1-4 (5+ called 4)
-vmt_emissions  = {} # Key = (period,vclass,speed) where speed is capped at 65
-
-# Initialize tally dictionaries
-for period in periods:
-	for vclass in vclasses:
-		vht[(period,vclass)] 	= 0.0
-		vmt[(period,vclass)] 	= 0.0
-		hypfft[(period,vclass)]	= 0.0
-
-		for vcratio in range(101):
-			for lanes in [2,3,4]:
-				vmt_vcl[(period,vclass,"%.2f" % (vcratio*0.01),lanes)] = 0.0
-		
-		for at in [4,5]:
-			for ft in [1,2,3,4]:
-				for lanes in [1,2,3,4]:
-					vmt_collisions[(period,vclass,at,ft,lanes)] = 0.0
-
-		for speed in range(66):
-			vmt_emissions[(period,vclass,speed)] = 0.0
-
-
-# Tally VMT, VHT, Hypothetical Freeflow Time
-for ab,row in data.iteritems():
-	for period in periods:
-		for vclass in vclasses:
-			volname = 'vol' + period + '_' + vclass.lower()
-			timname = 'ctim' + period
-
-			_vmt = float( row[headers[volname]] ) * float( row[headers['distance']] )
-
-			vmt[(period,vclass)]    += _vmt
-			vht[(period,vclass)]    += float( row[headers[volname]] ) * \
-			                           float( row[headers[timname]] ) / 60.0
-			
-			hypfft[(period,vclass)] += float( row[headers[volname]] ) * \
-			                           float( row[headers['fft']]   ) / 60.0
-
-			# for this, we only care about ft=1 or ft=2 or ft==8 (freeway-to-freeway connectors, freeways, managed freeways)
-			# http://analytics.mtc.ca.gov/foswiki/Main/MasterNetworkLookupTables
-			if int( row[headers['ft']] ) in [1,2,8]:
-				vcratio = "%.2f" % min(1.0, float(row[headers['vc'+period]]))
-				lanes   = int(row[headers['lanes']])
-				if lanes < 2: lanes = 2
-				if lanes > 4: lanes = 4
-				vmt_vcl[(period,vclass,vcratio,lanes)] += _vmt
-
-			# skip Dummy links
-			if int( row[headers['ft']]) != 6:
-				if int( row[headers['ft']] ) == 8:
-					ft = 2 # Managed freeway is like a freeway
-				else:
-					ft = min( int( row[headers['ft']] ), 4)     # cap at 4
-				at = max( int( row[headers['at']] ), 4) 		# min cap at 4
-				lanes = min( int( row[headers['lanes']]), 4) 	# cap at 4
-				vmt_collisions[(period,vclass,at,ft,lanes)] += _vmt
-
-			cspd = float(row[headers['cspd'+period]])
-			cspd = min( int(cspd), 65) # cap at 65
-			vmt_emissions[(period,vclass,cspd)] += _vmt
+# Each of these is indexed by [period, vclass]
+# The per-link vehicle hours and delay are from LinkDelay, so they're consistent with other delay summaries
+link_vmt 	= network.vmt()
+link_delay 	= LinkDelay(network, lookups)
+vmt 		= link_vmt.sum(axis=0)
+vht 		= link_delay.vht.sum(axis=0)
+hypfft 		= link_delay.freeflow_vht.sum(axis=0)
+nrcdelay 	= link_delay.nrc_delay.sum(axis=0)
+
+# The remaining tallies are binned with numpy.bincount over a combined key of
+# (period, vclass, bin), so each tally is a single pass over the link arrays.
+# pv_key[link, period, vclass] = period x num vclasses + vclass
+pv_key 		= numpy.arange(len(periods)*len(vclasses)).reshape(1, len(periods), len(vclasses))
+
+def bincount_tally(link_bin, num_bins, link_mask=None, link_factor=None):
+	"""
+	Sums link_vmt by (period, vclass, link_bin) where link_bin is [link, period] or [link].
+	Links where link_mask is False are skipped.  If link_factor [link, period] is passed, link_vmt
+	is multiplied by it.  Returns array of [period, vclass, num_bins]
+	"""
+	if link_bin.ndim == 1: link_bin = link_bin[:,numpy.newaxis]
+	key     = pv_key*num_bins + link_bin[:,:,numpy.newaxis]
+	weights = link_vmt
+	if link_factor is not None:
+		weights = weights*link_factor[:,:,numpy.newaxis]
+		key     = numpy.broadcast_arrays(key, weights)[0]
+	if link_mask is not None:
+		key     = key[link_mask]
+		weights = weights[link_mask]
+	tally = numpy.bincount(key.ravel(), weights=weights.ravel(), minlength=len(periods)*len(vclasses)*num_bins)
+	return tally.reshape(len(periods), len(vclasses), num_bins)
+
+# vmt_collisions[period, vclass, at, ft, lanes]
+# at is 4 (non-rural) or 5(rural)
+# ft is 1-4 (6 not included, 5+ called 4)
+# lanes is 1-4 (5+ called 4)
+(col_at, col_ft, col_lanes, col_mask) = MetricsLookups.collision_keys(at, ft, lanes)
+assert(col_at[col_mask].max() <= 5)
+assert(col_ft[col_mask].min() >= 1 and col_lanes[col_mask].min() >= 1)
+vmt_collisions = bincount_tally((col_at-4)*16 + (col_ft-1)*4 + (col_lanes-1), 2*4*4, link_mask=col_mask)
+vmt_collisions = vmt_collisions.reshape(len(periods), len(vclasses), 2, 4, 4)
+
+# vmt_emissions[period, vclass, speed] where speed is capped at 65
+# For interpolated speeds, link vmt is split between the speeds either side, weighted by proximity
+def emissions_vmt_tally(mode):
+	(lower, upper, upper_weight) = MetricsLookups.emission_speed_bins(cspd, mode)
+	if mode == 'truncate': return bincount_tally(lower, 66)
+	return bincount_tally(lower, 66, link_factor=1.0-upper_weight) + \
+	       bincount_tally(upper, 66, link_factor=upper_weight)
+
+# Apply the lookup rates to the tallies; each of these is indexed by [period, vclass(, type)]
+col_rates 	= lookups.collision_rates[4:6, 1:5, 1:5, :]
+assert(not numpy.isnan(col_rates).any())
+# collision_rates in collisions per 1000000 VMT
+collisions 	= numpy.tensordot(vmt_collisions, col_rates, axes=3)/1000000.0
+
+em_rates 	= emission_rates[:, :, :66, :]
+assert(not numpy.isnan(em_rates).any())
+def emissions_tally(mode):
+	# emission_rates in grams per mile (equivalent to metric tons per 1000000 VMT)
+	return numpy.einsum('pvs,pvsk->pvk', emissions_vmt_tally(mode), em_rates)/1000000.0
+emissions 	= emissions_tally(options.emissions_speed)
 
 # Write out results
 outfile = open(vmt_vht_outputfile, 'w')
@@ -186,43 +170,77 @@ writer.writerow(['timeperiod', 'vehicle class',
 	'VHT',
 	'Hypothetical Freeflow Time',
 	'Non-Recurring Freeway Delay'] + collision_types + emission_types)
-for period in periods:
-	for vclass in vclasses:
-
-		# Sum the non-recurring freeway delay for this period/vclass
-		nrcdelay = 0.0
-		for vcratio in range(101):
-			vcratio_str = "%.2f" % (vcratio*0.01)
-			for lanes in [2,3,4]:
-				nrcdelay += vmt_vcl[(period,vclass,vcratio_str,lanes)] * \
-				            float(nrclookup[vcratio_str][nrc_headers['%dlanes' % lanes]])
-
-		# Sum the estimated collisions
-		collision_tallies = [0.0]*len(collision_types)
-		for at in [4,5]:
-			for ft in [1,2,3,4]:
-				for lanes in [1,2,3,4]:
-					for idx in range(len(collision_types)):
-						collision_tallies[idx] += vmt_collisions[(period,vclass,at,ft,lanes)] * \
-		   					                      float(collisionlookup[(at,ft,lanes)][col_headers[collision_types[idx]]])
-		# collisionlookup in collisions per 1000000 VMT
-		for idx in range(len(collision_tallies)):
-			collision_tallies[idx] = collision_tallies[idx]/1000000.0
-
-		# Sum the estimated emissions
-		emission_tallies = [0.0]*len(emission_types)
-		for speed in range(66):
-			for idx in range(len(emission_types)):
-				emission_tallies[idx] += vmt_emissions[(period,vclass,speed)] *\
-				                         float(emissionslookup[(period,vclassgroup[vclass],speed)][em_headers[emission_types[idx]]])
-		# emissionlookup in grams per mile (equivalent to metric tons per 1000000 VMT)
-		for idx in range(len(emission_tallies)):
-			emission_tallies[idx] = emission_tallies[idx]/1000000.0
-
-		writer.writerow([period, vclass, 
-			vmt[(period,vclass)],
-			vht[(period,vclass)],
-			hypfft[(period,vclass)],
-			nrcdelay] + collision_tallies + emission_tallies)
+for p_idx in range(len(periods)):
+	for v_idx in range(len(vclasses)):
+		writer.writerow([periods[p_idx], vclasses[v_idx],
+			float(vmt[p_idx,v_idx]),
+			float(vht[p_idx,v_idx]),
+			float(hypfft[p_idx,v_idx]),
+			float(nrcdelay[p_idx,v_idx])] + \
+			[float(x) for x in collisions[p_idx,v_idx]] + \
+			[float(x) for x in emissions[p_idx,v_idx]])
 outfile.close()
 print("Wrote %s" % vmt_vht_outputfile)
+
+if options.emissions_compare:
+	# emissions[mode][period, vclass, type]
+	mode_emissions = dict([(mode, emissions_tally(mode)) for mode in MetricsLookups.EMISSIONS_SPEED_MODES])
+	outfile = open(em_compare_outputfile, 'w')
+	writer  = csv.writer(outfile,lineterminator='\n')
+	writer.writerow(['timeperiod', 'vehicle class', 'pollutant'] + MetricsLookups.EMISSIONS_SPEED_MODES + ['difference'])
+	for p_idx in range(len(periods)):
+		for v_idx in range(len(vclasses)):
+			for idx in range(len(emission_types)):
+				values = [float(mode_emissions[mode][p_idx,v_idx,idx]) for mode in MetricsLookups.EMISSIONS_SPEED_MODES]
+				writer.writerow([periods[p_idx], vclasses[v_idx], emission_types[idx]] + values + [values[1]-values[0]])
+	outfile.close()
+	print("Wrote %s" % em_compare_outputfile)
+
+	# summarize the daily totals for the pollutants we report most
+	for idx in range(len(emission_types)):
+		if emission_types[idx] != 'CO2' and 'PM2.5' not in emission_types[idx]: continue
+		totals = [float(mode_emissions[mode][:,:,idx].sum()) for mode in MetricsLookups.EMISSIONS_SPEED_MODES]
+		print("  %-12s truncate %14.4f  interpolate %14.4f  difference %8.3f%%" %
+		      (emission_types[idx], totals[0], totals[1], 100.0*(totals[1]-totals[0])/totals[0] if totals[0] else 0.0))
+
+def link_metric_columns():
+	"""
+	Generates the link-level metric columns, one timeperiod at a time, for columnStore.write_columns().
+	These use the same lookup keys as the tallies above, so each column sums to the corresponding total.
+	"""
+	for attr in ['a','b','ft','gl']:
+		if attr in network.link_attrs: yield (attr, network.link_attrs[attr])
+
+	(em_lower, em_upper, em_weight) = MetricsLookups.emission_speed_bins(cspd, options.emissions_speed)
+	# lookup keys for links without collisions (dummy links) are arbitrary; they're zeroed by col_mask
+	col_rates 	= lookups.collision_rates[numpy.where(col_mask, col_at, 4),
+	                                      numpy.where(col_mask, col_ft, 1),
+	                                      numpy.where(col_mask, col_lanes, 1), :]    # [link, type]
+	col_rates[~col_mask,:] = 0.0
+	# vmt by emissions vehicle class group, [link, period, group]
+	groups 		= MetricsLookups.EMISSIONS_VCLASSGROUPS
+	group_vmt 	= numpy.stack([link_vmt[:,:,[v_idx for v_idx in range(len(vclasses)) if
+	                                MetricsLookups.EMISSIONS_VCLASSGROUP[vclasses[v_idx].lower()] == group]].sum(axis=2)
+	                           for group in groups], axis=2)
+
+	for p_idx in range(len(periods)):
+		period 		= periods[p_idx]
+		period_vmt 	= link_vmt[:,p_idx,:].sum(axis=1)
+		yield ("VMT_%s" % period, period_vmt)
+		yield ("VHT_%s" % period, link_delay.vht[:,p_idx,:].sum(axis=1))
+		yield ("Hypothetical Freeflow Time_%s" % period, link_delay.freeflow_vht[:,p_idx,:].sum(axis=1))
+		yield ("Non-Recurring Freeway Delay_%s" % period, link_delay.nrc_delay[:,p_idx,:].sum(axis=1))
+
+		for idx in range(len(collision_types)):
+			yield ("%s_%s" % (collision_types[idx], period), period_vmt*col_rates[:,idx]/1000000.0)
+
+		# em_rates[group, link, type]
+		em_rates 	= (1.0-em_weight[:,p_idx,numpy.newaxis])*lookups.emission_rates[p_idx][:, em_lower[:,p_idx], :] + \
+		              em_weight[:,p_idx,numpy.newaxis]*lookups.emission_rates[p_idx][:, em_upper[:,p_idx], :]
+		for idx in range(len(emission_types)):
+			yield ("%s_%s" % (emission_types[idx], period),
+			       numpy.einsum('lg,gl->l', group_vmt[:,p_idx,:], em_rates[:,:,idx])/1000000.0)
+
+if options.links:
+	columnStore.write_columns(link_outputdir, link_metric_columns())
+	print("Wrote %s" % link_outputdir)
@@ -0,0 +1,199 @@
+import argparse, os, sys
+import numpy, pandas
+from LoadedNetwork import LoadedNetwork, LinkIndex
+import columnStore
+
+USAGE = """
+
+  python networkConvergence.py [--prev_iter N-1] [--history_file logs\\network_convergence.csv] iteration
+
+  Run this from the model run dir, after the highway assignment for the given iteration (e.g. after
+  MergeNetworks.job in RunIteration.bat).
+
+  Compares the loaded networks for the given iteration and the previous one and computes the network
+  convergence statistics reported by TestNetworkConvergence.job, by timeperiod and in total:
+  * VMT, VHT                 : for the current iteration
+  * max_vol_diff, max_vht_diff : maximum absolute difference in link volume and link VHT
+  * gap_pct                  : sum of absolute link VHT differences / current VHT
+  * relgap_pct               : sum of absolute link volume differences x current congested time / current VHT,
+                               a relative gap proxy that isn't affected by offsetting time changes
+  * rmse_pct                 : percent root mean square error of link volume, relative to the previous mean volume
+
+  Reads hwy\\iter[N]\\avgload5period_vehclasses.csv if it exists (see net2csv_avgload5period.job),
+  otherwise hwy\\iter[N]\\avgload5period.csv (written by MergeNetworks.job).  Links are matched on (a,b);
+  links in only one of the networks have zero volume in the other.
+
+  Outputs:
+  * Updates the history_file with one row per iteration and timeperiod (replacing rows for this iteration),
+    so convergence can be tracked across iterations and compared across scenarios
+  * hwy\\iter[N]\\network_convergence_by_ft.csv, with the distribution of link volume changes by
+    facility type (ft) and timeperiod
+
+"""
+
+# link attributes needed, beyond the volume and congested time
+LINK_ATTRIBUTES    = ['distance','ft']
+# percentiles of absolute link volume change reported by ft
+CHANGE_PERCENTILES = [50, 90, 99]
+# the share of links with a volume change of more than this percent (of the previous volume) is reported
+CHANGE_THRESHOLDS  = [5, 10]
+
+def read_iteration_network(hwy_dir, iteration):
+    """
+    Reads the loaded network for the given iteration and returns a dict of arrays:
+    a[link], b[link], distance[link], ft[link], volume[link, timeperiod] (total across vehicle classes)
+    and ctim[link, timeperiod], in the order of LoadedNetwork.TIMEPERIODS.
+    """
+    iter_dir     = os.path.join(hwy_dir, "iter%d" % iteration)
+    network_file = os.path.join(iter_dir, "avgload5period_vehclasses.csv")
+    if os.path.exists(network_file):
+        network = LoadedNetwork.read(network_file, link_attributes=LINK_ATTRIBUTES)
+        return {'a':network.a, 'b':network.b, 'distance':network.distance, 'ft':network.ft,
+                'volume':network.volumes.sum(axis=2), 'ctim':network.ctim}
+
+    # MergeNetworks.job pads the header with spaces; this is read once, so don't cache it as a column store
+    network_file = os.path.join(iter_dir, "avgload5period.csv")
+    links_df     = columnStore.read_csv_columns(network_file, use_cache=False)
+    links_df.columns = [column.strip() for column in links_df.columns]
+    print("Read %d links from %s" % (len(links_df), network_file))
+    return {'a'        :links_df['a'].values.astype(numpy.int64),
+            'b'        :links_df['b'].values.astype(numpy.int64),
+            'distance' :links_df['distance'].values.astype(numpy.float64),
+            'ft'       :links_df['ft'].values.astype(numpy.int64),
+            'volume'   :links_df[['vol%s_tot' % timeperiod for timeperiod in LoadedNetwork.TIMEPERIODS]].values.astype(numpy.float64),
+            'ctim'     :links_df[LoadedNetwork.timeperiod_columns('ctim')].values.astype(numpy.float64)}
+
+def align_networks(prev, curr):
+    """
+    Aligns the previous iteration network to the links of the current one, appending links that are only in
+    the previous network.  Returns (prev_volume, prev_ctim, curr_volume, curr_ctim, distance, ft),
+    each indexed by link of the combined set.
+    """
+    prev_join = LinkIndex(prev['a'], prev['b']).join(curr['a'], curr['b'])
+    found     = prev_join.found
+    row       = numpy.maximum(prev_join.rows, 0)
+    prev_only = numpy.ones(len(prev['a']), dtype=bool)
+    prev_only[prev_join.rows[found]] = False
+    if (~found).any() or prev_only.any():
+        print("  %d links only in the current network, %d only in the previous" % ((~found).sum(), prev_only.sum()))
+
+    zeros       = numpy.zeros((prev_only.sum(), len(LoadedNetwork.TIMEPERIODS)))
+    prev_volume = numpy.concatenate([numpy.where(found[:,numpy.newaxis], prev['volume'][row], 0.0), prev['volume'][prev_only]])
+    prev_ctim   = numpy.concatenate([numpy.where(found[:,numpy.newaxis], prev['ctim'][row],   0.0), prev['ctim'][prev_only]])
+    curr_volume = numpy.concatenate([curr['volume'], zeros])
+    curr_ctim   = numpy.concatenate([curr['ctim'],   zeros])
+    distance    = numpy.concatenate([curr['distance'], prev['distance'][prev_only]])
+    ft          = numpy.concatenate([curr['ft'],       prev['ft'][prev_only]])
+    return (prev_volume, prev_ctim, curr_volume, curr_ctim, distance, ft)
+
+def convergence_stats(prev_volume, prev_ctim, curr_volume, curr_ctim, distance):
+    """
+    Returns a pandas.DataFrame with the convergence statistics described in USAGE, with one row for
+    each timeperiod and one for the Total (links summed across timeperiods, as in TestNetworkConvergence.job).
+    The arguments are as returned by align_networks().
+    """
+    prev_vht    = prev_volume*prev_ctim/60.0
+    curr_vht    = curr_volume*curr_ctim/60.0
+    # append the daily total as a sixth "timeperiod"
+    prev_volume = numpy.column_stack([prev_volume, prev_volume.sum(axis=1)])
+    curr_volume = numpy.column_stack([curr_volume, curr_volume.sum(axis=1)])
+    prev_vht    = numpy.column_stack([prev_vht,    prev_vht.sum(axis=1)])
+    curr_vht    = numpy.column_stack([curr_vht,    curr_vht.sum(axis=1)])
+    vol_diff    = curr_volume - prev_volume
+    # for the relative gap proxy, each timeperiod's volume change is weighted by its congested time
+    time_wtd    = numpy.abs(vol_diff[:,:-1])*curr_ctim/60.0
+    time_wtd    = numpy.column_stack([time_wtd, time_wtd.sum(axis=1)])
+    num_links   = prev_volume.shape[0]
+
+    total_vht   = curr_vht.sum(axis=0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        stats_df = pandas.DataFrame({
+            'timeperiod'   : LoadedNetwork.TIMEPERIODS + ['Total'],
+            'VMT'          : (curr_volume*distance[:,numpy.newaxis]).sum(axis=0),
+            'VHT'          : total_vht,
+            'max_vol_diff' : numpy.abs(vol_diff).max(axis=0),
+            'max_vht_diff' : numpy.abs(curr_vht - prev_vht).max(axis=0),
+            'gap_pct'      : 100.0*numpy.abs(curr_vht - prev_vht).sum(axis=0)/total_vht,
+            'relgap_pct'   : 100.0*time_wtd.sum(axis=0)/total_vht,
+            'rmse_pct'     : 100.0*numpy.sqrt((vol_diff**2).sum(axis=0)/num_links)/(prev_volume.sum(axis=0)/num_links)},
+            columns=['timeperiod','VMT','VHT','max_vol_diff','max_vht_diff','gap_pct','relgap_pct','rmse_pct'])
+    return stats_df
+
+def change_distribution(prev_volume, curr_volume, ft):
+    """
+    Returns a pandas.DataFrame with the distribution of link volume changes by ft and timeperiod:
+    the number of links, the mean and percentiles (CHANGE_PERCENTILES) of the absolute volume change,
+    and the share of links with a volume change of more than each of CHANGE_THRESHOLDS percent.
+    """
+    fts, ft_code = numpy.unique(ft, return_inverse=True)
+    abs_diff    = numpy.abs(curr_volume - prev_volume)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        pct_diff = numpy.where(prev_volume > 0, 100.0*abs_diff/prev_volume, numpy.where(abs_diff > 0, numpy.inf, 0.0))
+
+    # sort links by ft then absolute change, so each ft's changes are a contiguous sorted run
+    num_links   = numpy.bincount(ft_code, minlength=len(fts))
+    start       = numpy.concatenate([[0], numpy.cumsum(num_links)[:-1]])
+    dist_list   = []
+    for p_idx in range(len(LoadedNetwork.TIMEPERIODS)):
+        order       = numpy.lexsort((abs_diff[:,p_idx], ft_code))
+        sorted_diff = abs_diff[order, p_idx]
+        ft_dist     = {'timeperiod':LoadedNetwork.TIMEPERIODS[p_idx], 'ft':fts, 'links':num_links,
+                       'mean_abs_vol_diff':numpy.bincount(ft_code, weights=abs_diff[:,p_idx], minlength=len(fts))/num_links}
+        for percentile in CHANGE_PERCENTILES:
+            # nearest rank within each ft's run
+            rank = numpy.ceil(percentile/100.0*num_links).astype(numpy.int64) - 1
+            ft_dist['p%d_abs_vol_diff' % percentile] = sorted_diff[start + numpy.clip(rank, 0, num_links-1)]
+        for threshold in CHANGE_THRESHOLDS:
+            ft_dist['share_over_%dpct' % threshold] = \
+                numpy.bincount(ft_code, weights=(pct_diff[:,p_idx] > threshold).astype(numpy.float64), minlength=len(fts))/num_links
+        dist_list.append(pandas.DataFrame(ft_dist))
+
+    columns = ['timeperiod','ft','links','mean_abs_vol_diff'] + ['p%d_abs_vol_diff' % percentile for percentile in CHANGE_PERCENTILES] + \
+              ['share_over_%dpct' % threshold for threshold in CHANGE_THRESHOLDS]
+    return pandas.concat(dist_list, ignore_index=True)[columns]
+
+def update_history(history_file, iteration, stats_df):
+    """
+    Writes stats_df for the given iteration to history_file, replacing any rows for that iteration.
+    """
+    stats_df = stats_df.copy()
+    stats_df.insert(0, 'iteration', iteration)
+    if os.path.exists(history_file):
+        history_df = pandas.read_csv(history_file)
+        history_df = history_df.loc[history_df['iteration'] != iteration]
+        stats_df   = pandas.concat([history_df, stats_df], ignore_index=True).sort_values(by='iteration', kind='mergesort')
+    stats_df.to_csv(history_file, index=False, float_format='%.6f')
+    print("Wrote %s" % history_file)
+
+def print_stats(iteration, stats_df):
+    """
+    Prints the convergence statistics in the layout of the TestNetworkConvergence.job report.
+    """
+    print("Network Convergence Statistics for Iteration %d" % iteration)
+    print(" period   vehs * miles   vehs * hours  maxvoldiff  maxvhtdiff         gap      relgap      % rmse ")
+    print(" ------ -------------- -------------- ----------- ----------- ----------- ----------- ----------- ")
+    for row in stats_df.itertuples(index=False):
+        print(" %-6s %14s %14s %11.2f %11.2f %10.2f%% %10.2f%% %10.2f%%" %
+              (row.timeperiod, "{:,.0f}".format(row.VMT), "{:,.0f}".format(row.VHT),
+               row.max_vol_diff, row.max_vht_diff, row.gap_pct, row.relgap_pct, row.rmse_pct))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('iteration', type=int, help="Current iteration")
+    parser.add_argument('--prev_iter', type=int, default=None, help="Previous iteration (default: iteration-1)")
+    parser.add_argument('--hwy_dir', type=str, default="hwy", help="Directory with the iter[N] subdirectories")
+    parser.add_argument('--history_file', type=str, default=os.path.join("logs", "network_convergence.csv"))
+    my_args = parser.parse_args()
+
+    prev_iter = my_args.prev_iter if my_args.prev_iter is not None else my_args.iteration - 1
+    prev = read_iteration_network(my_args.hwy_dir, prev_iter)
+    curr = read_iteration_network(my_args.hwy_dir, my_args.iteration)
+    (prev_volume, prev_ctim, curr_volume, curr_ctim, distance, ft) = align_networks(prev, curr)
+
+    stats_df = convergence_stats(prev_volume, prev_ctim, curr_volume, curr_ctim, distance)
+    print_stats(my_args.iteration, stats_df)
+    update_history(my_args.history_file, my_args.iteration, stats_df)
+
+    dist_file = os.path.join(my_args.hwy_dir, "iter%d" % my_args.iteration, "network_convergence_by_ft.csv")
+    change_distribution(prev_volume, curr_volume, ft).to_csv(dist_file, index=False)
+    print("Wrote %s" % dist_file)
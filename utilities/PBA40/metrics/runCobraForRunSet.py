@@ -0,0 +1,58 @@
+USAGE = """
+
+  python runCobraForRunSet.py [--all_projects_dir all_metrics] all_BC_config.xlsx
+
+  Runs RunResults.py for every project in all_BC_config.xlsx (worksheet BC_config, one project per row with
+  the column "Folder Name"; see setupCobraForRunSet.py, which writes each project's BC_config.csv) in a single
+  process, rather than one process per project as in RunCobra.bat.
+
+  Each distinct baseline (base_dir) is read once and every project comparing against it is evaluated against
+  that in-memory RunResults, so the baseline outputs, accessibilities and loaded network aren't re-read for each
+  project.
+
+  Outputs are as RunResults.py for each project:
+  * [Folder Name]\\OUTPUT\\metrics\\BC_ProjectID[_BaseProjectID].xlsx
+  * all_projects_dir\\BC_ProjectID[_BaseProjectID].csv and quicksummary_ProjectID.csv
+  Projects that fail are reported at the end, and the others are still run.
+
+"""
+import argparse, os, sys, traceback
+import pandas
+from RunResults import runProject
+from setupCobraForRunSet import ALL_METRICS_DIR
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = USAGE,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cobra_workbook', metavar='all_BC_config.xlsx',
+                        type=str, help="Name or path of the excel workbook containing the cobra configuration.")
+    parser.add_argument('--all_projects_dir', type=str, default=ALL_METRICS_DIR,
+                        help="The directory in which to write the Benefit/Cost summary Series")
+    my_args = parser.parse_args()
+
+    # read the cobra config
+    cobra_config_df = pandas.read_excel(my_args.cobra_workbook, sheetname="BC_config")
+    assert("Folder Name" in list(cobra_config_df.columns))
+
+    if not os.path.exists(my_args.all_projects_dir): os.mkdir(my_args.all_projects_dir)
+
+    # normalized base_dir => base RunResults, read by the first project that uses it
+    base_results_cache = {}
+    failed_projects    = []
+    for row in cobra_config_df.iterrows():
+        print("====== Processing %s ======" % row[1]["Folder Name"])
+        try:
+            runProject(os.path.join(row[1]["Folder Name"], "OUTPUT", "metrics"), my_args.all_projects_dir,
+                       base_results_cache=base_results_cache)
+        except (Exception, SystemExit):
+            # RunResults exits on bad configs; keep going with the other projects
+            traceback.print_exc()
+            failed_projects.append(row[1]["Folder Name"])
+
+    print("========================")
+    print("Ran %d projects against %d baselines" % (len(cobra_config_df), len(base_results_cache)))
+    if len(failed_projects) > 0:
+        print("%d projects failed:" % len(failed_projects))
+        for folder_name in failed_projects: print("  %s" % folder_name)
+        sys.exit(2)
@@ -16,6 +16,9 @@ USAGE = """
 
 import datetime, os, sys
 import numpy, pandas
+from LoadedNetwork import LoadedNetwork
+from LinkDelay import LinkDelay
+import sgrRoadCosts, sgrTransitDelay
 
 def tally_travel_cost(iteration, sampleshare, metrics_dict):
     """
@@ -157,34 +160,52 @@ def tally_access_to_jobs(iteration, sampleshare, metrics_dict):
 
 def tally_goods_movement_delay(iteration, sampleshare, metrics_dict):
     """
-    Reads in hwy\iter%ITER%\avgload5period_vehclasses.csv and calculates total vehicle hours of delay on
+    Reads in hwy\\iter%ITER%\\avgload5period_vehclasses.csv and calculates total vehicle hours of delay on
     roadway links with regfreight != 0
 
-    Also tallys TOTPOP from landuse\tazdata.csv for per-capita delay calculation.
+    Also tallys TOTPOP from landuse\\tazdata.csv for per-capita delay calculation.
 
     Adds the following keys to the metrics_dict:
     * goods_delay_vehicle_hours : total vehicle hours of delay on regfreight roadway links
+    * goods_delay_truck_vehicle_hours : truck vehicle hours of delay on regfreight roadway links
     * goods_delay_total_pop     : total persons
     * goods_delay_vhd_per_person: goods_delay_vehicle_hours/goods_delay_total_pop
+
+    Also writes metrics\\goods_movement_delay.csv with the vehicle hours of delay (all vehicles and trucks)
+    by freight corridor (regfreight), county (gl) and timeperiod.
     """
     print "Tallying goods movement delay"
-    roadvols_df = pandas.read_csv(os.path.join("hwy","iter%d" % iteration, "avgload5period_vehclasses.csv"), sep=",")
-    tazdata_df  = pandas.read_csv(os.path.join("landuse", "tazData.csv"), sep=",")
+    network    = LoadedNetwork.read(os.path.join("hwy","iter%d" % iteration, "avgload5period_vehclasses.csv"),
+                                    link_attributes=['fft','regfreight','gl'])
+    tazdata_df = pandas.read_csv(os.path.join("landuse", "tazData.csv"), sep=",")
 
     # filter to just those with freight
-    roadvols_df = roadvols_df.loc[roadvols_df.regfreight != 0]
+    freight    = (network.link_attrs['regfreight'] != 0)
 
-    # calculate the vehicle hours of delay
-    total_vehicle_hours_delay = 0
-    for timeperiod in ['EA','AM','MD','PM','EV']:
-        # vehicle-hours of delay
-        roadvols_df['vhd_%s' % timeperiod] = roadvols_df['vol%s_tot' % timeperiod]*(roadvols_df['ctim%s' % timeperiod] - roadvols_df['fft'])/60.0
-        total_vehicle_hours_delay += roadvols_df['vhd_%s' % timeperiod].sum()
+    # calculate the vehicle hours of delay by [freight corridor, county, timeperiod]
+    link_delay = LinkDelay(network)
+    (vhd, (corridors, counties)) = link_delay.aggregate('delay', ['freight','county'],
+                                                        vehclasses=LoadedNetwork.VEHCLASSES, link_mask=freight)
+    (truck_vhd, labels)          = link_delay.aggregate('delay', ['freight','county'],
+                                                        vehclasses=LoadedNetwork.TRUCK_VEHCLASSES, link_mask=freight)
+    total_vehicle_hours_delay = vhd.sum()
 
     # store it
-    metrics_dict['goods_delay_vehicle_hours']  = total_vehicle_hours_delay
-    metrics_dict['goods_delay_total_pop']      = tazdata_df['TOTPOP'].sum()
-    metrics_dict['goods_delay_vhd_per_person'] = total_vehicle_hours_delay/float(tazdata_df['TOTPOP'].sum())
+    metrics_dict['goods_delay_vehicle_hours']       = total_vehicle_hours_delay
+    metrics_dict['goods_delay_truck_vehicle_hours'] = truck_vhd.sum()
+    metrics_dict['goods_delay_total_pop']           = tazdata_df['TOTPOP'].sum()
+    metrics_dict['goods_delay_vhd_per_person']      = total_vehicle_hours_delay/float(tazdata_df['TOTPOP'].sum())
+
+    # and the corridor detail, skipping the non-freight (regfreight 0) rows
+    (corridor_idx, county_idx, period_idx) = numpy.indices(vhd.shape).reshape(3,-1)
+    keep       = (corridors[corridor_idx] != 0)
+    delay_df   = pandas.DataFrame({"regfreight"  : corridors[corridor_idx[keep]],
+                                   "gl"          : counties[county_idx[keep]],
+                                   "timeperiod"  : numpy.array(LoadedNetwork.TIMEPERIODS)[period_idx[keep]],
+                                   "vehicle_hours_delay"      : vhd.reshape(-1)[keep],
+                                   "truck_vehicle_hours_delay": truck_vhd.reshape(-1)[keep]},
+                                  columns=["regfreight","gl","timeperiod","vehicle_hours_delay","truck_vehicle_hours_delay"])
+    delay_df.to_csv(os.path.join("metrics", "goods_movement_delay.csv"), index=False)
 
 def tally_nonauto_mode_share(iteration, sampleshare, metrics_dict):
     """
@@ -244,75 +265,39 @@ def tally_sgr_roads(iteration, sampleshare, metrics_dict):
 
     """
     print "Tallying SGR roads cost"
-    roadvols_df = pandas.read_csv(os.path.join("hwy","iter%d" % iteration, "avgload5period_vehclasses.csv"), sep=",")
+    network = LoadedNetwork.read(os.path.join("hwy","iter%d" % iteration, "avgload5period_vehclasses.csv"),
+                                 link_attributes=['distance'] + sgrRoadCosts.opcost_columns())
     # [auto,smtr,lrtr]opc      = total opcost for autos, small trucks and large trucks in 2000 cents per mile
     # [auto,smtr,lrtr]opc_pave = opcost just from pavement imperfection in 2000 cents per mile
 
-    # keep sums
-    sgr_road_total_auto_cost    = 0
-    sgr_road_total_smtr_cost    = 0
-    sgr_road_total_lrtr_cost    = 0
-    sgr_road_pavement_auto_cost = 0
-    sgr_road_pavement_smtr_cost = 0
-    sgr_road_pavement_lrtr_cost = 0
-    auto_vmt = 0
-    smtr_vmt = 0
-    lrtr_vmt = 0
-
-    for timeperiod in ['EA','AM','MD','PM','EV']:
-        # total auto volume for the timeperiod
-        roadvols_df['vol%s_auto' % timeperiod] = roadvols_df['vol%s_da'  % timeperiod] + roadvols_df['vol%s_s2'  % timeperiod] + roadvols_df['vol%s_s3'  % timeperiod] + \
-                                                 roadvols_df['vol%s_dat' % timeperiod] + roadvols_df['vol%s_s2t' % timeperiod] + roadvols_df['vol%s_s3t' % timeperiod]
-        # vmt
-        roadvols_df['vmt%s_auto' % timeperiod] = roadvols_df['vol%s_auto' % timeperiod]*roadvols_df['distance']
-        roadvols_df['vmt%s_smtr' % timeperiod] = roadvols_df['distance']*(roadvols_df['vol%s_sm' % timeperiod]+roadvols_df['vol%s_smt' % timeperiod])
-        roadvols_df['vmt%s_lrtr' % timeperiod] = roadvols_df['distance']*(roadvols_df['vol%s_hv' % timeperiod]+roadvols_df['vol%s_hvt' % timeperiod])
-
-        # auto opcost in $2000 - total + pavement-based
-        roadvols_df['autoopc_2000$_%s'      % timeperiod] = 0.01*roadvols_df['autoopc'     ]*roadvols_df['vmt%s_auto' % timeperiod]
-        roadvols_df['autoopc_2000$_%s_pave' % timeperiod] = 0.01*roadvols_df['autoopc_pave']*roadvols_df['vmt%s_auto' % timeperiod]
-        # small truck opcost in $2000 - total + pavement-based
-        roadvols_df['smtropc_2000$_%s'      % timeperiod] = 0.01*roadvols_df['smtropc'     ]*roadvols_df['vmt%s_smtr' % timeperiod]
-        roadvols_df['smtropc_2000$_%s_pave' % timeperiod] = 0.01*roadvols_df['smtropc_pave']*roadvols_df['vmt%s_smtr' % timeperiod]
-        # large truck opcost in $2000 - total + pavement-based
-        roadvols_df['lrtropc_2000$_%s'      % timeperiod] = 0.01*roadvols_df['lrtropc'     ]*roadvols_df['vmt%s_lrtr' % timeperiod]
-        roadvols_df['lrtropc_2000$_%s_pave' % timeperiod] = 0.01*roadvols_df['lrtropc_pave']*roadvols_df['vmt%s_lrtr' % timeperiod]
-
-        sgr_road_total_auto_cost    += roadvols_df['autoopc_2000$_%s'      % timeperiod].sum()
-        sgr_road_total_smtr_cost    += roadvols_df['smtropc_2000$_%s'      % timeperiod].sum()
-        sgr_road_total_lrtr_cost    += roadvols_df['lrtropc_2000$_%s'      % timeperiod].sum()
-        sgr_road_pavement_auto_cost += roadvols_df['autoopc_2000$_%s_pave' % timeperiod].sum()
-        sgr_road_pavement_smtr_cost += roadvols_df['smtropc_2000$_%s_pave' % timeperiod].sum()
-        sgr_road_pavement_lrtr_cost += roadvols_df['lrtropc_2000$_%s_pave' % timeperiod].sum()
-        auto_vmt += roadvols_df['vmt%s_auto' % timeperiod].sum()
-        smtr_vmt += roadvols_df['vmt%s_smtr' % timeperiod].sum()
-        lrtr_vmt += roadvols_df['vmt%s_lrtr' % timeperiod].sum()
-
-    # return it
-    metrics_dict['sgr_road_total_auto_cost_$2000']    = sgr_road_total_auto_cost
-    metrics_dict['sgr_road_total_smtr_cost_$2000']    = sgr_road_total_smtr_cost
-    metrics_dict['sgr_road_total_lrtr_cost_$2000']    = sgr_road_total_lrtr_cost
-    metrics_dict['sgr_road_pavement_auto_cost_$2000'] = sgr_road_pavement_auto_cost
-    metrics_dict['sgr_road_pavement_smtr_cost_$2000'] = sgr_road_pavement_smtr_cost
-    metrics_dict['sgr_road_pavement_lrtr_cost_$2000'] = sgr_road_pavement_lrtr_cost
-    metrics_dict['sgr_road_vmt_auto']                 = auto_vmt
-    metrics_dict['sgr_road_vmt_smtr']                 = smtr_vmt
-    metrics_dict['sgr_road_vmt_lrtr']                 = lrtr_vmt
+    # opcost in $2000 - total + pavement-based, for the single opcost scenario in the network
+    costs = sgrRoadCosts.sgr_costs(sgrRoadCosts.opcost_link_vmt(network), sgrRoadCosts.network_opcost_matrix(network))
+    for (key, cost) in zip(sgrRoadCosts.cost_keys(), costs[0]):
+        metrics_dict[key] = cost
+
+    # daily vmt
+    for (group, vehclasses, prefix) in sgrRoadCosts.OPCOST_GROUPS:
+        metrics_dict['sgr_road_vmt_%s' % group] = network.vmt(vehclasses).sum()
 
 def tally_sgr_transit(iteration, sampleshare, metrics_dict):
     """
-    Tallies the total person delay on transit from SGR
+    Tallies the total person delay on transit from SGR, from metrics\\transit_delay.csv and its breakdown by line from
+    the transit assignment (see sgrTransitDelay.py)
 
     Adds the following keys to the metrics_dict:
     * sgr_transit_total_person_hours_delay : total person hours of delay on transit
     * sgr_transit_total_person_trips       : total person trips
     * sgr_transit_delay_min_per_person_trip: (person hours of delay / person trips) * 60 min/hour
+
+    Also writes the delay by line and by operator, which sum to the total, to metrics\\transit_delay_by_line.csv and
+    metrics\\transit_delay_by_operator.csv
     """
     print "Tallying SGR transit delay"
-    delay_df = pandas.read_csv(os.path.join("metrics","transit_delay.csv"), sep=",")
-    metrics_dict['sgr_transit_total_person_hours_delay' ] = delay_df['Person Hours Delay'].sum()
-    metrics_dict['sgr_transit_total_person_trips'       ] = delay_df['Transit Trips'].sum()
-    metrics_dict['sgr_transit_delay_min_per_person_trip'] = 60.0*float(metrics_dict['sgr_transit_total_person_hours_delay'])/float(metrics_dict['sgr_transit_total_person_trips'])
+    (lines_df, delay_df) = sgrTransitDelay.read_transit_delay("trn", "sgr")
+    sgrTransitDelay.delay_metrics(lines_df, delay_df, metrics_dict)
+
+    lines_df.to_csv(os.path.join("metrics","transit_delay_by_line.csv"), index=False)
+    sgrTransitDelay.operator_delay(lines_df).to_csv(os.path.join("metrics","transit_delay_by_operator.csv"), index=False)
 
 if __name__ == '__main__':
     pandas.set_option('display.width', 500)
@@ -6,7 +6,9 @@ USAGE = """
     one BC_config.csv per row, plus the additional column "Folder Name"
   * Writes the relevant BC_config.csv (if updated) into the [project_folder]\BC_config.csv
   * Writes the relevant BC_config.csv (if updated) into the [project_folder]\OUTPUT\metrics\BC_config.csv
-  * Writes a RunCobra.bat file to the local dir for running the actual cobra
+  * Writes a RunCobra.bat file to the local dir for running the actual cobra.
+    With --batch, RunCobra.bat runs all the projects in one process with runCobraForRunSet.py,
+    which reads each baseline once.
 
 """
 import argparse, difflib, os, shutil, sys
@@ -70,6 +72,8 @@ if __name__ == '__main__':
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('cobra_workbook', metavar='all_BC_config.xlsx',
                         type=str, help="Name or path of the excel workbook containing the cobra configuration.")
+    parser.add_argument('--batch', action='store_true',
+                        help="Run all the projects in one process, reading each baseline once.")
     my_args = parser.parse_args()
 
     # read the cobra config
@@ -94,7 +98,11 @@ if __name__ == '__main__':
         save_if_diffs(bc_config_lines, os.path.join(row[1]["Folder Name"], "BC_config.csv"))
         save_if_diffs(bc_config_lines, os.path.join(row[1]["Folder Name"], "OUTPUT", "metrics", "BC_config.csv"))
 
-        cobra_batch_lines.append('python "%%COBRA_DIR%%\RunResults.py" "%s" %s' % (os.path.join(row[1]["Folder Name"], "OUTPUT", "metrics"), ALL_METRICS_DIR))
+        if not my_args.batch:
+            cobra_batch_lines.append('python "%%COBRA_DIR%%\RunResults.py" "%s" %s' % (os.path.join(row[1]["Folder Name"], "OUTPUT", "metrics"), ALL_METRICS_DIR))
+
+    if my_args.batch:
+        cobra_batch_lines.append('python "%%COBRA_DIR%%\\runCobraForRunSet.py" --all_projects_dir %s "%s"' % (ALL_METRICS_DIR, my_args.cobra_workbook))
 
     # write the batch dir
     cobra_batch_lines.append("")
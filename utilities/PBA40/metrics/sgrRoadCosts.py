@@ -0,0 +1,104 @@
+import argparse, os, sys
+import numpy, pandas
+from LoadedNetwork import LoadedNetwork, LinkIndex
+import columnStore
+
+USAGE = """
+
+  python sgrRoadCosts.py [--output sgr_road_costs.csv] network_csv opcost_csv [opcost_csv ...]
+
+  Evaluates roadway operating costs for autos, small trucks and large trucks under any number of
+  pavement condition (state of good repair) scenarios, against the loaded volumes in one network.
+
+  * network_csv is the loaded network with volumes, e.g. hwy\\iter3\\avgload5period_vehclasses.csv
+  * each opcost_csv has the per-link operating costs for one pavement scenario: columns a, b and
+    autoopc, autoopc_pave, smtropc, smtropc_pave, lrtropc, lrtropc_pave (2000 cents per mile).
+    The loaded network csv from a pavement scenario run (e.g. one of ROAD_SGR_RUNS in bus_opcost.py) works.
+
+  All scenarios are evaluated with a single matrix product.  Outputs a csv with one row per scenario
+  and the sgr_road_* costs in $2000 as in scenarioMetrics.tally_sgr_roads().
+
+"""
+
+# vehicle group => (vehicle classes, opcost column prefix)
+OPCOST_GROUPS = [
+    ('auto', LoadedNetwork.AUTO_VEHCLASSES,        'autoopc'),
+    ('smtr', LoadedNetwork.SMALL_TRUCK_VEHCLASSES, 'smtropc'),
+    ('lrtr', LoadedNetwork.LARGE_TRUCK_VEHCLASSES, 'lrtropc')
+]
+# total opcost and opcost from pavement imperfection, in 2000 cents per mile
+OPCOST_TYPES   = [('total', ''), ('pavement', '_pave')]
+
+def opcost_columns():
+    """
+    Returns the opcost columns, in the order of the last axis of the opcost matrix:
+    for each of OPCOST_TYPES, for each of OPCOST_GROUPS.
+    """
+    return ["%s%s" % (prefix, suffix) for (cost_type, suffix) in OPCOST_TYPES for (group, vehclasses, prefix) in OPCOST_GROUPS]
+
+def cost_keys():
+    """
+    Returns the metric names for the columns of opcost_columns(), e.g. sgr_road_total_auto_cost_$2000
+    """
+    return ["sgr_road_%s_%s_cost_$2000" % (cost_type, group) for (cost_type, suffix) in OPCOST_TYPES for (group, vehclasses, prefix) in OPCOST_GROUPS]
+
+def opcost_link_vmt(network):
+    """
+    Returns daily VMT for the vehicle group of each of opcost_columns(), as [link, opcost column].
+    """
+    group_vmt = dict([(group, network.vmt(vehclasses).sum(axis=1)) for (group, vehclasses, prefix) in OPCOST_GROUPS])
+    return numpy.column_stack([group_vmt[group] for (cost_type, suffix) in OPCOST_TYPES for (group, vehclasses, prefix) in OPCOST_GROUPS])
+
+def network_opcost_matrix(network):
+    """
+    Returns the opcost matrix [link, scenario, opcost column] for the single scenario in the network itself.
+    The network must have been read with the opcost_columns() link attributes.
+    """
+    return numpy.column_stack([network.link_attrs[column] for column in opcost_columns()])[:,numpy.newaxis,:]
+
+def read_opcost_matrix(network, opcost_files, use_cache=False):
+    """
+    Reads the per-link opcosts from each of the given files and returns them as an opcost matrix,
+    [link, scenario, opcost column], aligned to the links in network.  Links that aren't in an opcost
+    file have no opcost (NaN) for that scenario; the number of these is reported.
+    The opcost files are usually other runs' networks, so they're read without a column store unless use_cache.
+    """
+    opcosts = numpy.full((network.num_links, len(opcost_files), len(opcost_columns())), numpy.nan)
+    for s_idx in range(len(opcost_files)):
+        opcost_df = columnStore.read_csv_columns(opcost_files[s_idx], ['a','b'] + opcost_columns(), use_cache=use_cache)
+
+        # rows in opcost_df for each network link
+        opcost_join = LinkIndex(opcost_df['a'].values, opcost_df['b'].values).join(network.a, network.b)
+
+        opcosts[opcost_join.found, s_idx, :] = opcost_df[opcost_columns()].values[opcost_join.rows[opcost_join.found]]
+        if opcost_join.num_failed > 0:
+            print("  %d of %d network links not found in %s" % (opcost_join.num_failed, network.num_links, opcost_files[s_idx]))
+    return opcosts
+
+def sgr_costs(link_vmt, opcosts):
+    """
+    Returns operating costs in $2000 as [scenario, opcost column], given link_vmt as returned by
+    opcost_link_vmt() and opcosts [link, scenario, opcost column] in 2000 cents per mile.
+    Links without an opcost (NaN) contribute nothing.
+    """
+    opcosts = numpy.where(numpy.isnan(opcosts), 0.0, opcosts)
+    return 0.01*numpy.einsum('lsc,lc->sc', opcosts, link_vmt)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('network_csv',  type=str, help="Loaded network with volumes")
+    parser.add_argument('opcost_csvs',  type=str, nargs='+', help="Per-link opcosts, one file per pavement scenario")
+    parser.add_argument('--output',     type=str, default="sgr_road_costs.csv")
+    my_args = parser.parse_args()
+
+    network  = LoadedNetwork.read(my_args.network_csv, link_attributes=['distance'])
+    link_vmt = opcost_link_vmt(network)
+    opcosts  = read_opcost_matrix(network, my_args.opcost_csvs)
+    costs    = sgr_costs(link_vmt, opcosts)
+
+    costs_df = pandas.DataFrame(costs, columns=cost_keys())
+    costs_df.insert(0, 'opcost_file', my_args.opcost_csvs)
+    for (group, vehclasses, prefix) in OPCOST_GROUPS:
+        costs_df['sgr_road_vmt_%s' % group] = network.vmt(vehclasses).sum()
+    costs_df.to_csv(my_args.output, index=False)
+    print("Wrote %s" % my_args.output)
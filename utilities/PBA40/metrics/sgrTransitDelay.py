@@ -0,0 +1,188 @@
+import argparse, os, re
+import numpy, pandas
+from TransitRidership import TransitRidership
+import transitAssignment
+
+USAGE = """
+
+  python sgrTransitDelay.py [--trn_dir trn] [--sgr_dir sgr] [--delay_file metrics\\transit_delay.csv]
+                            [--modes_file reference-transit-modes.csv] [--output_dir metrics]
+
+  Tallies transit delay from pavement and vehicle condition (state of good repair) by operator, mode type and line
+  from the transit assignment (the transit link cube, see transitAssignment.py), consistent with the regional
+  sgr_transit_* metrics from sumTransitDelay.job (delay_file).
+
+  SGR delay isn't in the assigned link TIME; TransitSkims.job adds it to the skims by line-haul mode number from
+  * sgr_dir\\invehicle_penalties_by_mode_code.block : _invehicle_[mode], minutes of delay per mile
+  * sgr_dir\\boarding_penalties_by_mode_code.block  : _board_[mode], minutes of delay per boarding
+  so the same penalties are applied to every line segment and timeperiod: the passenger volume (AB_VOL) times the
+  segment miles times the in-vehicle penalty, plus the boardings (AB_BRDA) times the boarding penalty.  Vehicle hours of
+  delay are the vehicle runs (from FREQ) times the segment miles times the in-vehicle penalty.
+
+  The person hours of delay by segment are then scaled so they sum to the Person Hours Delay in the delay_file, which
+  sumTransitDelay.job tallies from the trip tables and the delay skims.  (The two differ slightly since TransitSkims.job
+  charges each path the boarding penalty of every mode it uses plus their average for each further boarding, where
+  here each boarding is charged its own line's penalty.)  Vehicle hours of delay aren't scaled.
+
+  The operator is the mode's Name from the modes_file, model-files\\scripts\\core_summaries\\reference-transit-modes.csv
+
+  Writes to output_dir:
+  * transit_delay_by_line.csv     : by line (MODE, NAME), with its Operator and Transit mode
+  * transit_delay_by_operator.csv : by Operator and Transit mode
+  and prints the sgr_transit_* metrics as in scenarioMetrics.tally_sgr_transit(), which sum the breakdown.
+
+"""
+
+# penalty name => block file in the sgr dir, as read by TransitSkims.job
+PENALTY_FILES = [('invehicle', "invehicle_penalties_by_mode_code.block"),
+                 ('board',     "boarding_penalties_by_mode_code.block")]
+DELAY_FILE    = os.path.join("metrics","transit_delay.csv")
+
+DELAY_COLUMNS = ['Daily Boardings','Daily Passenger Hours Traveled','Person Hours In-Vehicle Delay',
+                 'Person Hours Boarding Delay','Person Hours Delay','Vehicle Hours Delay']
+# scaled to the delay_file totals by scale_delay()
+PERSON_DELAY_COLUMNS = ['Person Hours In-Vehicle Delay','Person Hours Boarding Delay','Person Hours Delay']
+
+def read_penalties(block_file, penalty):
+    """
+    Reads the Cube block file with lines like _[penalty]_[mode] = [minutes] and returns the penalty for
+    modes 0 through TransitRidership.MAX_MODE.  Modes without a penalty have none (zero).
+    """
+    penalties = numpy.zeros(TransitRidership.MAX_MODE+1)
+    block_file_obj = open(block_file, 'r')
+    for line in block_file_obj:
+        match = re.match(r"\s*_%s_(\d+)\s*=\s*([-+.0-9eE]+)" % penalty, line.split(";")[0])
+        if match: penalties[int(match.group(1))] = float(match.group(2))
+    block_file_obj.close()
+    return penalties
+
+def read_operators(modes_file):
+    """
+    Returns the operator name for modes 0 through TransitRidership.MAX_MODE from the modes_file (columns Name, mode),
+    if it exists.
+    Modes without a name are "mode [mode]".
+    """
+    operators = numpy.array(["mode %d" % mode for mode in range(TransitRidership.MAX_MODE+1)], dtype=object)
+    if modes_file and os.path.exists(modes_file):
+        modes_df = pandas.read_csv(modes_file, sep=",")
+        operators[modes_df['mode'].values.astype(numpy.int64)] = modes_df['Name'].str.strip().values
+    return operators
+
+def line_delay(cube_df, invehicle, board, operators):
+    """
+    Returns a pandas.DataFrame with a row per line (MODE, NAME) for the transit link cube, with its Operator,
+    Transit mode and the DELAY_COLUMNS, summed across segments and timeperiods.  The person hours of delay aren't
+    scaled; see scale_delay().
+
+    Parameters
+    ----------
+    cube_df : pandas.DataFrame
+        The transit link cube with MODE, NAME, SEQ, A, B, timeperiod, DIST, TIME, FREQ, AB_VOL and AB_BRDA.
+    invehicle : numpy.ndarray
+        Minutes of delay per mile by mode, from read_penalties()
+    board : numpy.ndarray
+        Minutes of delay per boarding by mode, from read_penalties()
+    operators : numpy.ndarray
+        Operator name by mode, from read_operators()
+    """
+    ridership = TransitRidership(cube_df)
+    modes     = ridership.segments_df['MODE'].values
+    miles     = ridership.segments_df['DIST'].values/100.0
+
+    segments_df = pandas.DataFrame({'MODE'                          :modes,
+                                    'NAME'                          :ridership.segments_df['NAME'].values,
+                                    'Daily Boardings'               :ridership.boardings,
+                                    'Daily Passenger Hours Traveled':ridership.pht,
+                                    'Person Hours In-Vehicle Delay' :ridership.segments_df['AB_VOL'].values*miles*invehicle[modes]/60.0,
+                                    'Person Hours Boarding Delay'   :ridership.boardings*board[modes]/60.0,
+                                    'Vehicle Hours Delay'           :ridership.runs*miles*invehicle[modes]/60.0})
+    segments_df['Person Hours Delay'] = segments_df['Person Hours In-Vehicle Delay'] + segments_df['Person Hours Boarding Delay']
+
+    lines_df = segments_df.groupby(['MODE','NAME'])[DELAY_COLUMNS].sum().reset_index()
+    lines_df.insert(0, 'Operator', operators[lines_df['MODE'].values])
+    lines_df.insert(3, 'Transit mode', TransitRidership.mode_type(lines_df['MODE'].values))
+    return lines_df
+
+def scale_delay(lines_df, delay_df):
+    """
+    Returns a copy of lines_df (from line_delay()) with the PERSON_DELAY_COLUMNS scaled so that the Person Hours Delay
+    sums to that of delay_df, the metrics\\transit_delay.csv from sumTransitDelay.job.
+
+    Raises ValueError if delay_df has delay but the lines have none to scale.
+    """
+    total_delay = delay_df['Person Hours Delay'].sum()
+    line_delay  = lines_df['Person Hours Delay'].sum()
+    if line_delay > 0:
+        scale = total_delay/line_delay
+    elif total_delay == 0:
+        scale = 1.0
+    else:
+        raise ValueError("transit_delay.csv has %f person hours of delay but the transit assignment has none" % total_delay)
+
+    scaled_df = lines_df.copy()
+    scaled_df[PERSON_DELAY_COLUMNS] = scaled_df[PERSON_DELAY_COLUMNS]*scale
+    return scaled_df
+
+def operator_delay(lines_df):
+    """
+    Returns a pandas.DataFrame with a row per Operator and Transit mode and the DELAY_COLUMNS, summed across lines.
+    """
+    return lines_df.groupby(['Operator','Transit mode'])[DELAY_COLUMNS].sum().reset_index()
+
+def delay_metrics(lines_df, delay_df, metrics_dict):
+    """
+    Adds the following keys to the metrics_dict, as in scenarioMetrics.tally_sgr_transit(), from the lines_df
+    (from scale_delay()) and the delay_df, metrics\\transit_delay.csv:
+    * sgr_transit_total_person_hours_delay : total person hours of delay on transit
+    * sgr_transit_total_person_trips       : total person trips
+    * sgr_transit_delay_min_per_person_trip: (person hours of delay / person trips) * 60 min/hour, or nan with no trips
+
+    Raises ValueError if the lines_df delay doesn't sum to the delay_df delay.
+    """
+    person_hours_delay = lines_df['Person Hours Delay'].sum()
+    if not numpy.isclose(person_hours_delay, delay_df['Person Hours Delay'].sum()):
+        raise ValueError("Person Hours Delay by line sums to %f but transit_delay.csv has %f" %
+                         (person_hours_delay, delay_df['Person Hours Delay'].sum()))
+    trips = delay_df['Transit Trips'].sum()
+
+    metrics_dict['sgr_transit_total_person_hours_delay' ] = person_hours_delay
+    metrics_dict['sgr_transit_total_person_trips'       ] = trips
+    if trips > 0:
+        metrics_dict['sgr_transit_delay_min_per_person_trip'] = 60.0*float(person_hours_delay)/float(trips)
+    else:
+        metrics_dict['sgr_transit_delay_min_per_person_trip'] = numpy.nan
+
+def read_transit_delay(trn_dir, sgr_dir, delay_file=DELAY_FILE, modes_file=TransitRidership.MODES_FILE):
+    """
+    Returns (lines_df, delay_df) where lines_df is from scale_delay() for the transit assignment in trn_dir and the
+    penalties in sgr_dir, and delay_df is the delay_file from sumTransitDelay.job.
+    """
+    (invehicle, board) = [read_penalties(os.path.join(sgr_dir, block_file), penalty) for (penalty, block_file) in PENALTY_FILES]
+    cube_df = transitAssignment.read_transit_cube(trn_dir,
+                                                  columns=['MODE','NAME','SEQ','A','B','timeperiod','DIST','TIME','FREQ','AB_VOL','AB_BRDA'])
+    delay_df = pandas.read_csv(delay_file, sep=",")
+    return (scale_delay(line_delay(cube_df, invehicle, board, read_operators(modes_file)), delay_df), delay_df)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=USAGE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trn_dir', type=str, default="trn")
+    parser.add_argument('--sgr_dir', type=str, default="sgr")
+    parser.add_argument('--delay_file', type=str, default=DELAY_FILE)
+    parser.add_argument('--modes_file', type=str, default=TransitRidership.MODES_FILE)
+    parser.add_argument('--output_dir', type=str, default="metrics")
+    my_args = parser.parse_args()
+
+    (lines_df, delay_df) = read_transit_delay(my_args.trn_dir, my_args.sgr_dir, my_args.delay_file, my_args.modes_file)
+
+    outfile = os.path.join(my_args.output_dir, "transit_delay_by_line.csv")
+    lines_df.to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    outfile = os.path.join(my_args.output_dir, "transit_delay_by_operator.csv")
+    operator_delay(lines_df).to_csv(outfile, index=False)
+    print("Wrote %s" % outfile)
+
+    metrics_dict = {}
+    delay_metrics(lines_df, delay_df, metrics_dict)
+    for key in sorted(metrics_dict.keys()):
+        print("%-37s => %f" % (key, metrics_dict[key]))
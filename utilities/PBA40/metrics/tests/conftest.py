@@ -0,0 +1,70 @@
+import os, struct, sys
+import numpy, pandas
+import pytest
+
+# the metrics scripts import each other as top-level modules
+METRICS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if METRICS_DIR not in sys.path: sys.path.insert(0, METRICS_DIR)
+
+from LoadedNetwork import LoadedNetwork
+
+def random_network_df(num_links, seed=0):
+    """
+    Returns a pandas.DataFrame like avgload5period_vehclasses.csv with num_links random links, covering
+    every ft, at and lanes used by the lookups, congested speeds above 65 mph and v/c ratios above 1.0,
+    including values that are exact ties when rounded to hundredths.
+    """
+    rng = numpy.random.RandomState(seed)
+    num_periods = len(LoadedNetwork.TIMEPERIODS)
+
+    nodes = rng.choice(numpy.arange(1, 100000), size=(num_links, 2), replace=False)
+    links_df = pandas.DataFrame({'a':nodes[:,0], 'b':nodes[:,1]}, columns=['a','b'])
+    links_df['distance']  = rng.uniform(0.05, 3.0, num_links).round(2)
+    links_df['lanes']     = rng.randint(1, 7, num_links)
+    links_df['gl']        = rng.randint(1, 10, num_links)
+    links_df['ft']        = rng.randint(1, 9, num_links)
+    links_df['at']        = rng.randint(0, 6, num_links)
+    links_df['tollclass'] = rng.choice([0, 0, 0, 4, 11, 12], num_links)
+    links_df['fft']       = (links_df['distance']*60.0/rng.uniform(20.0, 70.0, num_links)).round(4)
+
+    for timeperiod in LoadedNetwork.TIMEPERIODS:
+        cspd = rng.uniform(3.0, 75.0, num_links).round(2)
+        links_df['ctim%s' % timeperiod] = links_df['distance']*60.0/cspd
+        links_df['cspd%s' % timeperiod] = cspd
+        vc = rng.uniform(0.0, 1.3, num_links).round(3)
+        vc[:num_periods] = 0.005 + 0.01*numpy.arange(num_periods)    # ties: 0.005, 0.015, ...
+        links_df['vc%s' % timeperiod] = vc
+    for column in LoadedNetwork.volume_columns():
+        links_df[column] = rng.uniform(0.0, 500.0, num_links).round(2)*(rng.uniform(size=num_links) > 0.1)
+    return links_df
+
+@pytest.fixture
+def network_csv(tmp_path):
+    """
+    Writes a random loaded network (see random_network_df()) to avgload5period_vehclasses.csv and returns its path.
+    """
+    network_file = str(tmp_path / "avgload5period_vehclasses.csv")
+    random_network_df(300).to_csv(network_file, index=False)
+    return network_file
+
+def write_dbf(dbf_file, fields, records, deleted=(), num_records=None):
+    """
+    Writes a dBASE III file with the given fields, a list of (name, type, length, decimals), and records, a list
+    of lists of already formatted values.  Records at the deleted indices are marked deleted.  num_records is
+    written in the header (default: the number of records) and the file ends with the 0x1A end-of-file marker.
+    """
+    record_length = 1 + sum([length for (name, field_type, length, decimals) in fields])
+    header_length = 32 + 32*len(fields) + 1
+    if num_records is None: num_records = len(records)
+    with open(dbf_file, "wb") as dbf_fh:
+        dbf_fh.write(struct.pack("<BBBBIHH20x", 3, 120, 1, 1, num_records, header_length, record_length))
+        for (name, field_type, length, decimals) in fields:
+            dbf_fh.write(struct.pack("<11sc4xBB14x", name.encode("ascii"), field_type.encode("ascii"), length, decimals))
+        dbf_fh.write(b"\x0d")
+        for (record_idx, record) in enumerate(records):
+            dbf_fh.write(b"*" if record_idx in deleted else b" ")
+            for ((name, field_type, length, decimals), value) in zip(fields, record):
+                value = value.encode("latin-1")
+                # numbers are right-justified, everything else left-justified
+                dbf_fh.write(value.rjust(length) if field_type in "NF" else value.ljust(length))
+        dbf_fh.write(b"\x1a")
@@ -0,0 +1,69 @@
+import numpy, pandas
+import pytest
+
+from LoadedNetwork import LoadedNetwork, LinkIndex
+
+@pytest.fixture
+def link_table():
+    """
+    (a, b) for 500 random links with node numbers up to 2^31, in no particular order.
+    """
+    rng   = numpy.random.RandomState(0)
+    nodes = rng.choice(numpy.arange(1, 1 << 31, 7919), size=(500, 2), replace=False)
+    return (nodes[:,0], nodes[:,1])
+
+def test_join_matches_dict_lookup(link_table):
+    (a, b) = link_table
+    index  = LinkIndex(a, b)
+    rows   = dict([((a[row], b[row]), row) for row in range(len(a))])
+
+    # every link twice, reversed links (which aren't in the table) and links with unknown nodes
+    rng      = numpy.random.RandomState(1)
+    join_a   = numpy.concatenate([a, a[::-1], b[:50], a[:10] + 1])
+    join_b   = numpy.concatenate([b, b[::-1], a[:50], b[:10]])
+    shuffle  = rng.permutation(len(join_a))
+    (join_a, join_b) = (join_a[shuffle], join_b[shuffle])
+
+    link_join = index.join(join_a, join_b)
+    expected  = [rows.get((join_a[idx], join_b[idx]), -1) for idx in range(len(join_a))]
+    assert link_join.rows.tolist() == expected
+    assert link_join.found.tolist() == [row >= 0 for row in expected]
+    assert link_join.num_failed == 60
+
+def test_row_index_scalar(link_table):
+    (a, b) = link_table
+    index  = LinkIndex(a, b)
+    assert index.row_index(a[17], b[17]) == 17
+    assert index.row_index(b[17], a[17]) == -1
+
+def test_gather_and_failures():
+    index     = LinkIndex(numpy.array([10, 30, 20]), numpy.array([11, 31, 21]))
+    link_join = index.join(numpy.array([20, 10, 99, 30]), numpy.array([21, 11, 99, 31]))
+
+    numpy.testing.assert_array_equal(link_join.gather(numpy.array([1.5, 3.5, 2.5])), [2.5, 1.5, numpy.nan, 3.5])
+    assert link_join.gather(numpy.array([1, 3, 2]), missing=-1).tolist() == [2, 1, -1, 3]
+    assert link_join.gather(numpy.array(['a', 'c', 'b']), missing=None).tolist() == ['b', 'a', None, 'c']
+
+    assert link_join.failures() == (1, 4)
+    assert link_join.failures(weights=[1.0, 2.0, 4.0, 8.0]) == (4.0, 15.0)
+
+def test_all_found_keeps_dtype():
+    index     = LinkIndex(numpy.array([1, 2]), numpy.array([2, 1]))
+    link_join = index.join(numpy.array([2, 1]), numpy.array([1, 2]))
+    assert link_join.num_failed == 0
+    gathered  = link_join.gather(numpy.array([5, 6]))
+    assert gathered.dtype == numpy.int64 and gathered.tolist() == [6, 5]
+
+def test_empty_table():
+    index     = LinkIndex(numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64))
+    link_join = index.join(numpy.array([1, 2]), numpy.array([2, 3]))
+    assert link_join.rows.tolist() == [-1, -1]
+    assert link_join.failures() == (2, 2)
+    assert numpy.isnan(link_join.gather(numpy.zeros(0))).all()
+
+def test_network_row_index(network_csv):
+    network  = LoadedNetwork.read(network_csv, use_cache=False)
+    links_df = pandas.read_csv(network_csv)
+    assert network.num_links == len(links_df)
+    assert network.row_index(links_df['a'].values, links_df['b'].values).tolist() == list(range(len(links_df)))
+    assert (network.link_keys == links_df['a'].values*LoadedNetwork.LINK_KEY_FACTOR + links_df['b'].values).all()
@@ -0,0 +1,48 @@
+import numpy
+import pytest
+
+from MetricsLookups import MetricsLookups
+
+def format_hundredths(values):
+    """
+    The hundredths bins as "%.2f" formatting gives them, e.g. 0.37 => 37.
+    """
+    return [int(("%.2f" % value).replace(".", "")) for value in values]
+
+def test_hundredths_bin_matches_format():
+    rng    = numpy.random.RandomState(0)
+    # exact ties in decimal, which are rarely ties in binary, plus random values and values near ties
+    ties   = (numpy.arange(0, 20000) + 0.5)/1000.0
+    values = numpy.concatenate([ties, numpy.nextafter(ties, 0.0), numpy.nextafter(ties, 1.0e9),
+                                rng.uniform(0.0, 3.0, 100000), rng.uniform(0.0, 1.0, 1000).round(3)])
+    numpy.testing.assert_array_equal(MetricsLookups.hundredths_bin(values), format_hundredths(values))
+
+def test_hundredths_bin_ties():
+    values = [0.005, 0.015, 0.125, 0.375, 1.005]
+    assert MetricsLookups.hundredths_bin(numpy.array(values)).tolist() == format_hundredths(values)
+
+def test_nrc_keys():
+    (vcratio_bin, nrc_lanes) = MetricsLookups.nrc_keys(numpy.array([[0.374, 1.2], [0.005, 0.995]]), numpy.array([1, 6]))
+    assert vcratio_bin.tolist() == [format_hundredths([0.374, 1.0]), format_hundredths([0.005, 0.995])]
+    assert nrc_lanes.tolist() == [2, 4]
+
+def test_collision_keys():
+    (col_at, col_ft, col_lanes, link_mask) = MetricsLookups.collision_keys(
+        numpy.array([1, 5, 4, 3]), numpy.array([8, 7, 6, 1]), numpy.array([2, 5, 1, 4]))
+    assert col_at.tolist() == [4, 5, 4, 4]
+    assert col_ft.tolist() == [2, 4, 4, 1]
+    assert col_lanes.tolist() == [2, 4, 1, 4]
+    assert link_mask.tolist() == [True, True, False, True]
+
+@pytest.mark.parametrize("mode", MetricsLookups.EMISSIONS_SPEED_MODES)
+def test_emission_speed_bins(mode):
+    cspd = numpy.array([0.0, 12.7, 64.99, 65.0, 72.3])
+    (lower, upper, upper_weight) = MetricsLookups.emission_speed_bins(cspd, mode)
+    assert lower.tolist() == [0, 12, 64, 65, 65]
+    if mode == 'truncate':
+        assert upper.tolist() == lower.tolist() and not upper_weight.any()
+    else:
+        assert upper.tolist() == [1, 13, 65, 65, 65]
+        numpy.testing.assert_allclose(upper_weight, [0.0, 0.7, 0.99, 0.0, 0.0])
+    with pytest.raises(ValueError):
+        MetricsLookups.emission_speed_bins(cspd, 'round')
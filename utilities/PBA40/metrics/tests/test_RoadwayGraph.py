@@ -0,0 +1,96 @@
+import numpy, pandas
+import pytest
+
+from LoadedNetwork import LoadedNetwork
+from RoadwayGraph import RoadwayGraph
+
+NUM_ZONES = 7
+
+def graph_network(seed=0):
+    """
+    Returns a random LoadedNetwork with zones 1-5 connected to nodes 1001-1015, zone 6 not in the network
+    and zone 7 only reachable (no out-links).  Some links are value tolled (tollclass 11).
+    """
+    rng   = numpy.random.RandomState(seed)
+    nodes = numpy.arange(1001, 1016)
+    links = set()
+    while len(links) < 45:
+        (a, b) = rng.choice(nodes, 2, replace=False)
+        links.add((a, b))
+    for zone in range(1, 6):
+        for node in rng.choice(nodes, 2, replace=False):
+            links.update([(zone, node), (node, zone)])
+    links.update([(1, 2), (1003, 7), (1011, 7)])
+    links = sorted(links)
+
+    links_df = pandas.DataFrame(links, columns=['a','b'])
+    links_df['distance']  = rng.uniform(0.1, 2.0, len(links_df))
+    links_df['tollclass'] = numpy.where(rng.uniform(size=len(links_df)) < 0.2, 11, 0)
+    for timeperiod in LoadedNetwork.TIMEPERIODS:
+        links_df['ctim%s' % timeperiod] = links_df['distance']*60.0/rng.uniform(10.0, 65.0, len(links_df))
+        links_df['cspd%s' % timeperiod] = 0.0
+        links_df['vc%s'   % timeperiod] = 0.0
+    for column in LoadedNetwork.volume_columns():
+        links_df[column] = 0.0
+    return LoadedNetwork(links_df)
+
+def brute_force_skim(network, timeperiod, exclude_value_toll):
+    """
+    Floyd-Warshall over all nodes, where only non-zone nodes may be passed through, returning (time, distance)
+    skims for zones 1 through NUM_ZONES with intrazonals half of the nearest zone.
+    """
+    nodes = sorted(set(network.a.tolist() + network.b.tolist()) | set(range(1, NUM_ZONES+1)))
+    index = dict([(node, idx) for (idx, node) in enumerate(nodes)])
+    cost  = numpy.full((len(nodes), len(nodes)), numpy.inf)
+    dist  = numpy.full((len(nodes), len(nodes)), numpy.nan)
+    ctim  = network.ctim[:, LoadedNetwork.timeperiod_index([timeperiod])[0]]
+    for link in range(network.num_links):
+        if exclude_value_toll and network.link_attrs['tollclass'][link] >= 11: continue
+        (a, b) = (index[network.a[link]], index[network.b[link]])
+        (cost[a,b], dist[a,b]) = (ctim[link], network.distance[link])
+
+    for through in range(len(nodes)):
+        if nodes[through] <= NUM_ZONES: continue
+        via = cost[:,through,numpy.newaxis] + cost[numpy.newaxis,through,:]
+        better = via < cost
+        dist = numpy.where(better, dist[:,through,numpy.newaxis] + dist[numpy.newaxis,through,:], dist)
+        cost = numpy.where(better, via, cost)
+
+    zones     = [index[zone] for zone in range(1, NUM_ZONES+1)]
+    time_skim = cost[numpy.ix_(zones, zones)]
+    dist_skim = numpy.where(numpy.isinf(time_skim), numpy.nan, dist[numpy.ix_(zones, zones)])
+    for zone in range(NUM_ZONES):
+        time_skim[zone, zone] = numpy.inf
+        nearest = numpy.argmin(time_skim[zone])
+        if numpy.isinf(time_skim[zone, nearest]):
+            (time_skim[zone, zone], dist_skim[zone, zone]) = (numpy.nan, numpy.nan)
+        else:
+            (time_skim[zone, zone], dist_skim[zone, zone]) = (0.5*time_skim[zone, nearest], 0.5*dist_skim[zone, nearest])
+    return (numpy.where(numpy.isinf(time_skim), numpy.nan, time_skim), dist_skim)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("exclude_value_toll", [False, True])
+def test_matches_brute_force(seed, exclude_value_toll):
+    network = graph_network(seed)
+    graph   = RoadwayGraph(network, NUM_ZONES)
+    for timeperiod in ['AM','EV']:
+        (time_skim, dist_skim) = graph.skim(timeperiod, exclude_value_toll)
+        (expected_time, expected_dist) = brute_force_skim(network, timeperiod, exclude_value_toll)
+        numpy.testing.assert_allclose(time_skim, expected_time, rtol=1e-12)
+        numpy.testing.assert_allclose(dist_skim, expected_dist, rtol=1e-12)
+
+def test_unreachable_zones():
+    graph = RoadwayGraph(graph_network(), NUM_ZONES)
+    assert graph.zone_index[5] == -1
+    (time_skim, dist_skim) = graph.skim('AM')
+    assert numpy.isnan(time_skim[5,:]).all() and numpy.isnan(time_skim[:,5]).all()
+    # zone 7 has no out-links
+    assert numpy.isnan(time_skim[6,:]).all()
+    assert not numpy.isnan(time_skim[0,6])
+
+def test_processes_match():
+    graph = RoadwayGraph(graph_network(), NUM_ZONES)
+    (time_skim, dist_skim) = graph.skim('MD', processes=1)
+    (pool_time, pool_dist) = graph.skim('MD', processes=2)
+    numpy.testing.assert_array_equal(pool_time, time_skim)
+    numpy.testing.assert_array_equal(pool_dist, dist_skim)
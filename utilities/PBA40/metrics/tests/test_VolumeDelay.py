@@ -0,0 +1,65 @@
+import math, os
+import numpy
+import pytest
+
+from conftest import METRICS_DIR, random_network_df
+from LoadedNetwork import LoadedNetwork
+from VolumeDelay import VolumeDelay
+
+BLOCK_DIR = os.path.join(METRICS_DIR, "..", "..", "..", "model-files", "scripts", "block")
+pytestmark = pytest.mark.skipif(not os.path.isdir(BLOCK_DIR), reason="model block files not available")
+
+@pytest.fixture
+def network():
+    links_df = random_network_df(300, seed=3)
+    links_df['ffs'] = links_df['distance']*60.0/links_df['fft']
+    return LoadedNetwork(links_df)
+
+def reference_congested_time(vdf, network, link, p_idx):
+    """
+    TC[ft] from SpeedFlowCurve.block for one link and timeperiod, with Ja from FreeFlowSpeed.block.
+    """
+    ft       = int(network.ft[link])
+    capclass = 10*int(network.at[link]) + ft
+    capacity = vdf.lane_capacity[capclass]*network.lanes[link]*VolumeDelay.CAPFAC[LoadedNetwork.TIMEPERIODS[p_idx]]
+    volume   = 0.0
+    for (v_idx, vehclass) in enumerate(LoadedNetwork.VEHCLASSES):
+        volume += network.volumes[link, p_idx, v_idx]*(vdf.truck_pce if vehclass in ['hv','hvt'] else 1.0)
+
+    if ft == 6: return network.ctim[link, p_idx]
+    vc = volume/capacity
+    if ft in [1,2,8,9]:
+        return network.fft[link]*(1 + 0.20*((vc/0.75)**6))
+    distance = network.distance[link]
+    ffs      = network.link_attrs['ffs'][link]
+    ja       = ((distance/vdf.critical_speed[capclass] - distance/ffs)**2)/(distance**2)
+    return 60*((distance/ffs) + (0.25*((vc - 1) + math.sqrt(((vc - 1)**2) + (16*ja*vc*(distance**2))))))
+
+def test_reads_block_files():
+    vdf = VolumeDelay(BLOCK_DIR)
+    assert vdf.lane_capacity[1:11].tolist() == [1850, 2050, 1450, 600, 1450, 0, 900, 2150, 2100, 1500]
+    assert vdf.lane_capacity[60] == 1100
+    assert vdf.critical_speed[1] == 18.835 and vdf.critical_speed[12] == 25.898
+    assert not numpy.isnan(vdf.critical_speed[1:61]).any()
+    assert vdf.truck_pce == 2.0
+
+def test_matches_block_formulas(network):
+    vdf  = VolumeDelay(BLOCK_DIR)
+    ctim = vdf.congested_time(network)
+    expected = numpy.array([[reference_congested_time(vdf, network, link, p_idx)
+                             for p_idx in range(len(LoadedNetwork.TIMEPERIODS))] for link in range(network.num_links)])
+    # every curve is exercised
+    assert set(network.ft.tolist()) >= set([1,2,3,4,5,6,7,8])
+    numpy.testing.assert_allclose(ctim, expected, rtol=1e-12)
+
+def test_overrides(network):
+    vdf = VolumeDelay(BLOCK_DIR)
+    (ctim, vht) = vdf.evaluate(network)
+    numpy.testing.assert_allclose(vht, network.volumes*ctim[:,:,numpy.newaxis]/60.0)
+
+    # doubling lanes is the same as doubling lane capacity, or halving volumes (other than fixed-time links)
+    lane_capacity = vdf.lane_capacity[VolumeDelay.capacity_class(network)]
+    more_lanes    = vdf.congested_time(network, lanes=network.lanes*2)
+    numpy.testing.assert_allclose(more_lanes, vdf.congested_time(network, lane_capacity=lane_capacity*2))
+    numpy.testing.assert_allclose(more_lanes, vdf.congested_time(network, volumes=network.volumes*0.5))
+    assert (more_lanes[network.ft != 6] <= ctim[network.ft != 6]).all()
@@ -0,0 +1,108 @@
+import json, os
+import numpy, pandas
+import pytest
+
+import columnStore
+
+def write_csv(csv_file, table_df, mtime):
+    """
+    Writes table_df to csv_file with the given modification time, so staleness doesn't depend on clock resolution.
+    """
+    table_df.to_csv(csv_file, index=False)
+    os.utime(csv_file, (mtime, mtime))
+
+def data_dirs(store_dir):
+    return [name for name in os.listdir(store_dir) if name.startswith(columnStore.DATA_PREFIX)]
+
+@pytest.fixture
+def table_csv(tmp_path):
+    csv_file = str(tmp_path / "table.csv")
+    write_csv(csv_file, pandas.DataFrame({'a':[1,2,3], 'b':[0.5,1.5,2.5], 'name':['x','yy','z']}), 1000000000)
+    return csv_file
+
+def test_reads_same_as_csv(table_csv):
+    table_df = columnStore.read_csv_columns(table_csv, ['name','a'])
+    pandas.testing.assert_frame_equal(table_df, pandas.read_csv(table_csv)[['name','a']], check_dtype=False)
+    assert columnStore.csv_columns(table_csv) == ['a','b','name']
+
+    store_dir = columnStore.column_store_dir(table_csv)
+    assert sorted(os.listdir(store_dir)) == sorted(data_dirs(store_dir) + [columnStore.MANIFEST_FILE])
+    assert len(data_dirs(store_dir)) == 1
+    assert columnStore.column_store_is_current(table_csv)
+
+def test_rebuilds_when_csv_changes(table_csv):
+    store_dir = columnStore.update_column_store(table_csv)
+    old_data  = data_dirs(store_dir)
+
+    # same size, different contents: only the mtime tells them apart
+    write_csv(table_csv, pandas.DataFrame({'a':[7,8,9], 'b':[0.5,1.5,2.5], 'name':['x','yy','z']}), 1000000001)
+    assert not columnStore.column_store_is_current(table_csv)
+    assert columnStore.read_csv_columns(table_csv, ['a'])['a'].tolist() == [7,8,9]
+    assert columnStore.column_store_is_current(table_csv)
+
+    # the superseded data is removed
+    assert len(data_dirs(store_dir)) == 1
+    assert data_dirs(store_dir) != old_data
+
+def test_stale_when_data_is_missing(table_csv):
+    store_dir = columnStore.update_column_store(table_csv)
+    os.rename(os.path.join(store_dir, data_dirs(store_dir)[0]), os.path.join(store_dir, "moved"))
+    assert not columnStore.column_store_is_current(table_csv)
+    assert columnStore.read_csv_columns(table_csv, ['a'])['a'].tolist() == [1,2,3]
+
+def test_stale_for_any_source(tmp_path):
+    source_files = [str(tmp_path / ("part%d.csv" % part)) for part in range(2)]
+    for source_file in source_files:
+        write_csv(source_file, pandas.DataFrame({'a':[1]}), 1000000000)
+    store_dir = str(tmp_path / "combined.cols")
+    columnStore.write_column_store(store_dir, pandas.DataFrame({'a':[1,1]}), source=source_files)
+    assert columnStore.column_store_is_current(source_files, store_dir)
+
+    os.utime(source_files[1], (1000000001, 1000000001))
+    assert not columnStore.column_store_is_current(source_files, store_dir)
+
+def test_reads_stores_without_data_dir(table_csv):
+    # stores written before data directories have their column files next to the manifest
+    store_dir = columnStore.column_store_dir(table_csv)
+    os.makedirs(store_dir)
+    numpy.save(os.path.join(store_dir, "col0000.npy"), numpy.array([4,5,6]))
+    with open(os.path.join(store_dir, columnStore.MANIFEST_FILE), "w") as manifest_fh:
+        json.dump({'columns':['a'], 'files':['col0000.npy'], 'num_rows':3,
+                   'source':columnStore.source_stats(table_csv)}, manifest_fh)
+
+    assert columnStore.column_store_is_current(table_csv)
+    assert columnStore.read_column_store(store_dir)['a'].tolist() == [4,5,6]
+
+    # rewriting it removes the old column files
+    columnStore.write_column_store(store_dir, pandas.read_csv(table_csv), source=table_csv)
+    assert not os.path.exists(os.path.join(store_dir, "col0000.npy"))
+    assert columnStore.read_column_store(store_dir)['a'].tolist() == [1,2,3]
+
+def failing_columns():
+    yield ('a', numpy.arange(3))
+    raise IOError("disk full")
+
+def test_failed_write_keeps_previous_store(table_csv):
+    store_dir = columnStore.update_column_store(table_csv)
+    before    = sorted(os.listdir(store_dir))
+
+    write_csv(table_csv, pandas.DataFrame({'a':[7,8,9]}), 1000000001)
+    with pytest.raises(IOError):
+        columnStore.write_columns(store_dir, failing_columns(), source=table_csv)
+
+    # no partial data is left behind, and readers still see the previous store
+    assert sorted(os.listdir(store_dir)) == before
+    assert columnStore.read_column_store(store_dir)['a'].tolist() == [1,2,3]
+    assert not columnStore.column_store_is_current(table_csv)
+
+def test_failed_write_after_another_writer(table_csv):
+    # another process wrote the current store first, so this one gives up quietly
+    store_dir = columnStore.update_column_store(table_csv)
+    before    = sorted(os.listdir(store_dir))
+    columnStore.write_columns(store_dir, failing_columns(), source=table_csv)
+    assert sorted(os.listdir(store_dir)) == before
+
+def test_no_store_without_cache(table_csv):
+    assert columnStore.read_csv_columns(table_csv, ['a'], use_cache=False)['a'].tolist() == [1,2,3]
+    assert columnStore.csv_columns(table_csv, use_cache=False) == ['a','b','name']
+    assert not os.path.exists(columnStore.column_store_dir(table_csv))
@@ -0,0 +1,90 @@
+import os, struct
+import numpy, pandas
+import pytest
+
+from conftest import METRICS_DIR, write_dbf
+import dbfTable
+
+KNOWN_DBF = os.path.join(METRICS_DIR, "..", "..", "geographies", "bayarea_rtaz1454_rev1_WGS84.dbf")
+requires_known_dbf = pytest.mark.skipif(not os.path.exists(KNOWN_DBF), reason="geographies dbf not available")
+
+def reference_read_dbf(dbf_file):
+    """
+    Reads dbf_file one record and field at a time, returning {field name: list of values}.
+    """
+    with open(dbf_file, "rb") as dbf_fh:
+        contents = dbf_fh.read()
+    (num_records, header_length, record_length) = struct.unpack("<IHH", contents[4:12])
+    fields = []
+    offset = 32
+    while contents[offset:offset+1] != b"\x0d":
+        descriptor = contents[offset:offset+32]
+        fields.append((descriptor[:11].split(b"\x00")[0].decode("ascii"), descriptor[11:12],
+                       descriptor[16], descriptor[17]))
+        offset += 32
+
+    table = dict([(name, []) for (name, field_type, length, decimals) in fields])
+    for record in range(num_records):
+        record_bytes = contents[header_length + record*record_length:header_length + (record+1)*record_length]
+        if record_bytes[0:1] == b"*": continue
+        position = 1
+        for (name, field_type, length, decimals) in fields:
+            value = record_bytes[position:position+length].decode("latin-1").strip()
+            position += length
+            if field_type == b"N":
+                value = float(value) if decimals > 0 else int(value)
+            table[name].append(value)
+    return table
+
+@requires_known_dbf
+def test_known_dbf():
+    table_df  = dbfTable.read_dbf(KNOWN_DBF)
+    reference = reference_read_dbf(KNOWN_DBF)
+
+    assert table_df.columns.tolist() == ['STFID','FIPSSTCO','TRACT2','TRACT','TRACTID','SUPERD','TAZ1454',
+                                         'AREALAND','AREAWATR','POP100','LANDACRE','WATRACRE','AREA','PERIMETER','ACRES']
+    assert len(table_df) == 1454
+    assert sorted(table_df['TAZ1454'].tolist()) == list(range(1, 1455))
+    assert table_df['TAZ1454'].dtype == numpy.int64 and table_df['ACRES'].dtype == numpy.float64
+    for column in table_df.columns:
+        assert table_df[column].tolist() == reference[column], column
+
+@requires_known_dbf
+def test_read_columns():
+    table_df = dbfTable.read_dbf(KNOWN_DBF, columns=['TAZ1454','STFID'])
+    assert table_df.columns.tolist() == ['STFID','TAZ1454']
+    with pytest.raises(KeyError):
+        dbfTable.read_dbf(KNOWN_DBF, columns=['TAZ1454','NOT_A_FIELD'])
+
+FIELDS  = [('NAME','C',10,0), ('MODE','N',3,0), ('VOL','N',10,2), ('FREQ','F',8,3), ('FLAG','L',1,0), ('DATE','D',8,0)]
+RECORDS = [['BART_RED', '131', '1234.50', '7.500', 'T', '20150704'],
+           ['DELETED',  '999', '1.00',    '1.000', 'F', '20150101'],
+           ['MUNI\xe9',  '20',  '',        '*******', 'n', ''],
+           ['', '0', '-3.25', '12.125', '?', 'bad']]
+
+def test_decodes_fields(tmp_path):
+    dbf_file = str(tmp_path / "links.dbf")
+    write_dbf(dbf_file, FIELDS, RECORDS, deleted=[1])
+    table_df = dbfTable.read_dbf(dbf_file)
+
+    assert table_df['NAME'].tolist() == ['BART_RED', 'MUNI\xe9', '']
+    assert table_df['MODE'].dtype == numpy.int64
+    assert table_df['MODE'].tolist() == [131, 20, 0]
+    # a blank numeric is missing, overflow (asterisks) too
+    numpy.testing.assert_array_equal(table_df['VOL'].values, [1234.5, numpy.nan, -3.25])
+    numpy.testing.assert_array_equal(table_df['FREQ'].values, [7.5, numpy.nan, 12.125])
+    assert table_df['FLAG'].tolist() == [True, False, None]
+    assert table_df['DATE'].iloc[0] == pandas.Timestamp(2015, 7, 4)
+    assert table_df['DATE'].iloc[1:].isnull().all()
+
+def test_header_overstates_records(tmp_path):
+    dbf_file = str(tmp_path / "truncated.dbf")
+    write_dbf(dbf_file, FIELDS, RECORDS[:1], num_records=3)
+    assert dbfTable.read_dbf(dbf_file)['NAME'].tolist() == ['BART_RED']
+
+def test_no_records(tmp_path):
+    dbf_file = str(tmp_path / "empty.dbf")
+    write_dbf(dbf_file, FIELDS, [])
+    table_df = dbfTable.read_dbf(dbf_file)
+    assert len(table_df) == 0
+    assert table_df.columns.tolist() == [name for (name, field_type, length, decimals) in FIELDS]
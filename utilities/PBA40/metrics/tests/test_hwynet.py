@@ -0,0 +1,136 @@
+import csv, os, subprocess, sys
+import numpy, pandas
+import pytest
+
+from conftest import METRICS_DIR
+import columnStore
+
+VCLASSES    = ['DA','S2','S3','SM','HV','DAT','S2T','S3T','SMT','HVT']
+VCLASSGROUP = {'DA':'auto', 'DAT':'auto', 'S2':'auto', 'S2T':'auto', 'S3':'auto', 'S3T':'auto',
+               'SM':'SM',   'SMT':'SM',   'HV':'HV',   'HVT':'HV'}
+PERIODS     = ['EA','AM','MD','PM','EV']
+
+def write_lookups(lookupdir, seed=1):
+    """
+    Writes random nonRecurringDelayLookup.csv, collisionLookup.csv and emissionsLookup.csv to lookupdir.
+    """
+    rng = numpy.random.RandomState(seed)
+    os.makedirs(lookupdir)
+    nrc_df = pandas.DataFrame({'vcratio':["%.2f" % (vcratio*0.01) for vcratio in range(101)]})
+    for lanes in [2,3,4]:
+        nrc_df['%dlanes' % lanes] = rng.uniform(0.0, 0.01, 101)
+    nrc_df.to_csv(os.path.join(lookupdir, "nonRecurringDelayLookup.csv"), index=False)
+
+    col_rows = [(at, ft, lanes) for at in [4,5] for ft in [1,2,3,4] for lanes in [1,2,3,4]]
+    col_df   = pandas.DataFrame(col_rows, columns=['at','ft','lanes'])
+    for collision_type in ['Motor Vehicle Fatality','Motor Vehicle Injury','Walk Fatality']:
+        col_df[collision_type] = rng.uniform(0.0, 2.0, len(col_df))
+    col_df.to_csv(os.path.join(lookupdir, "collisionLookup.csv"), index=False)
+
+    em_rows = [(period, group, speed) for period in PERIODS for group in ['auto','SM','HV'] for speed in range(66)]
+    em_df   = pandas.DataFrame(em_rows, columns=['period','vclassgroup','speed'])
+    for emission_type in ['ROG','CO2','Diesel_PM2.5']:
+        em_df[emission_type] = rng.uniform(0.0, 500.0, len(em_df))
+    em_df.to_csv(os.path.join(lookupdir, "emissionsLookup.csv"), index=False)
+
+def reference_vmt_vht_metrics(datafile, lookupdir):
+    """
+    The link tallies as the original hwynet.py did them, one link, period and vehicle class at a time
+    with dict lookups, returning the rows it wrote to vmt_vht_metrics.csv.
+    """
+    def read_lookup(filename):
+        with open(os.path.join(lookupdir, filename)) as infile:
+            rows = list(csv.reader(infile))
+        return (rows[0], dict([(rows[0][i], i) for i in range(len(rows[0]))]), rows[1:])
+
+    with open(datafile) as infile:
+        reader  = csv.reader(infile)
+        headers = next(reader)
+        headers = dict([(headers[i], i) for i in range(len(headers))])
+        data    = [row for row in reader]
+
+    (nrc_header_list, nrc_headers, nrc_rows) = read_lookup("nonRecurringDelayLookup.csv")
+    nrclookup = dict([(row[nrc_headers['vcratio']], row) for row in nrc_rows])
+    (col_header_list, col_headers, col_rows) = read_lookup("collisionLookup.csv")
+    collisionlookup = dict([((int(row[0]), int(row[1]), int(row[2])), row) for row in col_rows])
+    collision_types = col_header_list[3:]
+    (em_header_list, em_headers, em_rows) = read_lookup("emissionsLookup.csv")
+    emissionslookup = dict([((row[0], row[1], int(row[2])), row) for row in em_rows])
+    emission_types  = em_header_list[3:]
+
+    results = []
+    for period in PERIODS:
+        for vclass in VCLASSES:
+            (vmt, vht, hypfft, nrcdelay) = (0.0, 0.0, 0.0, 0.0)
+            collisions = [0.0]*len(collision_types)
+            emissions  = [0.0]*len(emission_types)
+            for row in data:
+                volume = float(row[headers['vol%s_%s' % (period, vclass.lower())]])
+                _vmt   = volume*float(row[headers['distance']])
+                vmt    += _vmt
+                vht    += volume*float(row[headers['ctim%s' % period]])/60.0
+                hypfft += volume*float(row[headers['fft']])/60.0
+
+                ft    = int(row[headers['ft']])
+                lanes = int(row[headers['lanes']])
+                if ft in [1,2,8]:
+                    vcratio = "%.2f" % min(1.0, float(row[headers['vc%s' % period]]))
+                    nrcdelay += _vmt*float(nrclookup[vcratio][nrc_headers['%dlanes' % min(max(lanes,2),4)]])
+                if ft != 6:
+                    key = (max(int(row[headers['at']]), 4), 2 if ft == 8 else min(ft, 4), min(lanes, 4))
+                    for idx in range(len(collision_types)):
+                        collisions[idx] += _vmt*float(collisionlookup[key][col_headers[collision_types[idx]]])/1000000.0
+                speed = min(int(float(row[headers['cspd%s' % period]])), 65)
+                for idx in range(len(emission_types)):
+                    emissions[idx] += _vmt*float(emissionslookup[(period, VCLASSGROUP[vclass], speed)][em_headers[emission_types[idx]]])/1000000.0
+            results.append([vmt, vht, hypfft, nrcdelay] + collisions + emissions)
+    return pandas.DataFrame(results, columns=['VMT','VHT','Hypothetical Freeflow Time','Non-Recurring Freeway Delay'] +
+                                             collision_types + emission_types)
+
+@pytest.fixture
+def run_dir(tmp_path, network_csv):
+    """
+    A run directory with the network csv, INPUT\\metrics lookups and an empty metrics dir.
+    """
+    write_lookups(str(tmp_path / "INPUT" / "metrics"))
+    (tmp_path / "metrics").mkdir()
+    return str(tmp_path)
+
+def run_hwynet(run_dir, *args):
+    subprocess.check_call([sys.executable, os.path.join(METRICS_DIR, "hwynet.py")] + list(args) +
+                          ["avgload5period_vehclasses.csv"], cwd=run_dir, stdout=subprocess.DEVNULL)
+    return pandas.read_csv(os.path.join(run_dir, "metrics", "vmt_vht_metrics.csv"))
+
+def test_matches_original_tallies(run_dir):
+    metrics_df   = run_hwynet(run_dir)
+    reference_df = reference_vmt_vht_metrics(os.path.join(run_dir, "avgload5period_vehclasses.csv"),
+                                             os.path.join(run_dir, "INPUT", "metrics"))
+
+    assert metrics_df['timeperiod'].tolist() == [period for period in PERIODS for vclass in VCLASSES]
+    assert metrics_df['vehicle class'].tolist() == VCLASSES*len(PERIODS)
+    assert metrics_df.columns.tolist()[2:] == reference_df.columns.tolist()
+    for column in reference_df.columns:
+        numpy.testing.assert_allclose(metrics_df[column].values, reference_df[column].values, rtol=1e-9, err_msg=column)
+
+def test_link_metrics_sum_to_totals(run_dir):
+    metrics_df = run_hwynet(run_dir, "--links")
+    links_df   = columnStore.read_column_store(os.path.join(run_dir, "metrics", "vmt_vht_metrics_links.cols"))
+
+    assert len(links_df) == 300
+    for metric in metrics_df.columns[2:]:
+        for period in PERIODS:
+            total = metrics_df.loc[metrics_df['timeperiod'] == period, metric].sum()
+            numpy.testing.assert_allclose(links_df['%s_%s' % (metric, period)].sum(), total, rtol=1e-9,
+                                          err_msg="%s_%s" % (metric, period))
+
+def test_interpolated_emissions_match_truncated_at_integer_speeds(run_dir):
+    network_file = os.path.join(run_dir, "avgload5period_vehclasses.csv")
+    links_df = pandas.read_csv(network_file)
+    for period in PERIODS:
+        links_df['cspd%s' % period] = links_df['cspd%s' % period].round(0)
+    links_df.to_csv(network_file, index=False)
+
+    truncated    = run_hwynet(run_dir)
+    interpolated = run_hwynet(run_dir, "--emissions_speed", "interpolate")
+    for emission_type in ['ROG','CO2','Diesel_PM2.5']:
+        numpy.testing.assert_allclose(interpolated[emission_type].values, truncated[emission_type].values, rtol=1e-9)
@@ -0,0 +1,105 @@
+import os
+import numpy, pandas
+import pytest
+
+from conftest import write_dbf
+import columnStore, transitAssignment
+
+FIELDS = [('A','N',7,0), ('B','N',7,0), ('TIME','N',7,0), ('MODE','N',4,0), ('FREQ','N',7,2), ('DIST','N',6,0),
+          ('NAME','C',13,0), ('SEQ','N',4,0), ('AB_VOL','N',12,2), ('AB_BRDA','N',10,2), ('AB_XITB','N',10,2)]
+# (A, B, MODE, NAME, SEQ): three lines and some support links, which have a blank NAME
+SEGMENTS = [(101, 102, 20, 'L00_20', 1), (102, 103, 20, 'L00_20', 2), (103, 104, 20, 'L00_20', 3),
+            (201, 102, 110, 'BART_R', 1), (102, 202, 110, 'BART_R', 2),
+            (102, 103, 30, 'L01_30', 1), (103, 301, 30, 'L01_30', 2),
+            (101, 1001, 1, '', 0), (1001, 101, 2, '', 0), (102, 201, 3, '', 0)]
+
+@pytest.fixture
+def trn_dir(tmp_path):
+    """
+    Writes random trnlink files for every timeperiod and access/submode/egress, each with a random subset of
+    SEGMENTS.  Returns (trn_dir, records) where records is a pandas.DataFrame of every record written.
+    """
+    rng     = numpy.random.RandomState(0)
+    trn_dir = str(tmp_path / "trn")
+    os.makedirs(trn_dir)
+
+    records = []
+    for (timeperiod, access, submode, egress, filename) in transitAssignment.assignment_files(trn_dir):
+        rows = []
+        for (seg_idx, (a, b, mode, name, seq)) in enumerate(SEGMENTS):
+            if rng.uniform() < 0.3: continue
+            # line attributes depend on the segment and timeperiod only
+            period_idx = transitAssignment.TIMEPERIODS.index(timeperiod)
+            (time, freq, dist) = (10*seg_idx + period_idx, 5.0 + period_idx, 100 + seg_idx)
+            (vol, brda, xitb)  = rng.randint(0, 100000, 3)/100.0
+            rows.append(["%d" % a, "%d" % b, "%d" % time, "%d" % mode, "%.2f" % freq, "%d" % dist, name, "%d" % seq,
+                         "%.2f" % vol, "%.2f" % brda, "%.2f" % xitb])
+            records.append({'MODE':mode, 'NAME':name, 'SEQ':seq, 'A':a, 'B':b, 'timeperiod':timeperiod,
+                            'access':access, 'egress':egress, 'DIST':dist, 'TIME':time, 'FREQ':freq,
+                            'AB_VOL':vol, 'AB_BRDA':brda, 'AB_XITB':xitb})
+        write_dbf(filename, FIELDS, rows)
+    return (trn_dir, pandas.DataFrame(records))
+
+def expected_cube(records):
+    """
+    The cube from the records written, summed with pandas.
+    """
+    records = records.copy()
+    for access in transitAssignment.ACCESS:
+        records['AB_BRDA_%s' % access] = numpy.where(records['access'] == access, records['AB_BRDA'], 0.0)
+    for egress in transitAssignment.EGRESS:
+        records['AB_XITB_%s' % egress] = numpy.where(records['egress'] == egress, records['AB_XITB'], 0.0)
+    cube_df = records.groupby(transitAssignment.CUBE_KEYS).agg(
+        dict([(column, 'first') for column in transitAssignment.CUBE_ATTRIBUTES] +
+             [(column, 'sum') for column in ['AB_VOL','AB_BRDA','AB_XITB','AB_BRDA_wlk','AB_BRDA_drv','AB_XITB_wlk','AB_XITB_drv']]))
+    return cube_df.reset_index()
+
+def sorted_cube(cube_df):
+    cube_df = cube_df.copy()
+    cube_df['timeperiod'] = cube_df['timeperiod'].astype(str)
+    return cube_df.sort_values(transitAssignment.CUBE_KEYS).reset_index(drop=True)
+
+def assert_cube_equal(cube_df, expected_df):
+    (cube_df, expected_df) = (sorted_cube(cube_df), sorted_cube(expected_df[cube_df.columns]))
+    for column in cube_df.columns:
+        if column in ['NAME','timeperiod']:
+            assert cube_df[column].tolist() == expected_df[column].tolist(), column
+        else:
+            numpy.testing.assert_allclose(cube_df[column].values, expected_df[column].values, rtol=1e-9, err_msg=column)
+
+def test_read_transit_assignment(trn_dir):
+    (trn_dir, records) = trn_dir
+    trnlinks_df = transitAssignment.read_transit_assignment(trn_dir, columns=['A','B','AB_VOL'])
+    assert len(trnlinks_df) == len(records)
+    assert trnlinks_df['timeperiod'].astype(str).tolist() == records['timeperiod'].tolist()
+    assert trnlinks_df['access'].astype(str).tolist() == records['access'].tolist()
+    numpy.testing.assert_allclose(trnlinks_df['AB_VOL'].values, records['AB_VOL'].values)
+
+    pool_df = transitAssignment.read_transit_assignment(trn_dir, columns=['A','B','AB_VOL'], processes=2)
+    pandas.testing.assert_frame_equal(pool_df, trnlinks_df)
+
+def test_cube_matches_sums(trn_dir):
+    (trn_dir, records) = trn_dir
+    cube_df = transitAssignment.read_transit_cube(trn_dir, use_cache=False)
+    assert cube_df.columns.tolist()[:len(transitAssignment.CUBE_KEYS)] == transitAssignment.CUBE_KEYS
+    assert_cube_equal(cube_df, expected_cube(records))
+    assert not os.path.exists(os.path.join(trn_dir, transitAssignment.CUBE_DIR))
+
+    # volumes add up to the files' totals
+    numpy.testing.assert_allclose(cube_df['AB_BRDA_wlk'].sum() + cube_df['AB_BRDA_drv'].sum(), records['AB_BRDA'].sum())
+
+def test_cached_cube(trn_dir):
+    (trn_dir, records) = trn_dir
+    cube_df   = transitAssignment.read_transit_cube(trn_dir)
+    store_dir = os.path.join(trn_dir, transitAssignment.CUBE_DIR)
+    trnlink_files = [file_info[4] for file_info in transitAssignment.assignment_files(trn_dir)]
+    assert columnStore.column_store_is_current(trnlink_files, store_dir)
+
+    cached_df = transitAssignment.read_transit_cube(trn_dir, columns=['MODE','timeperiod','AB_VOL'])
+    pandas.testing.assert_frame_equal(cached_df, cube_df[['MODE','timeperiod','AB_VOL']])
+
+    # changing any trnlink file rebuilds it
+    os.utime(trnlink_files[-1], (1000000000, 1000000000))
+    assert not columnStore.column_store_is_current(trnlink_files, store_dir)
+    transitAssignment.read_transit_cube(trn_dir)
+    assert columnStore.column_store_is_current(trnlink_files, store_dir)
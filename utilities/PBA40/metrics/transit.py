@@ -1,75 +1,41 @@
-import csv, optparse, os
-from xlrd import *
+import optparse, os
+from TransitRidership import TransitRidership
 
 USAGE = """
- python transit.py quickboards.xls
+ python transit.py [--processes N] [trn_dir]
 
- Opens the given quickboards workbook and tallies Daily Boardings and Daily Passenger Miles for each
- mode type (local, express, ferry, lrt, heavy rail, commuter rail).  Mode type is interpretted based
- on the line name numeric prefix.
+ Tallies Daily Boardings, Daily Passenger Miles and Hours Traveled, Daily Vehicle Runs and Miles, and the Peak Load
+ for each transit line and each mode type (local, express, ferry/lrt, heavy rail, commuter rail) directly from
+ the transit assignment, trn_dir\\trnlink[timeperiod]_[acc]_[mode]_[egr].dbf (trn_dir defaults to trn).
+ Mode type is based on the line-haul mode number.
 
- Outputs result into metrics\transit_boards_miles.csv
+ If the transit link cube (trn_dir\\trnlink_cube.cols) needs to be built, the trnlink files are read
+ with the given number of processes (default 1).
 
- """
-
-parser = optparse.OptionParser()
-(options,args) = parser.parse_args()
-
-datafile 	= args[0]
-outputfile 	= os.path.join("metrics","transit_boards_miles.csv")
-
-print('summarizing transit boardings and passenger miles')
+ Outputs result into metrics\\transit_boards_miles.csv (by mode type)
+                 and metrics\\transit_line_ridership.csv (by line)
 
-# read data, prepare to write
-wkbk = open_workbook(datafile,encoding_override="cp1252")
-sheet = wkbk.sheet_by_index(0)
-
-boardings = {}
-passmiles = {}
-
-rownum = 3
-while True:
-	try:
-		line = sheet.cell_value(rownum,0)
-	except IndexError:
-		#done
-		break
-
-	# done
-	if line == '':
-		break
+ """
 
-	split_idx = line.find('_')
-	mode = int(line[0:split_idx])
-	if mode < 80:
-		mode_str = 'loc'
-	elif mode < 100:
-		mode_str = 'exp'
-	elif mode < 110:
-		mode_str = 'lrf'
-	elif mode < 120:
-		mode_str = 'lrf'
-	elif mode < 130:
-		mode_str = 'hvy'
-	else:
-		mode_str = 'com'
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage=USAGE)
+    parser.add_option('--processes', dest='processes', type='int', default=1,
+                      help="Number of processes to read the trnlink files with")
+    (options,args) = parser.parse_args()
 
-	if mode_str not in boardings: boardings[mode_str] = 0.0
-	if mode_str not in passmiles: passmiles[mode_str] = 0.0
+    trn_dir 	= args[0] if len(args) > 0 else "trn"
+    outputfile 	= os.path.join("metrics","transit_boards_miles.csv")
+    linefile 	= os.path.join("metrics","transit_line_ridership.csv")
 
-	daily_boards = sheet.cell_value(rownum,1)
-	if daily_boards != '': boardings[mode_str] += daily_boards
+    print('summarizing transit boardings and passenger miles')
 
-	daily_pmt = sheet.cell_value(rownum,15)
-	if daily_pmt != '':	passmiles[mode_str] += daily_pmt
-	
-	rownum+=1
+    ridership = TransitRidership.read(trn_dir, processes=options.processes)
+    lines_df  = ridership.line_summary()
+    modes_df  = ridership.mode_summary(lines_df)
 
-print boardings
+    print(modes_df[['Transit mode','Daily Boardings']].to_string(index=False))
 
-outfile = open(outputfile, 'w')
-writer = csv.writer(outfile,lineterminator='\n')
-writer.writerow(['Transit mode','Daily Boardings','Daily Passenger Miles Traveled'])
-for mode_str in ['loc','exp','lrf','hvy','com']:
-	writer.writerow([mode_str,boardings[mode_str],passmiles[mode_str]])
-outfile.close()
\ No newline at end of file
+    lines_df.to_csv(linefile, index=False)
+    print('Wrote %s' % linefile)
+    modes_df.to_csv(outputfile, index=False)
+    print('Wrote %s' % outputfile)
@@ -0,0 +1,157 @@
+import multiprocessing, os
+import numpy, pandas
+import columnStore, dbfTable
+
+USAGE = """
+
+  Not run directly.  Reads the transit assignment link files for all timeperiods and
+  access/line-haul submode/egress combinations,
+  trn\\trnlink[timeperiod]_[access]_[submode]_[egress].dbf, into a single pandas.DataFrame.
+
+  The files can be read concurrently in a process pool (processes > 1) and are concatenated once.  Each row is tagged
+  with its timeperiod, access, submode and egress as pandas categoricals.
+
+  Most summaries don't need the access/egress detail, so read_transit_cube() returns the links summed
+  across the access/submode/egress files: one row per line segment (MODE, NAME, SEQ, A, B) and timeperiod.
+  It's built once per run and cached as a column store, trn\\trnlink_cube.cols, which is rebuilt if any
+  of the trnlink files change.
+
+  e.g.
+    import transitAssignment
+    trnlinks_df = transitAssignment.read_transit_assignment("trn", columns=['A','B','AB_VOL','MODE'])
+    cube_df     = transitAssignment.read_transit_cube("trn", columns=['MODE','NAME','timeperiod','AB_VOL'])
+
+"""
+
+TIMEPERIODS = ['ea','am','md','pm','ev']
+ACCESS      = ['wlk','drv']
+SUBMODES    = ['com','hvy','exp','lrf','loc']
+EGRESS      = ['wlk','drv']
+TAG_COLUMNS = [('timeperiod',TIMEPERIODS), ('access',ACCESS), ('submode',SUBMODES), ('egress',EGRESS)]
+# number of hours in each timeperiod
+TIMEPERIOD_HOURS = {'ea':3.0, 'am':4.0, 'md':5.0, 'pm':4.0, 'ev':8.0}
+
+# the transit link cube: line segment and timeperiod keys, line attributes, and volumes summed across files
+CUBE_DIR         = "trnlink_cube.cols"
+CUBE_KEYS        = ['MODE','NAME','SEQ','A','B','timeperiod']
+CUBE_ATTRIBUTES  = ['DIST','TIME','FREQ']
+CUBE_VOLUMES     = ['AB_VOL','AB_BRDA','AB_XITB']
+
+def assignment_files(trn_dir, timeperiods=TIMEPERIODS, submodes=SUBMODES):
+    """
+    Returns a list of (timeperiod, access, submode, egress, filename) for the transit assignment link files.
+    There are no drive-to-drive trips, so those combinations are skipped.
+    """
+    files = []
+    for timeperiod in timeperiods:
+        for access in ACCESS:
+            for submode in submodes:
+                for egress in EGRESS:
+                    if access == 'drv' and egress == 'drv': continue
+                    files.append((timeperiod, access, submode, egress,
+                                  os.path.join(trn_dir, "trnlink%s_%s_%s_%s.dbf" % (timeperiod, access, submode, egress))))
+    return files
+
+def read_assignment_file(args):
+    """
+    Reads one transit assignment link file; args is (filename, columns).  For the process pool.
+    """
+    (filename, columns) = args
+    return dbfTable.read_dbf(filename, columns=columns)
+
+def read_transit_assignment(trn_dir, columns=None, timeperiods=TIMEPERIODS, submodes=SUBMODES, processes=1):
+    """
+    Returns the transit assignment links for all the given timeperiods and submodes as one pandas.DataFrame,
+    with the given dbf columns (default: all) plus categorical columns timeperiod, access, submode and egress.
+
+    Parameters
+    ----------
+    trn_dir : string
+        The directory with the trnlink dbf files.
+    columns : list of string
+        Optional dbf columns to read.
+    processes : int
+        Number of processes to read with; defaults to 1, which reads in this process.  With more, the files are
+        read in a process pool, so the calling script must only run from an if __name__ == '__main__' block.
+    """
+    files = assignment_files(trn_dir, timeperiods, submodes)
+    processes = min(processes, len(files))
+
+    file_args = [(file_info[4], columns) for file_info in files]
+    if processes > 1:
+        pool      = multiprocessing.Pool(processes)
+        try:
+            table_dfs = pool.map(read_assignment_file, file_args)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        table_dfs = [read_assignment_file(file_arg) for file_arg in file_args]
+
+    trnlinks_df = pandas.concat(table_dfs, axis=0, ignore_index=True)
+
+    # tag each row with its file's timeperiod, access, submode, egress
+    file_rows = [len(table_df) for table_df in table_dfs]
+    for (tag_idx, (tag_column, categories)) in enumerate(TAG_COLUMNS):
+        codes = numpy.repeat([categories.index(file_info[tag_idx]) for file_info in files], file_rows)
+        trnlinks_df[tag_column] = pandas.Categorical.from_codes(codes, categories=categories)
+
+    print("Read %d transit assignment links from %d files" % (len(trnlinks_df), len(files)))
+    return trnlinks_df
+
+def build_transit_cube(trnlinks_df):
+    """
+    Sums the given transit assignment links (from read_transit_assignment()) across the access/submode/egress
+    files, returning one row per CUBE_KEYS with:
+    * DIST, TIME, FREQ : the line segment attributes, which are the same in every file
+    * AB_VOL           : the passenger volume
+    * AB_BRDA          : boardings at A, and AB_BRDA_[access] by access mode (wlk, drv)
+    * AB_XITB          : alightings at B, and AB_XITB_[egress] by egress mode (wlk, drv)
+    Support links (walk, drive, transfer) have a blank NAME and are summed by A, B.
+    """
+    cube_df = trnlinks_df[CUBE_KEYS + CUBE_ATTRIBUTES + CUBE_VOLUMES].copy()
+    # group by the timeperiod code, not every category
+    cube_df['timeperiod'] = trnlinks_df['timeperiod'].cat.codes
+    for access in ACCESS:
+        cube_df['AB_BRDA_%s' % access] = numpy.where(trnlinks_df['access'] == access, trnlinks_df['AB_BRDA'], 0.0)
+    for egress in EGRESS:
+        cube_df['AB_XITB_%s' % egress] = numpy.where(trnlinks_df['egress'] == egress, trnlinks_df['AB_XITB'], 0.0)
+
+    volume_columns = [column for column in cube_df.columns if column not in CUBE_KEYS + CUBE_ATTRIBUTES]
+    aggregations   = dict([(column, 'first') for column in CUBE_ATTRIBUTES] + [(column, 'sum') for column in volume_columns])
+    cube_df = cube_df.groupby(CUBE_KEYS).agg(aggregations).reset_index()
+    cube_df = cube_df[CUBE_KEYS + CUBE_ATTRIBUTES + volume_columns]
+    cube_df['timeperiod'] = pandas.Categorical.from_codes(cube_df['timeperiod'].values, categories=TIMEPERIODS)
+    return cube_df
+
+def read_transit_cube(trn_dir, columns=None, use_cache=True, processes=1):
+    """
+    Returns the transit link cube (see build_transit_cube()) for all timeperiods and submodes, with the given
+    columns (default: all).  With use_cache, reads it from trn_dir\\trnlink_cube.cols, building it from the
+    trnlink files (with the given number of processes, see read_transit_assignment()) if it's missing or if
+    they've changed since.
+    """
+    source_files = [file_info[4] for file_info in assignment_files(trn_dir)]
+    store_dir    = os.path.join(trn_dir, CUBE_DIR)
+
+    if use_cache and columnStore.column_store_is_current(source_files, store_dir):
+        try:
+            cube_df = columnStore.read_column_store(store_dir, columns)
+            if 'timeperiod' in cube_df.columns:
+                cube_df['timeperiod'] = pandas.Categorical(cube_df['timeperiod'].values, categories=TIMEPERIODS)
+            print("Read transit link cube %s" % store_dir)
+            return cube_df
+        except (IOError, OSError, ValueError) as e:
+            # e.g. the cube was replaced by another process as we read it; rebuild it
+            print("Could not read transit link cube %s: %s" % (store_dir, str(e)))
+
+    cube_df = build_transit_cube(read_transit_assignment(trn_dir, processes=processes))
+    if use_cache:
+        try:
+            columnStore.write_column_store(store_dir, cube_df, source=source_files)
+            print("Wrote transit link cube %s" % store_dir)
+        except (IOError, OSError) as e:
+            print("Could not write transit link cube %s: %s" % (store_dir, str(e)))
+    if columns is not None: cube_df = cube_df[columns]
+    return cube_df